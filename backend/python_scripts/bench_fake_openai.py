@@ -0,0 +1,222 @@
+# bench_fake_openai.py - Deterministic stand-in for the OpenAI embeddings / chat API
+#
+# Used by bench_ingest.py so ingest can be measured without API cost. Serves
+#   POST /v1/embeddings        unit vectors seeded by sha1(input), honouring
+#                              `dimensions` and `encoding_format` (the SDK asks for base64)
+#   POST /v1/chat/completions  a short extractive "summary" of the last message
+# with a fixed latency plus a per-token cost, and optional 429 injection. Whether
+# a request is rejected depends only on its body (and whether it was already
+# rejected once), never on thread timing, so runs are repeatable.
+#
+# Standalone:  python bench_fake_openai.py --port 8765 --latency-ms 150 --rate-429 0.05
+#              OPENAI_BASE_URL=http://127.0.0.1:8765/v1 ...
+import argparse
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DEFAULT_DIMENSIONS = 1536
+
+
+def fake_embedding(text: str, dims: int = DEFAULT_DIMENSIONS) -> np.ndarray:
+    """Unit vector that depends only on the text (identical texts get identical vectors)."""
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dims).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeOpenAIServer:
+    """
+    Threaded fake API server.
+
+    Args:
+        port: Port to bind on 127.0.0.1 (0 = pick a free one)
+        latency_ms: Fixed delay added to every request
+        latency_ms_per_1k_tokens: Extra delay per 1,000 input tokens
+        rate_429: Fraction of distinct request bodies rejected once with 429
+        retry_after_ms: retry-after-ms header sent with a 429
+    """
+
+    def __init__(self, *, port: int = 0, latency_ms: float = 0.0, latency_ms_per_1k_tokens: float = 0.0,
+                 rate_429: float = 0.0, retry_after_ms: int = 200):
+        self.latency_ms = latency_ms
+        self.latency_ms_per_1k_tokens = latency_ms_per_1k_tokens
+        self.rate_429 = rate_429
+        self.retry_after_ms = retry_after_ms
+        self._rejected: set[str] = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            "embedding_requests": 0,
+            "embedding_inputs": 0,
+            "embedding_tokens": 0,
+            "chat_requests": 0,
+            "chat_tokens": 0,
+            "rate_limited": 0,
+        }
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+    def _bump(self, **deltas: int) -> None:
+        with self._lock:
+            for k, v in deltas.items():
+                self.stats[k] += v
+
+    def _should_reject(self, body: bytes) -> bool:
+        """Reject a body at most once, for a stable rate_429 share of distinct bodies."""
+        if self.rate_429 <= 0:
+            return False
+        digest = hashlib.sha1(body).hexdigest()
+        if int(digest[:8], 16) / 0xFFFFFFFF >= self.rate_429:
+            return False
+        with self._lock:
+            if digest in self._rejected:
+                return False
+            self._rejected.add(digest)
+            self.stats["rate_limited"] += 1
+        return True
+
+    def _delay(self, tokens: int) -> None:
+        delay_ms = self.latency_ms + self.latency_ms_per_1k_tokens * tokens / 1000.0
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+    # ---------------- endpoints ----------------
+    def embeddings(self, req: dict) -> dict:
+        inputs = req.get("input")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dims = int(req.get("dimensions") or DEFAULT_DIMENSIONS)
+        as_base64 = req.get("encoding_format") == "base64"
+        tokens = sum(approx_tokens(t) for t in inputs)
+        self._delay(tokens)
+
+        data = []
+        for i, text in enumerate(inputs):
+            vec = fake_embedding(text, dims)
+            emb = base64.b64encode(vec.astype("<f4").tobytes()).decode() if as_base64 else vec.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": emb})
+        self._bump(embedding_requests=1, embedding_inputs=len(inputs), embedding_tokens=tokens)
+        return {
+            "object": "list",
+            "data": data,
+            "model": req.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def chat(self, req: dict) -> dict:
+        messages = req.get("messages") or []
+        prompt = " ".join(str(m.get("content") or "") for m in messages)
+        last = str(messages[-1].get("content") or "") if messages else ""
+        reply = "Summary: " + " ".join(last.split()[-60:])
+        prompt_tokens = approx_tokens(prompt)
+        completion_tokens = approx_tokens(reply)
+        self._delay(prompt_tokens + completion_tokens)
+        self._bump(chat_requests=1, chat_tokens=prompt_tokens + completion_tokens)
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):   # keep benchmark output clean
+                pass
+
+            def _send(self, status: int, payload: dict, headers: dict | None = None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                path = self.path.rstrip("/")
+                if not path.endswith(("/embeddings", "/chat/completions")):
+                    self._send(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+                    return
+                if server._should_reject(raw):
+                    self._send(429, {"error": {"message": "Rate limit reached (injected)", "type": "tokens",
+                                               "code": "rate_limit_exceeded"}},
+                               {"retry-after-ms": str(server.retry_after_ms)})
+                    return
+                req = json.loads(raw or b"{}")
+                if path.endswith("/embeddings"):
+                    self._send(200, server.embeddings(req))
+                else:
+                    self._send(200, server.chat(req))
+
+        return Handler
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Deterministic fake OpenAI API for benchmarks")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--latency-ms-per-1k-tokens", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--retry-after-ms", type=int, default=200)
+    args = ap.parse_args()
+
+    srv = FakeOpenAIServer(
+        port=args.port,
+        latency_ms=args.latency_ms,
+        latency_ms_per_1k_tokens=args.latency_ms_per_1k_tokens,
+        rate_429=args.rate_429,
+        retry_after_ms=args.retry_after_ms,
+    )
+    print(f"Fake OpenAI API on {srv.base_url}")
+    try:
+        srv._httpd.serve_forever()
+    except KeyboardInterrupt:
+        srv.stop()
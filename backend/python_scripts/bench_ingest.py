@@ -0,0 +1,590 @@
+# bench_ingest.py - Offline ingest benchmark (no OpenAI, Atlas or S3 access)
+#
+# Runs the real ingest code against local stand-ins:
+#   OpenAI  bench_fake_openai.FakeOpenAIServer (deterministic vectors, latency, 429s)
+#   Mongo   mongomock in-process, or a local mongod via --mongo-uri
+#   Redis   fakeredis in-process (TPM bucket, checkpoints, RQ queues)
+#   S3      moto in-process, or a local S3 (MinIO) via --s3-endpoint
+# and reports pages/s, chunks/s, embed batches, Python heap peak (tracemalloc),
+# process RSS peak and per-stage wall time for every document in a corpus.
+#
+# Results are comparable across commits when the corpus, fake-API settings and
+# --entry are the same; all three are recorded in the JSON output, with the
+# commit and the ingest-tuning config values, and --compare prints the deltas.
+#
+# --entry load    load_document_data: S3 download, checkpoint, chunk/embed/store,
+#                 finalize (summary jobs are enqueued; --run-jobs drains them)
+# --entry stream  stream_chunks_to_atlas / stream_docx_chunks_to_atlas on the local file
+#
+# Setup:  pip install -r requirements-bench.txt (tiktoken fetches its encodings once;
+#         point TIKTOKEN_CACHE_DIR at a warm cache on machines without network)
+# Usage:
+#   python bench_ingest.py --make-corpus bench_corpus
+#   python bench_ingest.py --corpus bench_corpus --latency-ms 150 --out base.json
+#   python bench_ingest.py --corpus bench_corpus --latency-ms 150 --compare base.json
+#   python bench_ingest.py --corpus bench_corpus --smoke    # exit 1 if a document stored no chunks
+#
+# Must run as a script: stand-ins are installed before config / load_data are imported.
+import argparse
+import functools
+import hashlib
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from bench_fake_openai import FakeOpenAIServer
+
+BENCH_BUCKET = "bench-ingest"
+BENCH_USER = "bench-user"
+BENCH_CLASS = "bench-class"
+
+# Config values that change ingest throughput; recorded with every result
+TUNING_KEYS = (
+    "INGEST_PARSER_WORKERS", "INGEST_PARSER_MIN_PAGES", "SEMANTIC_SPLITTER",
+    "INGEST_EMBED_CONCURRENCY", "INGEST_WRITE_CONCURRENCY", "INGEST_QUEUE_DEPTH",
+    "EMBED_SERVICE_CONCURRENCY", "EMBEDDING_PROVIDER", "EMBEDDING_MODEL", "EMBEDDING_DIMENSIONS",
+    "EMBED_BATCH_INITIAL_TOKENS", "EMBED_BATCH_MAX_TOKENS", "EMBED_BATCH_TARGET_LATENCY_S",
+    "EMBEDDING_ANN_DIMENSIONS", "EMBED_CACHE_BACKEND", "PARSE_CACHE_BACKEND", "DUP_CHUNK_REUSE_ENABLED",
+    "SECTION_SUMMARIES_ENABLED", "OPENAI_TPM_LIMIT",
+)
+
+# Totals compared by --compare: (key, higher_is_better)
+COMPARE_KEYS = (
+    ("wall_s", False),
+    ("pages_per_s", True),
+    ("chunks_per_s", True),
+    ("embed_batches", False),
+    ("embed_requests", False),
+    ("py_heap_peak_mb", False),
+    ("rss_peak_mb", False),
+)
+
+_WORDS = (
+    "cell membrane protein enzyme energy market demand supply equilibrium theorem proof "
+    "vector matrix integral derivative function variable history empire treaty revolution "
+    "network protocol packet layer algorithm complexity graph tree element reaction acid "
+    "base molecule bond orbital force mass velocity momentum wave frequency circuit current "
+    "voltage resistance policy government election court contract liability evidence theory "
+    "model data sample variance regression hypothesis experiment result analysis method"
+).split()
+
+
+# ──────────────────────────────────────────────────────────────
+# CORPUS
+# ──────────────────────────────────────────────────────────────
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(_sentence(rng) for _ in range(sentences))
+
+
+def _make_pdf(path: str, rng: random.Random, *, chapters: int, pages_per_chapter: int,
+              repeated_slide: str | None = None) -> None:
+    import pymupdf
+
+    doc = pymupdf.open()
+    toc = []
+    for ch in range(1, chapters + 1):
+        title = f"Chapter {ch}: {rng.choice(_WORDS).title()} and {rng.choice(_WORDS).title()}"
+        toc.append([1, title, len(doc) + 1])
+        for p in range(pages_per_chapter):
+            page = doc.new_page(width=612, height=792)
+            heading = title if p == 0 else f"{ch}.{p} {rng.choice(_WORDS).title()}"
+            page.insert_textbox(pymupdf.Rect(54, 54, 558, 90), heading, fontsize=16)
+            body = "\n\n".join(_paragraph(rng, rng.randint(3, 6)) for _ in range(rng.randint(2, 4)))
+            if repeated_slide and p % 5 == 0:
+                body = repeated_slide + "\n\n" + body
+            page.insert_textbox(pymupdf.Rect(54, 100, 558, 740), body, fontsize=10)
+    doc.set_toc(toc)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def _make_docx(path: str, rng: random.Random, *, sections: int, paragraphs_per_section: int) -> None:
+    from docx import Document
+
+    doc = Document()
+    doc.add_heading("Course Notes", level=0)
+    for s in range(1, sections + 1):
+        doc.add_heading(f"Unit {s}: {rng.choice(_WORDS).title()}", level=1)
+        for i in range(paragraphs_per_section):
+            if i % 8 == 0:
+                doc.add_heading(f"{s}.{i // 8 + 1} {rng.choice(_WORDS).title()}", level=2)
+            doc.add_paragraph(_paragraph(rng, rng.randint(2, 12)))
+        if s % 3 == 0:
+            table = doc.add_table(rows=4, cols=3)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = _sentence(rng)
+    doc.save(path)
+
+
+def make_corpus(directory: str, seed: int = 7) -> list[str]:
+    """Write a deterministic sample corpus (PDFs of several sizes and a DOCX)."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    slide = _paragraph(random.Random(seed + 1), 4)   # shared across PDFs (duplicate reuse)
+    files = {
+        "short.pdf": lambda p: _make_pdf(p, rng, chapters=1, pages_per_chapter=4),
+        "lecture_slides.pdf": lambda p: _make_pdf(p, rng, chapters=3, pages_per_chapter=10, repeated_slide=slide),
+        "textbook.pdf": lambda p: _make_pdf(p, rng, chapters=12, pages_per_chapter=15, repeated_slide=slide),
+        "course_notes.docx": lambda p: _make_docx(p, rng, sections=12, paragraphs_per_section=40),
+    }
+    paths = []
+    for name, build in files.items():
+        path = os.path.join(directory, name)
+        build(path)
+        paths.append(path)
+        print(f"wrote {path} ({os.path.getsize(path) / 1e6:.2f} MB)")
+    return paths
+
+
+def corpus_files(directory: str) -> list[str]:
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith((".pdf", ".docx")))
+    return [os.path.join(directory, n) for n in names]
+
+
+def corpus_digest(paths: list[str]) -> str:
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+# ──────────────────────────────────────────────────────────────
+# STAND-INS (installed before config / load_data are imported)
+# ──────────────────────────────────────────────────────────────
+def _require_local(uri: str, flag: str) -> None:
+    host = urlparse(uri).hostname or ""
+    if host not in ("localhost", "127.0.0.1", "::1"):
+        sys.exit(f"{flag} must point at localhost (the benchmark drops its databases): {uri}")
+
+
+def configure_env(args, openai_base_url: str, tmp_dir: str) -> None:
+    """Point every external dependency at a local stand-in; ingest tuning env vars pass through."""
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-bench-offline",
+        "OPENAI_BASE_URL": openai_base_url,
+        "OPENAI_API_BASE": openai_base_url,
+        "MONGO_CONNECTION_STRING": args.mongo_uri or "mongodb://localhost:27017",
+        "AWS_ACCESS_KEY": "bench",
+        "AWS_SECRET": "bench",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_REGION": "us-east-1",
+        "AWS_S3_BUCKET_NAME": BENCH_BUCKET,
+        "REDIS_URL": args.redis_url or "redis://localhost:6379/0",
+        "REDIS_TLS_URL": "",
+        "CLOUDMERSIVE_API_KEY": "",
+        "NODE_ENV": "development",
+        "LOG_LEVEL": args.log_level,
+        "INGEST_FANOUT_MIN_PAGES": "0",   # keep every document in this process
+        "INGEST_TMP_DIR": tmp_dir,
+    })
+    os.environ.setdefault("EMBED_CACHE_BACKEND", "off")
+    if os.environ["EMBED_CACHE_BACKEND"] == "disk":
+        os.environ["EMBED_CACHE_DIR"] = os.path.join(tmp_dir, "embed_cache")
+    # Repeated runs of the same corpus would otherwise measure parse-cache hits
+    os.environ.setdefault("PARSE_CACHE_BACKEND", "off")
+    if os.environ["PARSE_CACHE_BACKEND"] == "disk":
+        os.environ["PARSE_CACHE_DIR"] = os.path.join(tmp_dir, "parse_cache")
+    if args.s3_endpoint:
+        os.environ["AWS_ENDPOINT_URL"] = args.s3_endpoint
+
+
+def install_stand_ins(args):
+    """
+    Swap in mongomock / fakeredis / moto as configured.
+
+    Returns:
+        (redis_client, stop) where stop() tears the stand-ins down
+    """
+    stops = []
+    if not args.mongo_uri:
+        import mongomock
+        import pymongo
+
+        pymongo.MongoClient = mongomock.MongoClient
+
+    if args.redis_url:
+        import redis
+
+        redis_client = redis.Redis.from_url(args.redis_url)
+    else:
+        import fakeredis
+
+        redis_client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    import redis_setup
+
+    redis_setup.get_redis = lambda: redis_client
+
+    if not args.s3_endpoint:
+        from moto import mock_aws
+
+        mock = mock_aws()
+        mock.start()
+        stops.append(mock.stop)
+
+    def stop():
+        for fn in reversed(stops):
+            fn()
+    return redis_client, stop
+
+
+def reset_state(load_data, redis_client, s3_bucket_files: list[str]) -> None:
+    """Empty the stores and upload the corpus so every repeat does the same work."""
+    for db_name in (load_data.DB_NAME, load_data.MAIN_FILE_DB_NAME):
+        load_data.client.drop_database(db_name)
+    redis_client.flushdb()
+
+    s3 = load_data.s3_client
+    try:
+        s3.create_bucket(Bucket=BENCH_BUCKET)
+    except Exception as e:   # already exists on a persistent local S3
+        if "BucketAlreadyOwnedByYou" not in str(e) and "BucketAlreadyExists" not in str(e):
+            raise
+    for path in s3_bucket_files:
+        s3.upload_file(path, BENCH_BUCKET, f"bench/{os.path.basename(path)}")
+
+
+# ──────────────────────────────────────────────────────────────
+# MEASUREMENT
+# ──────────────────────────────────────────────────────────────
+class StageTimer:
+    """Wall time per stage, recorded by wrapping module-level functions."""
+
+    def __init__(self):
+        self.totals: dict[str, float] = defaultdict(float)
+
+    def wrap(self, module, name: str, stage: str) -> None:
+        fn = getattr(module, name)
+
+        @functools.wraps(fn)
+        def timed(*a, **kw):
+            t0 = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                self.totals[stage] += time.perf_counter() - t0
+        setattr(module, name, timed)
+
+    def take(self) -> dict[str, float]:
+        out = {k: round(v, 3) for k, v in self.totals.items()}
+        self.totals.clear()
+        return out
+
+
+class MetricsSink:
+    """Collects the `[METRICS] <tag> <json>` log lines ingest already emits."""
+
+    _pattern = re.compile(r"^\[METRICS\] (\w+) (\{.*\})$", re.S)
+
+    def __init__(self):
+        self.records: list[tuple[str, dict]] = []
+
+    def __call__(self, message):
+        m = self._pattern.match(message.record["message"])
+        if m:
+            try:
+                self.records.append((m.group(1), json.loads(m.group(2))))
+            except ValueError:
+                pass
+
+    def take(self) -> list[tuple[str, dict]]:
+        out, self.records = self.records, []
+        return out
+
+
+def _rss_peak_mb() -> float:
+    # ru_maxrss is KB on Linux; children covers the PDF parser processes
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, kids) / 1024, 1)
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, timeout=5, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "") if out.returncode == 0 else None
+    except Exception:
+        return None
+
+
+def run_document(load_data, path: str, *, entry: str, timer: StageTimer, sink: MetricsSink,
+                 server: FakeOpenAIServer, trace: bool) -> dict:
+    """Ingest one corpus file and return its measurements."""
+    from bson import ObjectId
+
+    name = os.path.basename(path)
+    ext = name.lower().rsplit(".", 1)[-1]
+    doc_id = str(ObjectId())
+    load_data.main_collection.insert_one({
+        "_id": ObjectId(doc_id), "fileName": name, "className": BENCH_CLASS, "isProcessing": True,
+    })
+
+    api_before = server.snapshot()
+    timer.take()
+    sink.take()
+    if trace:
+        tracemalloc.reset_peak()
+
+    t0 = time.perf_counter()
+    if entry == "load":
+        load_data.load_document_data(BENCH_USER, BENCH_CLASS, f"bench/{name}", doc_id)
+    elif ext == "pdf":
+        load_data.stream_chunks_to_atlas(path, user_id=BENCH_USER, class_id=BENCH_CLASS, doc_id=doc_id, file_name=name)
+    else:
+        with open(path, "rb") as f:
+            load_data.stream_docx_chunks_to_atlas(f, user_id=BENCH_USER, class_id=BENCH_CLASS, doc_id=doc_id,
+                                                  file_name=name)
+    wall = time.perf_counter() - t0
+
+    heap_peak = tracemalloc.get_traced_memory()[1] if trace else 0
+    api_after = server.snapshot()
+    ingest = {}
+    for tag, data in sink.take():
+        if tag in ("ingest", "docx_ingest"):
+            ingest = data
+    pages = ingest.get("pages_total", ingest.get("paragraphs_total", 0))
+    chunks = ingest.get("chunks_produced", 0)
+    return {
+        "file": name,
+        "format": ext,
+        "bytes": os.path.getsize(path),
+        "pages": pages,
+        "chunks": chunks,
+        "wall_s": round(wall, 3),
+        "pages_per_s": round(pages / wall, 2) if wall else 0.0,
+        "chunks_per_s": round(chunks / wall, 2) if wall else 0.0,
+        "embed_batches": ingest.get("embed_batches", 0),
+        "embed_requests": api_after["embedding_requests"] - api_before["embedding_requests"],
+        "embed_inputs": api_after["embedding_inputs"] - api_before["embedding_inputs"],
+        "rate_limited": api_after["rate_limited"] - api_before["rate_limited"],
+        "chunks_inserted": ingest.get("chunks_inserted", 0),
+        "dup_vectors_reused": ingest.get("dup_vectors_reused", 0),
+        "embed_latency_ms_total": ingest.get("embed_latency_ms_total", 0),
+        "insert_latency_ms_total": ingest.get("insert_latency_ms_total", 0),
+        "stages_s": timer.take(),
+        "py_heap_peak_mb": round(heap_peak / 1e6, 1),
+    }
+
+
+def drain_jobs(redis_client) -> float:
+    """Run every enqueued RQ job (section + document summaries) in this process."""
+    from rq import Queue, SimpleWorker
+
+    queues = [Queue(name, connection=redis_client) for name in ("ingest", "summary")]
+    t0 = time.perf_counter()
+    SimpleWorker(queues, connection=redis_client).work(burst=True)
+    return round(time.perf_counter() - t0, 3)
+
+
+def summarise(docs: list[dict], *, jobs_s: float | None) -> dict:
+    wall = sum(d["wall_s"] for d in docs)
+    pages = sum(d["pages"] for d in docs)
+    chunks = sum(d["chunks"] for d in docs)
+    stages: dict[str, float] = defaultdict(float)
+    for d in docs:
+        for k, v in d["stages_s"].items():
+            stages[k] += v
+    totals = {
+        "documents": len(docs),
+        "pages": pages,
+        "chunks": chunks,
+        "wall_s": round(wall, 3),
+        "pages_per_s": round(pages / wall, 2) if wall else 0.0,
+        "chunks_per_s": round(chunks / wall, 2) if wall else 0.0,
+        "stages_s": {k: round(v, 3) for k, v in sorted(stages.items())},
+        "py_heap_peak_mb": max((d["py_heap_peak_mb"] for d in docs), default=0.0),
+        "rss_peak_mb": _rss_peak_mb(),
+    }
+    for key in ("embed_batches", "embed_requests", "embed_inputs", "rate_limited",
+                "chunks_inserted", "dup_vectors_reused"):
+        totals[key] = sum(d[key] for d in docs)
+    if jobs_s is not None:
+        totals["background_jobs_s"] = jobs_s
+    return totals
+
+
+# ──────────────────────────────────────────────────────────────
+# REPORTING
+# ──────────────────────────────────────────────────────────────
+def print_report(result: dict) -> None:
+    cols = ("file", "pages", "chunks", "wall_s", "pages_per_s", "chunks_per_s", "embed_batches",
+            "rate_limited", "py_heap_peak_mb")
+    print()
+    print(" ".join(f"{c:>14}" for c in cols))
+    for d in result["documents"]:
+        print(" ".join(f"{str(d[c])[:14]:>14}" for c in cols))
+    t = result["totals"]
+    print(" ".join(f"{str(t.get(c, 'TOTAL' if c == 'file' else ''))[:14]:>14}" for c in cols))
+    print(f"\nstages (s): {t['stages_s']}")
+    print(f"rss peak: {t['rss_peak_mb']} MB   embed requests: {t['embed_requests']}"
+          + (f"   background jobs: {t['background_jobs_s']} s" if "background_jobs_s" in t else ""))
+
+
+def print_comparison(result: dict, baseline: dict) -> None:
+    for key in ("corpus_digest", "entry", "fake_api"):
+        if baseline.get(key) != result.get(key):
+            print(f"WARNING: {key} differs from baseline; results are not directly comparable")
+    print(f"\n{'metric':>18} {'baseline':>12} {'current':>12} {'change':>9}")
+    print(f"{'commit':>18} {str(baseline.get('commit')):>12} {str(result.get('commit')):>12}")
+    for key, higher_better in COMPARE_KEYS:
+        old, new = baseline["totals"].get(key), result["totals"].get(key)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+            continue
+        pct = 100.0 * (new - old) / old if old else 0.0
+        better = (pct > 0) == higher_better
+        mark = "" if abs(pct) < 2 else (" better" if better else " worse")
+        print(f"{key:>18} {old:>12} {new:>12} {pct:>+8.1f}%{mark}")
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Offline ingest benchmark")
+    ap.add_argument("--make-corpus", metavar="DIR", help="Write the sample corpus to DIR and exit")
+    ap.add_argument("--corpus", metavar="DIR", help="Directory of .pdf / .docx files to ingest")
+    ap.add_argument("--entry", choices=("load", "stream"), default="load")
+    ap.add_argument("--repeat", type=int, default=1, help="Run the corpus N times; report the median run")
+    ap.add_argument("--run-jobs", action="store_true", help="Also run the enqueued summary jobs (timed separately)")
+    ap.add_argument("--latency-ms", type=float, default=100.0, help="Fake API latency per request")
+    ap.add_argument("--latency-ms-per-1k-tokens", type=float, default=5.0)
+    ap.add_argument("--rate-429", type=float, default=0.0, help="Share of requests rejected once with 429")
+    ap.add_argument("--retry-after-ms", type=int, default=200)
+    ap.add_argument("--mongo-uri", help="Local mongod instead of mongomock")
+    ap.add_argument("--redis-url", help="Local Redis instead of fakeredis (the db is flushed)")
+    ap.add_argument("--s3-endpoint", help="Local S3 (e.g. MinIO) instead of moto")
+    ap.add_argument("--no-tracemalloc", action="store_true", help="Skip Python heap tracing (less overhead)")
+    ap.add_argument("--log-level", default="WARNING")
+    ap.add_argument("--out", help="Write the result JSON here")
+    ap.add_argument("--compare", metavar="JSON", help="Baseline result to compare against")
+    ap.add_argument("--smoke", action="store_true",
+                    help="Exit 1 unless every document inserted chunks (a failed ingest is not a result)")
+    args = ap.parse_args()
+
+    if args.make_corpus:
+        make_corpus(args.make_corpus)
+        return
+    if not args.corpus:
+        ap.error("--corpus (or --make-corpus) is required")
+    if args.mongo_uri:
+        _require_local(args.mongo_uri, "--mongo-uri")
+    if args.redis_url:
+        _require_local(args.redis_url, "--redis-url")
+    files = corpus_files(args.corpus)
+    if not files:
+        ap.error(f"no .pdf / .docx files in {args.corpus}")
+
+    server = FakeOpenAIServer(
+        latency_ms=args.latency_ms,
+        latency_ms_per_1k_tokens=args.latency_ms_per_1k_tokens,
+        rate_429=args.rate_429,
+        retry_after_ms=args.retry_after_ms,
+    ).start()
+    tmp_dir = tempfile.mkdtemp(prefix="bench_ingest_")
+    configure_env(args, server.base_url, tmp_dir)
+    redis_client, stop_stand_ins = install_stand_ins(args)
+
+    import config
+    import load_data
+    from logger_setup import log
+
+    sink = MetricsSink()
+    log.add(sink, level="INFO", filter=lambda r: r["message"].startswith("[METRICS]"))
+    timer = StageTimer()
+    for name, stage in (
+        ("download_to_tempfile", "download"),
+        ("file_sha256", "fingerprint"),
+        ("convert_docx_to_pdf_pooled", "docx_convert"),
+        ("stream_chunks_to_atlas", "chunk_embed_store"),
+        ("stream_docx_chunks_to_atlas", "chunk_embed_store"),
+        ("retry_incomplete_pages", "retry"),
+        ("finalize_document_ingest", "finalize"),
+    ):
+        timer.wrap(load_data, name, stage)
+
+    trace = not args.no_tracemalloc
+    if trace:
+        tracemalloc.start()
+
+    runs = []
+    try:
+        for i in range(args.repeat):
+            reset_state(load_data, redis_client, files)
+            docs = [
+                run_document(load_data, path, entry=args.entry, timer=timer, sink=sink, server=server, trace=trace)
+                for path in files
+            ]
+            jobs_s = drain_jobs(redis_client) if args.run_jobs else None
+            runs.append({"documents": docs, "totals": summarise(docs, jobs_s=jobs_s)})
+            print(f"run {i + 1}/{args.repeat}: {runs[-1]['totals']['wall_s']} s")
+    finally:
+        stop_stand_ins()
+        server.stop()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    walls = [r["totals"]["wall_s"] for r in runs]
+    median = statistics.median_low(walls)
+    chosen = runs[walls.index(median)]
+    result = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "entry": args.entry,
+        "corpus_digest": corpus_digest(files),
+        "fake_api": {
+            "latency_ms": args.latency_ms,
+            "latency_ms_per_1k_tokens": args.latency_ms_per_1k_tokens,
+            "rate_429": args.rate_429,
+            "retry_after_ms": args.retry_after_ms,
+        },
+        "stores": {
+            "mongo": "mongod" if args.mongo_uri else "mongomock",
+            "redis": "redis" if args.redis_url else "fakeredis",
+            "s3": "endpoint" if args.s3_endpoint else "moto",
+        },
+        "config": {k: getattr(config, k, None) for k in TUNING_KEYS},
+        "repeats": args.repeat,
+        "run_wall_s": walls,
+        **chosen,
+    }
+    print_report(result)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(result, json.load(f))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nwrote {args.out}")
+    if args.smoke:
+        empty = [d["file"] for d in result["documents"] if d["chunks_inserted"] <= 0]
+        if empty:
+            sys.exit(f"smoke: no chunks inserted for {', '.join(empty)}")
+        print(f"\nsmoke: ok ({result['totals']['chunks_inserted']} chunks inserted)")
+
+
+if __name__ == "__main__":
+    main()
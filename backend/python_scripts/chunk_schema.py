@@ -0,0 +1,250 @@
+# chunk_schema.py - Compact on-disk format for chunk documents in study_materials2
+#
+# A chunk used to carry its embedding as a BSON array of 1536 doubles (~14 KB of
+# 8-byte doubles plus per-element type/key bytes) and its text twice: `text` with
+# the contextual header prepended and `original_text` without it. The compact
+# schema stores:
+#
+#   embedding     BinData subtype 9 (BSON vector), dtype float32  -> 6 KB
+#   text          chunk text only (what original_text used to hold)
+#   ctx_header    True when the contextual header was embedded with the text;
+#                 the header is rebuilt on read from file_name / source_type /
+#                 page_number / section_headers, which every chunk already stores
+#
+# Readers go through chunk_text() / unpack_vector(), which also understand the
+# legacy layout, so migrate_chunk_schema.py can run while the app is live.
+#
+# With config.EMBEDDING_ANN_DIMENSIONS > 0 (two-stage retrieval) chunks also carry
+#
+#   embedding_ann  first N dims of the embedding, re-normalised (float32 vector);
+#                  text-embedding-3 models are Matryoshka-trained, so this equals
+#                  requesting dimensions=N from the API, without a second call
+#   embedding_i8   the full embedding quantised to int8 (int8 vector), used to
+#                  rescore ANN candidates at (near) full precision
+#
+# embedding_model / embedding_dims name the model that produced the vectors
+# (config.EMBEDDING_MODEL, any provider). Chunks written before these fields
+# existed were embedded with LEGACY_EMBEDDING_MODEL. Vectors are only reused or
+# searched within one model, so a collection holding several models stays safe.
+#
+# raw_hash is content_hash() of the chunk text before the contextual header, so
+# the same slide inside several PDFs of a class has the same raw_hash; ingest
+# copies the stored vectors of such a chunk (dup_of = its _id) instead of
+# embedding it again, and retrieval collapses results that share a raw_hash.
+import hashlib
+
+import numpy as np
+from bson.binary import Binary
+
+import config
+
+# BSON binary subtype 9 ("vector"): 1-byte dtype, 1-byte padding, packed values
+VECTOR_SUBTYPE = 9
+_FLOAT32_DTYPE = b"\x27"
+_FLOAT32_HEADER = _FLOAT32_DTYPE + b"\x00"
+_INT8_DTYPE = b"\x03"
+_INT8_HEADER = _INT8_DTYPE + b"\x00"
+
+FULL_PATH = "embedding"
+ANN_PATH = "embedding_ann"
+INT8_PATH = "embedding_i8"
+
+# Model of chunks stored without an embedding_model field
+LEGACY_EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Every stored embedding field (copied as a unit when a duplicate chunk is reused)
+VECTOR_FIELDS = (FULL_PATH, ANN_PATH, INT8_PATH, "ann_dims", "embedding_model", "embedding_dims")
+
+# find() projection for reading a chunk without any of its vectors
+WITHOUT_VECTORS = {FULL_PATH: 0, ANN_PATH: 0, INT8_PATH: 0}
+
+# Fields chunk_text() needs; add to any $project whose results are shown to the LLM.
+# original_text only exists on legacy chunks (and marks them as such).
+HEADER_FIELDS = ("file_name", "source_type", "page_number", "section_headers", "ctx_header", "original_text")
+
+
+# ──────────────────────────────────────────────────────────────
+# CONTEXTUAL CHUNK HEADERS (P0 - RAG Architecture v1.1)
+# ──────────────────────────────────────────────────────────────
+def create_contextual_header(
+    doc_title: str,
+    section_headers: list[str] | None = None,
+    doc_type: str | None = None,
+    page_number: int | None = None
+) -> str:
+    """
+    Create a contextual header to prepend to chunks.
+    This improves retrieval by embedding document context with content.
+
+    Args:
+        doc_title: The document filename or title
+        section_headers: List of section headers from markdown parsing
+        doc_type: File type (pdf, docx)
+        page_number: Page or paragraph number
+
+    Returns:
+        Formatted header string to prepend to chunk text
+    """
+    parts = [f"Document: {doc_title}"]
+
+    if doc_type:
+        parts.append(f"Type: {doc_type.upper()}")
+
+    if page_number is not None:
+        parts.append(f"Page: {page_number}")
+
+    if section_headers:
+        # Include up to 2 levels of section hierarchy
+        hierarchy = " > ".join(section_headers[-2:])
+        parts.append(f"Section: {hierarchy}")
+
+    return " | ".join(parts) + "\n\n"
+
+
+def header_for(doc: dict) -> str:
+    """Contextual header for a stored chunk, rebuilt from its metadata fields."""
+    return create_contextual_header(
+        doc.get("file_name") or "Unknown",
+        doc.get("section_headers") or None,
+        doc.get("source_type"),
+        doc.get("page_number"),
+    )
+
+
+# ──────────────────────────────────────────────────────────────
+# READ HELPERS (compact and legacy layouts)
+# ──────────────────────────────────────────────────────────────
+def chunk_text(doc: dict, *, with_header: bool = True) -> str:
+    """
+    Text of a stored chunk.
+
+    Args:
+        doc: Chunk document (projected with HEADER_FIELDS when with_header is True)
+        with_header: Include the contextual header, as embedded (LLM context, re-embedding);
+            False returns the bare chunk text (display, summaries)
+    """
+    if "original_text" in doc:   # legacy layout: text already carries the header
+        return (doc.get("text") or "") if with_header else (doc.get("original_text") or doc.get("text") or "")
+    text = doc.get("text") or ""
+    if with_header and doc.get("ctx_header"):
+        return header_for(doc) + text
+    return text
+
+
+def content_hash(text: str) -> str:
+    """Whitespace- and case-insensitive SHA-1 of a chunk (chunk_hash / raw_hash)."""
+    norm = " ".join(text.split()).lower()
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()
+
+
+def pack_vector(vector) -> Binary:
+    """Encode an embedding as a BSON float32 vector (BinData subtype 9)."""
+    arr = np.asarray(vector, dtype="<f4")
+    return Binary(_FLOAT32_HEADER + arr.tobytes(), VECTOR_SUBTYPE)
+
+
+def pack_int8(vector) -> Binary:
+    """
+    Encode an embedding as a BSON int8 vector, scaled so its largest component is ±127.
+    The scale is not stored: the vector is only ever compared by cosine similarity.
+    """
+    arr = np.asarray(vector, dtype=np.float32)
+    peak = float(np.max(np.abs(arr))) or 1.0
+    q = np.clip(np.rint(arr * (127.0 / peak)), -127, 127).astype(np.int8)
+    return Binary(_INT8_HEADER + q.tobytes(), VECTOR_SUBTYPE)
+
+
+def unpack_vector(value) -> np.ndarray:
+    """
+    Decode a stored embedding (BSON float32 / int8 vector or legacy array of doubles).
+    int8 vectors come back as float32 in their quantised scale (direction only).
+    """
+    if isinstance(value, (bytes, Binary)):
+        raw = bytes(value)
+        if raw[:1] == _FLOAT32_DTYPE:
+            return np.frombuffer(raw, dtype="<f4", offset=2)
+        if raw[:1] == _INT8_DTYPE:
+            return np.frombuffer(raw, dtype=np.int8, offset=2).astype(np.float32)
+        raise ValueError(f"Unsupported BSON vector dtype 0x{raw[0]:02x}")
+    return np.asarray(value, dtype=np.float32)
+
+
+def ann_vector(vector, dims: int) -> np.ndarray:
+    """First *dims* components of an embedding, L2-normalised (Matryoshka shortening)."""
+    arr = np.asarray(vector, dtype=np.float32)[:dims]
+    norm = float(np.linalg.norm(arr)) or 1.0
+    return arr / norm
+
+
+def model_fields(dims: int | None = None) -> dict:
+    """embedding_model / embedding_dims of vectors from the active model."""
+    return {"embedding_model": config.EMBEDDING_MODEL, "embedding_dims": dims or config.EMBEDDING_DIMENSIONS}
+
+
+def stored_embedding_model(doc: dict) -> str:
+    """Model that embedded a stored chunk (legacy chunks carry no embedding_model)."""
+    return doc.get("embedding_model") or LEGACY_EMBEDDING_MODEL
+
+
+def vector_fields(vector) -> dict:
+    """Embedding fields to store on a new chunk under the configured profile."""
+    dims = config.EMBEDDING_ANN_DIMENSIONS
+    if dims <= 0:
+        return {FULL_PATH: pack_vector(vector), **model_fields(len(vector))}
+    fields = {
+        ANN_PATH: pack_vector(ann_vector(vector, dims)),
+        INT8_PATH: pack_int8(vector),
+        "ann_dims": dims,
+        **model_fields(len(vector)),
+    }
+    if config.EMBEDDING_KEEP_FULL:
+        fields[FULL_PATH] = pack_vector(vector)
+    return fields
+
+
+def reusable_vector_fields(doc: dict) -> dict | None:
+    """
+    Vector fields of a stored chunk, re-encoded for the current profile, or None
+    if it lacks a vector the profile needs (e.g. no embedding_ann of this width)
+    or was embedded by another model than the active one.
+    """
+    if stored_embedding_model(doc) != config.EMBEDDING_MODEL:
+        return None
+    dims = config.EMBEDDING_ANN_DIMENSIONS
+    full = doc.get(FULL_PATH)
+    if dims <= 0:
+        if full is None:
+            return None
+        return {FULL_PATH: pack_vector(full) if isinstance(full, list) else full, **model_fields(len(unpack_vector(full)))}
+    if doc.get("ann_dims") == dims and doc.get(ANN_PATH) is not None and doc.get(INT8_PATH) is not None:
+        fields = {f: doc[f] for f in (ANN_PATH, INT8_PATH, "ann_dims")}
+        fields.update(model_fields(doc.get("embedding_dims")))
+        if config.EMBEDDING_KEEP_FULL and full is not None:
+            fields[FULL_PATH] = pack_vector(full) if isinstance(full, list) else full
+        return fields
+    return vector_fields(unpack_vector(full)) if full is not None else None
+
+
+# Paths semantic_search may filter $vectorSearch on; every vector index declares them
+_INDEX_FILTER_PATHS = ("user_id", "class_id", "doc_id", "is_summary", "chapter_idx", "embedding_model")
+
+
+def vector_index_definition(dims: int) -> dict:
+    """
+    Atlas Vector Search definition for the full-vector index (create it as
+    config.VECTOR_INDEX). dims is the active model's width (EMBEDDING_DIMENSIONS),
+    so a local model gets an index of its own rather than the 1536-d default.
+    """
+    vector = {"type": "vector", "path": FULL_PATH, "numDimensions": dims, "similarity": "cosine"}
+    return {"fields": [vector, *({"type": "filter", "path": path} for path in _INDEX_FILTER_PATHS)]}
+
+
+def ann_index_definition(dims: int, quantization: str | None = "scalar") -> dict:
+    """
+    Atlas Vector Search definition for the ANN index (create it as config.VECTOR_INDEX_ANN).
+    Filter paths match the filters semantic_search passes to $vectorSearch.
+    """
+    vector = {"type": "vector", "path": ANN_PATH, "numDimensions": dims, "similarity": "dotProduct"}
+    if quantization:
+        vector["quantization"] = quantization
+    return {"fields": [vector, *({"type": "filter", "path": path} for path in _INDEX_FILTER_PATHS)]}
@@ -126,6 +126,39 @@ NODE_ENV: str = _get_optional_env("NODE_ENV", "development")
 # OpenAI Model Configuration
 OPENAI_CHAT_MODEL: str = _get_optional_env("OPENAI_CHAT_MODEL", "gpt-4o-mini")
 OPENAI_TPM_LIMIT: int = _get_int_env("OPENAI_TPM_LIMIT", 180000)
+# Share of OPENAI_TPM_LIMIT held back for chat/search; ingest may borrow it
+# once no interactive request has been seen for OPENAI_TPM_INTERACTIVE_IDLE_S
+OPENAI_TPM_INTERACTIVE_SHARE: float = _get_float_env("OPENAI_TPM_INTERACTIVE_SHARE", 0.3)
+OPENAI_TPM_INTERACTIVE_IDLE_S: float = _get_float_env("OPENAI_TPM_INTERACTIVE_IDLE_S", 10.0)
+# Embedding backend (embedding_service.py): "openai" (API, TPM-limited) or
+# "local" (sentence-transformers on CPU, local_embeddings.py; needs
+# requirements-local-embeddings.txt). EMBEDDING_MODEL / EMBEDDING_DIMENSIONS
+# name the active model for either backend and are stored on every chunk;
+# vectors of another model are never reused or searched. A local model needs its
+# own vector index (numDimensions = its width, `embedding_model` as a filter path;
+# `migrate_chunk_schema.py --print-index` prints it), named by VECTOR_INDEX, e.g.
+# EMBEDDING_PROVIDER=local EMBEDDING_MODEL=BAAI/bge-small-en-v1.5
+# EMBEDDING_DIMENSIONS=384 VECTOR_INDEX=PlotSemanticSearchBgeSmall.
+EMBEDDING_PROVIDER: str = _get_optional_env("EMBEDDING_PROVIDER", "openai").lower()
+EMBEDDING_MODEL: str = _get_optional_env("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIMENSIONS: int = _get_int_env("EMBEDDING_DIMENSIONS", 1536)
+VECTOR_INDEX: str = _get_optional_env("VECTOR_INDEX", "PlotSemanticSearch")
+# Local backend: inference threads, inputs per forward pass, and the
+# sentence-transformers backend ("torch", "onnx" or "openvino")
+LOCAL_EMBEDDING_THREADS: int = _get_int_env("LOCAL_EMBEDDING_THREADS", 2)
+LOCAL_EMBEDDING_BATCH_SIZE: int = _get_int_env("LOCAL_EMBEDDING_BATCH_SIZE", 32)
+LOCAL_EMBEDDING_BACKEND: str = _get_optional_env("LOCAL_EMBEDDING_BACKEND", "torch").lower()
+# Two-stage retrieval profile (chunk_schema.py). 0 = search the full-precision
+# `embedding` field directly. N > 0 = ANN over the first N (Matryoshka) dims in
+# `embedding_ann` via VECTOR_INDEX_ANN, over-fetching VECTOR_RESCORE_OVERFETCH x k
+# candidates, then rescore them against the full int8 `embedding_i8` vectors.
+# Backfill existing chunks with `migrate_chunk_schema.py --ann` before enabling.
+EMBEDDING_ANN_DIMENSIONS: int = _get_int_env("EMBEDDING_ANN_DIMENSIONS", 0)
+VECTOR_INDEX_ANN: str = _get_optional_env("VECTOR_INDEX_ANN", "PlotSemanticSearchAnn")
+VECTOR_RESCORE_OVERFETCH: int = _get_int_env("VECTOR_RESCORE_OVERFETCH", 4)
+# Keep writing the full float32 `embedding` alongside the compact fields, so the
+# profile can be switched off again; disable once the ANN index is serving
+EMBEDDING_KEEP_FULL: bool = _get_bool_env("EMBEDDING_KEEP_FULL", True)
 
 # RAG Configuration
 RAG_K: int = _get_int_env("RAG_K", 12)
@@ -211,17 +244,112 @@ CHILD_CHUNK_OVERLAP: int = _get_int_env("CHILD_CHUNK_OVERLAP", 60)
 # ────────────────────────────────────────────────────────────────
 SECTION_SUMMARIES_ENABLED: bool = _get_bool_env("SECTION_SUMMARIES_ENABLED", True)
 
-# Pages per section - larger = fewer summaries = faster ingestion
-# 25 pages per section means a 100-page doc gets 4 section summaries
-SECTION_SUMMARY_PAGES: int = _get_int_env("SECTION_SUMMARY_PAGES", 25)
+# Sections are sized by tokens, not pages: a section closes before it would
+# exceed MAX_TOKENS, and at a PDF outline entry / new top-level header once it
+# holds MIN_TOKENS. Larger = fewer summaries = faster ingestion.
+SECTION_SUMMARY_MAX_TOKENS: int = _get_int_env("SECTION_SUMMARY_MAX_TOKENS", 24000)
+SECTION_SUMMARY_MIN_TOKENS: int = _get_int_env("SECTION_SUMMARY_MIN_TOKENS", 6000)
 
-# Maximum concurrent section summary generations during ingestion
-# Higher = faster but more API load
-SECTION_SUMMARY_CONCURRENCY: int = _get_int_env("SECTION_SUMMARY_CONCURRENCY", 3)
+# Upper bound on concurrent section summary generations; the actual number
+# follows the batch headroom in the shared TPM bucket
+SECTION_SUMMARY_CONCURRENCY: int = _get_int_env("SECTION_SUMMARY_CONCURRENCY", 6)
 
 # Model for section summaries (use fast/cheap model)
 SECTION_SUMMARY_MODEL: str = _get_optional_env("SECTION_SUMMARY_MODEL", "gpt-4o-mini")
 
+# ────────────────────────────────────────────────────────────────
+# INGEST PIPELINE (Worker-side throughput tuning)
+# ────────────────────────────────────────────────────────────────
+# Number of processes used to extract page markdown from PDFs.
+# 0 = one per CPU core. 1 = extract in-process (no pool).
+INGEST_PARSER_WORKERS: int = _get_int_env("INGEST_PARSER_WORKERS", 0)
+
+# Documents with fewer pages than this are extracted in-process;
+# spinning up a process pool costs more than it saves for short files.
+INGEST_PARSER_MIN_PAGES: int = _get_int_env("INGEST_PARSER_MIN_PAGES", 16)
+
+# S3 downloads use parallel ranged GETs into a temp file (s3_download.py)
+S3_DOWNLOAD_PART_MB: int = _get_int_env("S3_DOWNLOAD_PART_MB", 8)
+S3_DOWNLOAD_CONCURRENCY: int = _get_int_env("S3_DOWNLOAD_CONCURRENCY", 8)
+INGEST_TMP_DIR: str = _get_optional_env("INGEST_TMP_DIR", "")   # "" = system temp dir
+
+# Splitter for markdown sections over 2,000 chars:
+# "lexical" = local cohesion scoring (no API calls), "embedding" = SemanticChunker
+SEMANTIC_SPLITTER: str = _get_optional_env("SEMANTIC_SPLITTER", "lexical").lower()
+
+# Concurrent embedding / insert_many workers per ingest (see ingest_pipeline.py)
+INGEST_EMBED_CONCURRENCY: int = _get_int_env("INGEST_EMBED_CONCURRENCY", 2)
+INGEST_WRITE_CONCURRENCY: int = _get_int_env("INGEST_WRITE_CONCURRENCY", 2)
+
+# Max batches buffered between pipeline stages (backpressure bound)
+INGEST_QUEUE_DEPTH: int = _get_int_env("INGEST_QUEUE_DEPTH", 4)
+
+# Max embedding requests in flight per worker process (embedding_service.py).
+# Shared by every ingest stage, so this is a process-wide cap.
+EMBED_SERVICE_CONCURRENCY: int = _get_int_env("EMBED_SERVICE_CONCURRENCY", 4)
+
+# Embedding requests are packed by token count (embed_batcher.py). The tokens per
+# request start at EMBED_BATCH_INITIAL_TOKENS and adapt between MIN and MAX:
+# growing while requests finish within EMBED_BATCH_TARGET_LATENCY_S, halving on 429s.
+# Keep MAX under the batch share of OPENAI_TPM_LIMIT; the API caps a request at
+# 300k tokens and 2,048 inputs, and one input at 8,191 tokens (longer ones are split).
+EMBED_BATCH_INITIAL_TOKENS: int = _get_int_env("EMBED_BATCH_INITIAL_TOKENS", 16000)
+EMBED_BATCH_MIN_TOKENS: int = _get_int_env("EMBED_BATCH_MIN_TOKENS", 2000)
+EMBED_BATCH_MAX_TOKENS: int = _get_int_env("EMBED_BATCH_MAX_TOKENS", 64000)
+EMBED_BATCH_TARGET_LATENCY_S: float = _get_float_env("EMBED_BATCH_TARGET_LATENCY_S", 3.0)
+EMBED_MAX_INPUTS_PER_REQUEST: int = _get_int_env("EMBED_MAX_INPUTS_PER_REQUEST", 2048)
+EMBED_MAX_INPUT_TOKENS: int = _get_int_env("EMBED_MAX_INPUT_TOKENS", 8191)
+
+# Re-ingesting a doc_id that already has chunks only embeds/inserts new
+# chunks, deletes removed ones and regenerates affected section summaries
+INCREMENTAL_REINGEST_ENABLED: bool = _get_bool_env("INCREMENTAL_REINGEST_ENABLED", True)
+
+# A chunk whose text (without contextual header) is already stored for another
+# document in the same class copies that chunk's vectors instead of being embedded
+DUP_CHUNK_REUSE_ENABLED: bool = _get_bool_env("DUP_CHUNK_REUSE_ENABLED", True)
+
+# PDFs with at least this many pages are split into page-range RQ jobs that
+# run on separate workers, with a fan-in job for summaries (0 = never split)
+INGEST_FANOUT_MIN_PAGES: int = _get_int_env("INGEST_FANOUT_MIN_PAGES", 200)
+INGEST_FANOUT_PAGES_PER_JOB: int = _get_int_env("INGEST_FANOUT_PAGES_PER_JOB", 100)
+
+# Warm LibreOffice pool for DOCX -> PDF (office_pool.py); requires `unoserver`
+# on the worker. 0 = disabled (Cloudmersive, then plain DOCX extraction)
+OFFICE_POOL_SIZE: int = _get_int_env("OFFICE_POOL_SIZE", 2)
+OFFICE_POOL_COMMAND: str = _get_optional_env("OFFICE_POOL_COMMAND", "unoserver")
+OFFICE_POOL_BASE_PORT: int = _get_int_env("OFFICE_POOL_BASE_PORT", 2003)   # XML-RPC ports base..base+N-1
+OFFICE_POOL_DIR: str = _get_optional_env("OFFICE_POOL_DIR", "/tmp/office_pool")
+OFFICE_POOL_STARTUP_TIMEOUT_S: int = _get_int_env("OFFICE_POOL_STARTUP_TIMEOUT_S", 30)
+OFFICE_POOL_CONVERT_TIMEOUT_S: int = _get_int_env("OFFICE_POOL_CONVERT_TIMEOUT_S", 60)
+# Bounded queue: conversions waiting for a free instance, and how long they wait
+OFFICE_POOL_MAX_WAITING: int = _get_int_env("OFFICE_POOL_MAX_WAITING", 8)
+OFFICE_POOL_QUEUE_TIMEOUT_S: int = _get_int_env("OFFICE_POOL_QUEUE_TIMEOUT_S", 120)
+# Restart an instance after this many conversions (LibreOffice leaks memory)
+OFFICE_POOL_MAX_CONVERSIONS: int = _get_int_env("OFFICE_POOL_MAX_CONVERSIONS", 200)
+
+# Per-stage ingest histograms (ingest_metrics.py), aggregated in Redis and served
+# at GET /metrics on the web service. Workers can also expose them on a
+# /metrics sidecar port and/or push them to a Prometheus Pushgateway.
+INGEST_METRICS_ENABLED: bool = _get_bool_env("INGEST_METRICS_ENABLED", True)
+INGEST_METRICS_PORT: int = _get_int_env("INGEST_METRICS_PORT", 0)   # 0 = no sidecar
+INGEST_METRICS_PUSHGATEWAY: str = _get_optional_env("INGEST_METRICS_PUSHGATEWAY", "")   # host:port
+INGEST_METRICS_PUSH_INTERVAL_S: int = _get_int_env("INGEST_METRICS_PUSH_INTERVAL_S", 15)
+
+# Content-addressed embedding cache (embedding_cache.py)
+# Backend: "disk" (SQLite per dyno), "redis" (shared), or "off"
+# ~6 KB per 1536-d entry, so 50k entries ≈ 300 MB
+EMBED_CACHE_BACKEND: str = _get_optional_env("EMBED_CACHE_BACKEND", "disk").lower()
+EMBED_CACHE_MAX_ENTRIES: int = _get_int_env("EMBED_CACHE_MAX_ENTRIES", 50000)
+EMBED_CACHE_DIR: str = _get_optional_env("EMBED_CACHE_DIR", "/tmp/embed_cache")
+
+# Content-addressed parse cache (parse_cache.py): per-page markdown and chunks
+# keyed by the SHA-256 of the uploaded file, so re-uploads skip extraction
+# Backend: "disk" (per dyno, LRU), "s3" (shared, uploads bucket), or "off"
+PARSE_CACHE_BACKEND: str = _get_optional_env("PARSE_CACHE_BACKEND", "disk").lower()
+PARSE_CACHE_DIR: str = _get_optional_env("PARSE_CACHE_DIR", "/tmp/parse_cache")
+PARSE_CACHE_MAX_MB: int = _get_int_env("PARSE_CACHE_MAX_MB", 500)
+PARSE_CACHE_S3_PREFIX: str = _get_optional_env("PARSE_CACHE_S3_PREFIX", "parse-cache/")
+
 
 # ────────────────────────────────────────────────────────────────
 # STARTUP VALIDATION
@@ -256,6 +384,11 @@ def validate_config():
             f"Common regions: {', '.join(valid_regions[:5])}"
         )
 
+    if EMBEDDING_PROVIDER not in ("openai", "local"):
+        errors.append(
+            f"EMBEDDING_PROVIDER '{EMBEDDING_PROVIDER}' is invalid. Valid values: openai, local"
+        )
+
     # Validate log level
     valid_log_levels = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
     if LOG_LEVEL not in valid_log_levels:
@@ -1,7 +1,10 @@
 # docx_processor.py - DOCX text extraction and conversion for document ingestion
 from io import BytesIO
-from typing import List, Tuple, Dict, Optional
+from typing import Any, List, Tuple, Dict, Optional
 from docx import Document
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 import subprocess
 import tempfile
 import os
@@ -11,36 +14,132 @@ import requests
 from logger_setup import log
 
 
-def extract_text_from_docx(file_stream: BytesIO) -> str:
+def _heading_level(para: Paragraph) -> Optional[int]:
+    """Outline level of a heading paragraph ("Title" = 0, "Heading N" = N), else None."""
+    try:
+        name = para.style.name if para.style is not None else ""
+    except Exception:
+        return None
+    if name == "Title":
+        return 0
+    if name.startswith("Heading "):
+        suffix = name[len("Heading "):]
+        if suffix.isdigit():
+            return int(suffix)
+    return None
+
+
+def extract_docx_content(file_stream: BytesIO) -> Dict[str, Any]:
     """
-    Extract all text content from a DOCX file.
+    Parse a DOCX once and return everything the ingest pipeline needs.
+
+    The body is walked in document order so each paragraph and table knows the
+    heading hierarchy it sits under. Numbering matches extract_docx_paragraphs:
+    non-empty paragraphs first, then table cells.
 
     Args:
         file_stream: BytesIO stream containing DOCX file data
 
     Returns:
-        Concatenated text from all paragraphs in the document
+        Dictionary with:
+            metadata: {'title', 'author'} as in extract_docx_metadata
+            paragraphs: List of (text, paragraph_number, section_headers), where
+                section_headers is the heading path (outermost first), [] before
+                the first heading
+            tables: List of tables, each a list of rows of stripped cell texts
+            stats: paragraph_count, table_count, character_count as in get_docx_stats
 
     Raises:
-        Exception: If document cannot be parsed or is corrupted
+        Exception: If document cannot be parsed
     """
     try:
         doc = Document(file_stream)
-        paragraphs = []
+        core_properties = doc.core_properties
+        metadata = {
+            "title": core_properties.title or "Unknown",
+            "author": core_properties.author or "Unknown"
+        }
 
-        for para in doc.paragraphs:
-            text = para.text.strip()
-            if text:
-                paragraphs.append(text)
+        body_paragraphs: List[Tuple[str, List[str]]] = []
+        table_cells: List[Tuple[str, List[str]]] = []
+        tables: List[List[List[str]]] = []
+        heading_stack: List[Tuple[int, str]] = []
+        char_count = 0
+
+        for child in doc.element.body.iterchildren():
+            if child.tag == qn("w:p"):
+                para = Paragraph(child, doc)
+                raw = para.text
+                char_count += len(raw)
+                text = raw.strip()
+                if not text:
+                    continue
+                level = _heading_level(para)
+                if level is not None:
+                    while heading_stack and heading_stack[-1][0] >= level:
+                        heading_stack.pop()
+                    heading_stack.append((level, text))
+                body_paragraphs.append((text, [h for _, h in heading_stack]))
+
+            elif child.tag == qn("w:tbl"):
+                headers = [h for _, h in heading_stack]
+                rows = []
+                for row in Table(child, doc).rows:
+                    cells = []
+                    for cell in row.cells:
+                        raw = cell.text
+                        char_count += len(raw)
+                        text = raw.strip()
+                        cells.append(text)
+                        if text:
+                            table_cells.append((text, headers))
+                    rows.append(cells)
+                tables.append(rows)
+
+        # Body paragraphs first, then table cells (each cell as a separate "paragraph")
+        paragraphs = [
+            (text, num, headers)
+            for num, (text, headers) in enumerate(body_paragraphs + table_cells, start=1)
+        ]
+
+        stats = {
+            "paragraph_count": len(body_paragraphs),
+            "table_count": len(tables),
+            "character_count": char_count
+        }
+
+        log.info(
+            f"Extracted DOCX content: title='{metadata['title']}', "
+            f"{len(paragraphs)} numbered paragraphs, {len(tables)} tables"
+        )
+        return {
+            "metadata": metadata,
+            "paragraphs": paragraphs,
+            "tables": tables,
+            "stats": stats,
+        }
+
+    except Exception as e:
+        log.error(f"Failed to extract DOCX content: {e}")
+        raise
 
-        # Extract text from tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    text = cell.text.strip()
-                    if text:
-                        paragraphs.append(text)
 
+def extract_text_from_docx(file_stream: BytesIO) -> str:
+    """
+    Extract all text content from a DOCX file.
+
+    Args:
+        file_stream: BytesIO stream containing DOCX file data
+
+    Returns:
+        Concatenated text from all paragraphs in the document
+
+    Raises:
+        Exception: If document cannot be parsed or is corrupted
+    """
+    try:
+        content = extract_docx_content(file_stream)
+        paragraphs = [text for text, _num, _headers in content["paragraphs"]]
         full_text = "\n\n".join(paragraphs)
         log.info(f"Extracted {len(paragraphs)} paragraphs/cells from DOCX")
         return full_text
@@ -100,28 +199,8 @@ def extract_docx_paragraphs(file_stream: BytesIO) -> List[Tuple[str, int]]:
         Exception: If document cannot be parsed
     """
     try:
-        doc = Document(file_stream)
-        paragraphs_with_numbers = []
-        paragraph_num = 1
-
-        # Extract regular paragraphs
-        for para in doc.paragraphs:
-            text = para.text.strip()
-            if text:
-                paragraphs_with_numbers.append((text, paragraph_num))
-                paragraph_num += 1
-
-        # Extract text from tables (each cell as a separate "paragraph")
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    text = cell.text.strip()
-                    if text:
-                        paragraphs_with_numbers.append((text, paragraph_num))
-                        paragraph_num += 1
-
-        log.info(f"Extracted {len(paragraphs_with_numbers)} numbered paragraphs from DOCX")
-        return paragraphs_with_numbers
+        content = extract_docx_content(file_stream)
+        return [(text, num) for text, num, _headers in content["paragraphs"]]
 
     except Exception as e:
         log.error(f"Failed to extract paragraphs from DOCX: {e}")
@@ -139,25 +218,7 @@ def get_docx_stats(file_stream: BytesIO) -> Dict[str, int]:
         Dictionary with paragraph_count, table_count, and character_count
     """
     try:
-        doc = Document(file_stream)
-
-        paragraph_count = len([p for p in doc.paragraphs if p.text.strip()])
-        table_count = len(doc.tables)
-
-        # Count total characters
-        char_count = sum(len(p.text) for p in doc.paragraphs)
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    char_count += len(cell.text)
-
-        stats = {
-            "paragraph_count": paragraph_count,
-            "table_count": table_count,
-            "character_count": char_count
-        }
-
-        return stats
+        return extract_docx_content(file_stream)["stats"]
 
     except Exception as e:
         log.error(f"Failed to get DOCX stats: {e}")
@@ -193,7 +254,7 @@ def convert_docx_to_pdf(docx_stream: BytesIO) -> BytesIO:
         # Write DOCX stream to temporary file
         with open(input_docx_path, 'wb') as f:
             docx_stream.seek(0)
-            f.write(docx_stream.read())
+            shutil.copyfileobj(docx_stream, f)
 
         log.info(f"[DOCX-PDF] Wrote DOCX to temp file: {input_docx_path}")
 
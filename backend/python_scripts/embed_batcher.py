@@ -0,0 +1,171 @@
+# embed_batcher.py - Token-packed embedding requests with an adaptive size target
+#
+# One embeddings request may carry up to 2,048 inputs and 300k tokens, and each
+# input is limited to 8,191 tokens. Slicing by a fixed input count (or flushing
+# the ingest pipeline on a character count) sent requests a small fraction of
+# that, so ingest paid per-request latency far more often than the TPM budget
+# required. Here requests are packed by exact token count instead:
+#
+#   split_oversize()   inputs over EMBED_MAX_INPUT_TOKENS become token windows;
+#                      merge_split() recombines their vectors (token-weighted mean)
+#   pack()             contiguous runs of inputs up to a token and input ceiling
+#   AdaptiveBatchSize  the token ceiling itself, tuned AIMD-style per process:
+#                      grows additively while requests come back under
+#                      EMBED_BATCH_TARGET_LATENCY_S, halves on a 429 or timeout
+#                      and shrinks by a quarter on a slow request
+#
+# The ingest pipeline flushes its pack stage at the same ceiling, so a packed
+# pipeline batch normally goes out as exactly one request.
+import math
+import threading
+
+import config
+from logger_setup import log
+from token_counter import count_tokens_batch, get_encoder
+
+
+# ──────────────────────────────────────────────────────────────
+# ADAPTIVE TOKEN CEILING
+# ──────────────────────────────────────────────────────────────
+class AdaptiveBatchSize:
+    """
+    Thread-safe AIMD controller for the tokens packed into one request.
+
+    Args:
+        initial: Starting ceiling (tokens)
+        minimum: Never shrink below this
+        maximum: Never grow above this (keep it under the batch share of the TPM bucket)
+        target_latency_s: Requests slower than this stop growth; 1.5x this shrinks
+    """
+
+    def __init__(self, *, initial: int, minimum: int, maximum: int, target_latency_s: float):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.target_latency_s = target_latency_s
+        self._step = max(1, self.maximum // 16)
+        self._current = min(max(initial, self.minimum), self.maximum)
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> int:
+        return self._current
+
+    def on_success(self, tokens: int, latency_s: float) -> None:
+        """Record a completed request of *tokens* that took *latency_s*."""
+        with self._lock:
+            before = self._current
+            if latency_s > self.target_latency_s * 1.5:
+                self._current = max(self.minimum, int(self._current * 0.75))
+            elif latency_s <= self.target_latency_s and tokens >= self._current // 2:
+                # Only near-full requests say anything about whether a larger one would be fast
+                self._current = min(self.maximum, self._current + self._step)
+            after = self._current
+        if after < before:
+            log.info("[EMBED-BATCH] %d-token request took %.1fs; ceiling %d -> %d", tokens, latency_s, before, after)
+
+    def on_throttled(self) -> None:
+        """Record a 429 or timeout: halve the ceiling."""
+        with self._lock:
+            before = self._current
+            self._current = max(self.minimum, self._current // 2)
+            after = self._current
+        log.info("[EMBED-BATCH] Throttled; ceiling %d -> %d", before, after)
+
+
+# ──────────────────────────────────────────────────────────────
+# PACKING
+# ──────────────────────────────────────────────────────────────
+def pack(counts: list[int], max_tokens: int, max_inputs: int) -> list[tuple[int, int]]:
+    """
+    Group inputs, in order, into requests of at most *max_tokens* and *max_inputs*.
+    An input larger than max_tokens on its own gets a request to itself.
+
+    Returns:
+        [(start, end)] slices covering range(len(counts))
+    """
+    slices = []
+    start = 0
+    tokens = 0
+    for i, n in enumerate(counts):
+        if i > start and (tokens + n > max_tokens or i - start >= max_inputs):
+            slices.append((start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(counts):
+        slices.append((start, len(counts)))
+    return slices
+
+
+def split_oversize(texts: list[str], model: str, max_input_tokens: int) -> tuple[list[str], list[int], list[int]]:
+    """
+    Count tokens and cut inputs longer than *max_input_tokens* into token windows.
+
+    Returns:
+        (pieces, piece token counts, owner index of each piece in *texts*)
+    """
+    counts = count_tokens_batch(texts, model=model)
+    if all(n <= max_input_tokens for n in counts):
+        return list(texts), counts, list(range(len(texts)))
+
+    enc = get_encoder(model)
+    pieces, piece_counts, owners = [], [], []
+    for i, (text, n) in enumerate(zip(texts, counts)):
+        if n <= max_input_tokens:
+            pieces.append(text)
+            piece_counts.append(n)
+            owners.append(i)
+            continue
+        toks = enc.encode_ordinary(text)
+        for s in range(0, len(toks), max_input_tokens):
+            window = toks[s:s + max_input_tokens]
+            pieces.append(enc.decode(window))
+            piece_counts.append(len(window))
+            owners.append(i)
+        log.info("[EMBED-BATCH] Input of %d tokens split into %d windows", n,
+                 math.ceil(n / max_input_tokens))
+    return pieces, piece_counts, owners
+
+
+def merge_split(vectors: list[list[float]], counts: list[int], owners: list[int], n: int) -> list[list[float]]:
+    """
+    One vector per original input: windows of a split input are averaged,
+    weighted by token count, and re-normalised to unit length.
+    """
+    if len(vectors) == n:
+        return vectors
+    merged: list[list[float] | None] = [None] * n
+    for vec, w, owner in zip(vectors, counts, owners):
+        w = max(w, 1)
+        acc = merged[owner]
+        if acc is None:
+            merged[owner] = [x * w for x in vec]
+        else:
+            for j, x in enumerate(vec):
+                acc[j] += x * w
+    out = []
+    for acc in merged:
+        norm = math.sqrt(sum(x * x for x in acc)) or 1.0
+        out.append([x / norm for x in acc])
+    return out
+
+
+# ──────────────────────────────────────────────────────────────
+# PROCESS-WIDE CONTROLLER
+# ──────────────────────────────────────────────────────────────
+_controller: AdaptiveBatchSize | None = None
+_controller_lock = threading.Lock()
+
+
+def get_batch_controller() -> AdaptiveBatchSize:
+    """The token ceiling shared by the embedding service and ingest pack stages."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdaptiveBatchSize(
+                    initial=config.EMBED_BATCH_INITIAL_TOKENS,
+                    minimum=config.EMBED_BATCH_MIN_TOKENS,
+                    maximum=config.EMBED_BATCH_MAX_TOKENS,
+                    target_latency_s=config.EMBED_BATCH_TARGET_LATENCY_S,
+                )
+    return _controller
@@ -0,0 +1,187 @@
+# embedding_cache.py - Content-addressed embedding cache for ingestion
+#
+# Vectors are keyed by (embedding model, dimensions, sha1(text)) so re-uploads of
+# the same material (common across semesters and sections) skip OpenAI entirely.
+# Two size-bounded LRU backends: Redis (shared by all workers) and a local SQLite
+# file (per dyno, no Redis memory cost).
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+import config
+from logger_setup import log
+
+
+def text_digest(text: str) -> str:
+    """SHA1 of the exact text that is embedded."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _pack(vec) -> bytes:
+    return np.asarray(vec, dtype=np.float32).tobytes()
+
+
+def _unpack(blob: bytes) -> list[float]:
+    return np.frombuffer(blob, dtype=np.float32).tolist()
+
+
+class EmbeddingCache(ABC):
+    """Interface: bulk get/put keyed by text, scoped to one model + dimension pair."""
+
+    def __init__(self, *, model: str, dimensions: int, max_entries: int):
+        self.model = model
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+
+    def key_for(self, text: str) -> str:
+        return f"{self.model}:{self.dimensions}:{text_digest(text)}"
+
+    @abstractmethod
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        """Return cached vectors aligned with *texts* (None for misses)."""
+
+    @abstractmethod
+    def put_many(self, texts: list[str], vectors: list[list[float]]) -> None:
+        """Store vectors for *texts* and evict least-recently-used entries over max_entries."""
+
+
+class RedisEmbeddingCache(EmbeddingCache):
+    """
+    Vectors as float32 blobs under emb:<model>:<dims>:<sha1>; a ZSET of
+    last-access times drives LRU eviction.
+    """
+
+    PREFIX = "emb:"
+
+    def __init__(self, redis_client, **kwargs):
+        super().__init__(**kwargs)
+        self._r = redis_client
+        self._lru_key = f"{self.PREFIX}lru:{self.model}:{self.dimensions}"
+
+    def get_many(self, texts):
+        if not texts:
+            return []
+        keys = [self.PREFIX + self.key_for(t) for t in texts]
+        blobs = self._r.mget(keys)
+        hits = {k: time.time() for k, b in zip(keys, blobs) if b is not None}
+        if hits:
+            self._r.zadd(self._lru_key, hits)
+        return [_unpack(b) if b is not None else None for b in blobs]
+
+    def put_many(self, texts, vectors):
+        if not texts:
+            return
+        now = time.time()
+        pipe = self._r.pipeline()
+        touched = {}
+        for t, v in zip(texts, vectors):
+            k = self.PREFIX + self.key_for(t)
+            pipe.set(k, _pack(v))
+            touched[k] = now
+        pipe.zadd(self._lru_key, touched)
+        pipe.zcard(self._lru_key)
+        size = pipe.execute()[-1]
+
+        excess = size - self.max_entries
+        if excess > 0:
+            evicted = [m for m, _ in self._r.zpopmin(self._lru_key, excess)]
+            if evicted:
+                self._r.delete(*evicted)
+
+
+class DiskEmbeddingCache(EmbeddingCache):
+    """SQLite file per worker dyno; LRU by last access time."""
+
+    def __init__(self, directory: str, **kwargs):
+        super().__init__(**kwargs)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "embeddings.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vec BLOB NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON embeddings(accessed)")
+        self._db.commit()
+
+    def get_many(self, texts):
+        if not texts:
+            return []
+        keys = [self.key_for(t) for t in texts]
+        found: dict[str, bytes] = {}
+        with self._lock:
+            # SQLite's default variable limit is 999 per statement
+            for i in range(0, len(keys), 900):
+                part = keys[i:i + 900]
+                marks = ",".join("?" * len(part))
+                for k, blob in self._db.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part):
+                    found[k] = blob
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET accessed=? WHERE key=?", [(now, k) for k in found])
+                self._db.commit()
+        return [_unpack(found[k]) if k in found else None for k in keys]
+
+    def put_many(self, texts, vectors):
+        if not texts:
+            return
+        now = time.time()
+        rows = [(self.key_for(t), _pack(v), now) for t, v in zip(texts, vectors)]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vec, accessed) VALUES (?, ?, ?)", rows)
+            (size,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            excess = size - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY accessed ASC LIMIT ?)",
+                    (excess,),
+                )
+            self._db.commit()
+
+
+# ──────────────────────────────────────────────────────────────
+# FACTORY
+# ──────────────────────────────────────────────────────────────
+_cache: EmbeddingCache | None = None
+_cache_init = False
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """
+    Return the configured cache (config.EMBED_CACHE_BACKEND), or None when
+    disabled or when the backend cannot be initialised.
+    """
+    global _cache, _cache_init
+    if _cache_init:
+        return _cache
+    with _cache_lock:
+        if _cache_init:
+            return _cache
+        backend = config.EMBED_CACHE_BACKEND
+        kwargs = {
+            "model": config.EMBEDDING_MODEL,
+            "dimensions": config.EMBEDDING_DIMENSIONS,
+            "max_entries": config.EMBED_CACHE_MAX_ENTRIES,
+        }
+        try:
+            if backend == "redis":
+                from redis_setup import get_redis
+                _cache = RedisEmbeddingCache(get_redis(), **kwargs)
+            elif backend == "disk":
+                _cache = DiskEmbeddingCache(config.EMBED_CACHE_DIR, **kwargs)
+            else:
+                _cache = None
+            log.info("[EMBED-CACHE] backend=%s max_entries=%d", backend if _cache else "off", kwargs["max_entries"])
+        except Exception as e:
+            log.warning("[EMBED-CACHE] Failed to initialise %s backend, caching disabled: %s", backend, e)
+            _cache = None
+        _cache_init = True
+    return _cache
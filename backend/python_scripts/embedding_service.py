@@ -0,0 +1,240 @@
+# embedding_service.py - Process-wide embedding provider for worker and web processes
+#
+# get_embedding_service() returns the backend selected by config.EMBEDDING_PROVIDER;
+# every caller (ingest pipeline, SemanticChunker, summary storage, query
+# embedding) goes through the EmbeddingProvider interface:
+#
+#   "openai"  OpenAIEmbeddingService: one event loop runs on a dedicated daemon
+#             thread and owns a single pooled AsyncOpenAI client. Any thread can
+#             call submit(texts) and get back a concurrent.futures.Future, so HTTP
+#             connection reuse and the in-flight request limit are shared by
+#             everything in the process. Requests are packed by token count under
+#             the adaptive ceiling from embed_batcher.py.
+#   "local"   LocalEmbeddingService (local_embeddings.py): a sentence-transformers
+#             model on CPU; no network and no TPM budget (remote = False).
+import asyncio
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+
+import httpx
+from langchain_core.embeddings import Embeddings
+from openai import AsyncOpenAI, RateLimitError, APIConnectionError, APITimeoutError
+
+import config
+from embed_batcher import get_batch_controller, merge_split, pack, split_oversize
+from logger_setup import log
+
+
+class EmbeddingProvider(ABC):
+    """
+    Interface of an embedding backend.
+
+    model / dimensions identify the vectors it returns (recorded on every chunk);
+    remote is True when requests are billed against the shared TPM bucket.
+    """
+
+    name = "base"
+    remote = True
+    model: str
+    dimensions: int
+
+    @abstractmethod
+    def submit(self, texts: list[str]) -> Future:
+        """Schedule embedding of *texts*; returns a Future resolving to vectors in input order."""
+
+    def embed(self, texts: list[str], timeout: float | None = None) -> list[list[float]]:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(texts).result(timeout)
+
+    def embed_with_usage(
+        self, texts: list[str], timeout: float | None = None, max_tokens: int | None = None
+    ) -> tuple[list[list[float]], int]:
+        """
+        Like embed(), but also returns the tokens billed (0 for local backends).
+        max_tokens, when given, is the per-request token ceiling to pack at.
+        """
+        return self.embed(texts, timeout), 0
+
+    def close(self) -> None:
+        """Release clients and threads."""
+
+
+class OpenAIEmbeddingService(EmbeddingProvider):
+    """
+    Long-lived OpenAI embedding client.
+
+    Args:
+        model: OpenAI embedding model name
+        max_concurrency: Max embedding requests in flight across the whole process
+        max_inputs: Max inputs per embeddings.create call (tokens per call follow
+            the adaptive ceiling of embed_batcher.get_batch_controller())
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        *,
+        model: str | None = None,
+        max_concurrency: int | None = None,
+        max_inputs: int | None = None,
+    ):
+        self.model = model or config.EMBEDDING_MODEL
+        self.dimensions = config.EMBEDDING_DIMENSIONS
+        # text-embedding-3 models can return shortened vectors; older models only their native width
+        self._create_kwargs = {"dimensions": self.dimensions} if self.model.startswith("text-embedding-3") else {}
+        self.max_inputs = max_inputs or config.EMBED_MAX_INPUTS_PER_REQUEST
+        self.batcher = get_batch_controller()
+        self._max_concurrency = max_concurrency or config.EMBED_SERVICE_CONCURRENCY
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="embedding-service", daemon=True)
+        self._thread.start()
+        # Client and semaphore are created on the loop they will be used from
+        asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+        log.info("[EMBED] Service started (model=%s, concurrency=%d)", self.model, self._max_concurrency)
+
+    async def _setup(self):
+        self._sem = asyncio.Semaphore(self._max_concurrency)
+        self._client = AsyncOpenAI(
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self._max_concurrency * 2,
+                    max_keepalive_connections=self._max_concurrency,
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            ),
+            # Retries happen in _embed so every 429 reaches the batch-size controller
+            max_retries=0,
+        )
+
+    # ---------------- public API ----------------
+    def submit(self, texts: list[str]) -> Future:
+        """Schedule embedding of *texts*; returns a Future resolving to vectors in input order."""
+        return self._schedule(list(texts), with_usage=False)
+
+    def embed_with_usage(
+        self, texts: list[str], timeout: float | None = None, max_tokens: int | None = None
+    ) -> tuple[list[list[float]], int]:
+        """
+        Like embed(), but also returns the tokens OpenAI billed (for rate-limit reconciliation).
+        max_tokens pins the request ceiling (the ingest pipeline passes the one its
+        batch was packed at); by default the adaptive ceiling's current value is used.
+        """
+        return self._schedule(list(texts), with_usage=True, max_tokens=max_tokens).result(timeout)
+
+    def _schedule(self, texts: list[str], with_usage: bool, max_tokens: int | None = None) -> Future:
+        # Token counting and window splitting are CPU work; keep them off the loop thread
+        pieces, counts, owners = split_oversize(texts, self.model, config.EMBED_MAX_INPUT_TOKENS)
+        return asyncio.run_coroutine_threadsafe(
+            self._embed(pieces, counts, owners, len(texts), with_usage, max_tokens), self._loop
+        )
+
+    def close(self):
+        """Close the HTTP pool and stop the loop thread."""
+        async def _close():
+            await self._client.close()
+        try:
+            asyncio.run_coroutine_threadsafe(_close(), self._loop).result(timeout=5)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    # ---------------- loop-side helpers ----------------
+    async def _embed(
+        self, texts: list[str], counts: list[int], owners: list[int], n: int, with_usage: bool,
+        max_tokens: int | None = None,
+    ):
+        results: list = [None] * len(texts)
+        used = 0
+
+        async def worker(start: int, end: int):
+            nonlocal used
+            slice_tokens = sum(counts[start:end])
+            async with self._sem:
+                retries = 2
+                while True:
+                    t0 = time.monotonic()
+                    try:
+                        resp = await self._client.embeddings.create(
+                            model=self.model, input=texts[start:end], **self._create_kwargs
+                        )
+                        break
+                    except (RateLimitError, APITimeoutError) as e:
+                        # Before APIConnectionError: a timeout is a subclass of it
+                        self.batcher.on_throttled()
+                        if retries == 0:
+                            raise e
+                        retries -= 1
+                        await asyncio.sleep(_retry_after_s(e))
+                    except APIConnectionError as e:
+                        if retries == 0:
+                            raise e
+                        retries -= 1
+                        await asyncio.sleep(1.5)
+            self.batcher.on_success(slice_tokens, time.monotonic() - t0)
+            used += resp.usage.total_tokens if resp.usage else 0
+            for i, d in enumerate(resp.data):
+                results[start + i] = d.embedding
+
+        await asyncio.gather(*(
+            worker(start, end)
+            for start, end in pack(counts, max_tokens or self.batcher.current, self.max_inputs)
+        ))
+        results = merge_split(results, counts, owners, n)
+        return (results, used) if with_usage else results
+
+
+def _retry_after_s(exc: Exception, default: float = 1.5) -> float:
+    """Delay the API asked for on a 429 (retry-after-ms / retry-after headers), else *default*."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return min(float(headers["retry-after-ms"]) / 1000.0, 60.0)
+        if headers.get("retry-after"):
+            return min(float(headers["retry-after"]), 60.0)
+    except ValueError:
+        pass
+    return default
+
+
+class ServiceEmbeddings(Embeddings):
+    """LangChain Embeddings adapter so SemanticChunker / vector-store helpers use the shared service."""
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return get_embedding_service().embed(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return get_embedding_service().embed([text])[0]
+
+
+# ──────────────────────────────────────────────────────────────
+# PROCESS SINGLETON
+# ──────────────────────────────────────────────────────────────
+_service: EmbeddingProvider | None = None
+_service_pid: int | None = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingProvider:
+    """
+    Return this process's embedding provider (config.EMBEDDING_PROVIDER), creating
+    it on first use. RQ forks a work-horse per job and threads do not survive
+    fork, so the singleton is keyed by pid.
+    """
+    global _service, _service_pid
+    pid = os.getpid()
+    if _service is not None and _service_pid == pid:
+        return _service
+    with _service_lock:
+        if _service is None or _service_pid != pid:
+            if config.EMBEDDING_PROVIDER == "local":
+                from local_embeddings import LocalEmbeddingService
+                _service = LocalEmbeddingService()
+            else:
+                _service = OpenAIEmbeddingService()
+            _service_pid = pid
+    return _service
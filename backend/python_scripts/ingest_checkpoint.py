@@ -0,0 +1,164 @@
+# ingest_checkpoint.py - Durable progress for long-running ingest jobs
+#
+# A textbook ingest can run for most of its 2-hour RQ timeout, and worker dynos
+# are cycled daily. The checkpoint records which pages are durable (every chunk
+# embedded and inserted) and which ingest stages have finished, so a retried job
+# skips straight past completed work. Chunks from
+# half-written pages are already in Mongo and are skipped by chunk_hash, and
+# their vectors come from the embedding cache, so no embedding is paid for twice.
+#
+# Redis layout (all keys expire after CHECKPOINT_TTL_S, refreshed on each write):
+#   ingest:ckpt:{doc_id}           hash  {fingerprint, stage, incremental, page_count, started_at}
+#   ingest:ckpt:{doc_id}:pages     set   durable page numbers (1-based)
+#   ingest:ckpt:{doc_id}:chunks    hash  chunk_hash -> page for chunks on durable pages
+#   ingest:ckpt:{doc_id}:prev      hash  chunk_hash -> page stored before this ingest began
+#
+# The same checkpoint is shared by the page-range sub-jobs of a fanned-out ingest.
+import hashlib
+import time
+
+from logger_setup import log
+
+CHECKPOINT_TTL_S = 7 * 24 * 3600   # matches the ingest job's failure_ttl
+
+# Stages in order; a checkpoint at stage X has completed X and everything before it
+STAGE_STARTED = "started"
+STAGE_FANNED_OUT = "fanned_out"
+STAGE_CHUNKS_DURABLE = "chunks_durable"
+STAGE_SUMMARY_ENQUEUED = "summary_enqueued"   # section + document summary jobs
+_STAGE_ORDER = [
+    STAGE_STARTED,
+    STAGE_FANNED_OUT,
+    STAGE_CHUNKS_DURABLE,
+    STAGE_SUMMARY_ENQUEUED,
+]
+_HSET_BATCH = 1000
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a local file, read in blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class IngestCheckpoint:
+    """
+    Progress record for one doc_id.
+
+    Args:
+        redis_client: Redis connection (see redis_setup.get_redis)
+        doc_id: Document being ingested
+        fingerprint: Content hash of the source file; a stored checkpoint for a
+            different file version is discarded
+        create: Start a new checkpoint if none exists (False for sub-jobs that
+            must only join an existing one)
+
+    Every write is best-effort: a Redis outage degrades to a non-resumable ingest,
+    never a failed one.
+    """
+
+    def __init__(self, redis_client, doc_id: str, fingerprint: str, *, create: bool = True):
+        self._r = redis_client
+        self.doc_id = doc_id
+        self.fingerprint = fingerprint
+        self.key = f"ingest:ckpt:{doc_id}"
+        self._pages_key = f"{self.key}:pages"
+        self._chunks_key = f"{self.key}:chunks"
+        self._prev_key = f"{self.key}:prev"
+        self._all_keys = (self.key, self._pages_key, self._chunks_key, self._prev_key)
+
+        state = self._safe(lambda: self._r.hgetall(self.key), {}) or {}
+        state = {_s(k): _s(v) for k, v in state.items()}
+        if state and state.get("fingerprint") != fingerprint:
+            log.info("[CHECKPOINT] Source changed for doc %s; discarding old checkpoint", doc_id)
+            self.clear()
+            state = {}
+
+        self.resumed = bool(state)
+        self.stage = state.get("stage", STAGE_STARTED)
+        self.incremental = state.get("incremental") == "1"
+        self.page_count = int(state.get("page_count") or 0)
+        if not self.resumed and create:
+            self._write(lambda p: p.hset(self.key, mapping={
+                "fingerprint": fingerprint,
+                "stage": STAGE_STARTED,
+                "started_at": int(time.time()),
+            }))
+
+    # ---------------- reads ----------------
+    def reached(self, stage: str) -> bool:
+        """True if *stage* (or a later one) was completed by an earlier attempt."""
+        return _STAGE_ORDER.index(self.stage) >= _STAGE_ORDER.index(stage)
+
+    def durable_pages(self) -> set[int]:
+        return {int(_s(p)) for p in self._safe(lambda: self._r.smembers(self._pages_key), set())}
+
+    def durable_chunks(self) -> dict[str, int | None]:
+        """chunk_hash -> page for every chunk on a durable page (across all attempts / sub-jobs)."""
+        return _decode_pages(self._safe(lambda: self._r.hgetall(self._chunks_key), {}))
+
+    def previous_chunks(self) -> dict[str, int | None]:
+        """chunk_hash -> page of the version stored before this ingest (incremental re-ingest)."""
+        return _decode_pages(self._safe(lambda: self._r.hgetall(self._prev_key), {}))
+
+    # ---------------- writes ----------------
+    def set_previous_chunks(self, previous: dict[str, int | None]) -> None:
+        """
+        Remember the chunks stored before this ingest began, so the incremental diff
+        survives a resume (by then the new version's chunks are in Mongo too).
+        """
+        self.incremental = bool(previous)
+        items = [(h, "" if p is None else p) for h, p in previous.items()]
+
+        def op(pipe):
+            pipe.hset(self.key, "incremental", "1" if previous else "0")
+            for i in range(0, len(items), _HSET_BATCH):
+                pipe.hset(self._prev_key, mapping=dict(items[i:i + _HSET_BATCH]))
+        self._write(op)
+
+    def set_page_count(self, page_count: int) -> None:
+        self.page_count = page_count
+        self._write(lambda p: p.hset(self.key, "page_count", page_count))
+
+    def mark_page_durable(self, page_number: int, chunk_hashes: list[str]) -> None:
+        def op(pipe):
+            if chunk_hashes:
+                pipe.hset(self._chunks_key, mapping={h: page_number for h in chunk_hashes})
+            pipe.sadd(self._pages_key, page_number)
+        self._write(op)
+
+    def mark_stage(self, stage: str) -> None:
+        self.stage = stage
+        self._write(lambda p: p.hset(self.key, "stage", stage))
+
+    def clear(self) -> None:
+        """Drop the checkpoint once the ingest has fully completed."""
+        self._safe(lambda: self._r.delete(*self._all_keys), None)
+
+    # ---------------- helpers ----------------
+    def _write(self, op) -> None:
+        def run():
+            pipe = self._r.pipeline()
+            op(pipe)
+            for key in self._all_keys:
+                pipe.expire(key, CHECKPOINT_TTL_S)
+            pipe.execute()
+        self._safe(run, None)
+
+    def _safe(self, fn, default):
+        try:
+            return fn()
+        except Exception as e:
+            log.warning("[CHECKPOINT] Redis error for doc %s: %s", self.doc_id, e)
+            return default
+
+
+def _s(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _decode_pages(raw: dict) -> dict[str, int | None]:
+    return {_s(h): (int(_s(p)) if _s(p) else None) for h, p in raw.items()}
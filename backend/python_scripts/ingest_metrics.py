@@ -0,0 +1,238 @@
+# ingest_metrics.py - Per-stage ingest spans aggregated as Prometheus histograms
+#
+# RQ forks a work horse per job and PDF pages are rendered in spawned processes,
+# so no single process lives long enough to own a metrics registry. Every
+# process records span durations into local histogram buckets and periodically
+# adds them to one Redis hash (HINCRBY), which therefore holds fleet-wide
+# cumulative histograms. Any process can render that hash in the Prometheus
+# text format:
+#   - GET /metrics on the web service (semantic_service.py)
+#   - a /metrics sidecar in each worker (config.INGEST_METRICS_PORT)
+#   - pushes to a Pushgateway from each worker (config.INGEST_METRICS_PUSHGATEWAY)
+#
+# Stages (label `stage` of ingest_stage_seconds):
+#   page_markdown      load_page().get_text("markdown") for one page
+#   markdown_split     MarkdownHeaderTextSplitter on one page
+#   semantic_split     lexical / SemanticChunker split of one long section
+#   limiter_wait       time blocked on the shared TPM bucket (batch priority)
+#   embed_request      one embeddings request batch (after the limiter)
+#   insert_many        one chunk insert_many (including retries)
+#   section_summary    one section summary LLM call (after the limiter)
+#
+# Redis layout:  metrics:ingest:stage_seconds   hash
+#   {stage}|{bucket index}   observations in that bucket (not cumulative)
+#   {stage}|count, {stage}|sum
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import config
+from logger_setup import log
+
+METRIC_NAME = "ingest_stage_seconds"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+_REDIS_KEY = "metrics:ingest:stage_seconds"
+_FLUSH_INTERVAL_S = 10.0
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Recorder:
+    """Unflushed observations of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: dict[str, list[int]] = {}
+        self.sums: dict[str, float] = {}
+        self.last_flush = time.monotonic()
+        self.redis = None
+
+    def add(self, stage: str, seconds: float) -> bool:
+        """Record one observation; True when a flush is due."""
+        idx = len(BUCKETS)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                idx = i
+                break
+        with self.lock:
+            counts = self.buckets.get(stage)
+            if counts is None:
+                counts = self.buckets[stage] = [0] * (len(BUCKETS) + 1)
+                self.sums[stage] = 0.0
+            counts[idx] += 1
+            self.sums[stage] += seconds
+            return time.monotonic() - self.last_flush >= _FLUSH_INTERVAL_S
+
+    def take(self):
+        with self.lock:
+            buckets, sums = self.buckets, self.sums
+            self.buckets, self.sums = {}, {}
+            self.last_flush = time.monotonic()
+        return buckets, sums
+
+
+_recorder: _Recorder | None = None
+_recorder_pid: int | None = None
+_recorder_lock = threading.Lock()
+
+
+def _get_recorder() -> _Recorder:
+    """Per-process recorder; a forked child starts empty (its parent flushes its own)."""
+    global _recorder, _recorder_pid
+    pid = os.getpid()
+    if _recorder is None or _recorder_pid != pid:
+        with _recorder_lock:
+            if _recorder is None or _recorder_pid != pid:
+                _recorder = _Recorder()
+                _recorder_pid = pid
+    return _recorder
+
+
+def _redis(rec: _Recorder):
+    if rec.redis is None:
+        from redis_setup import get_redis
+        rec.redis = get_redis()
+    return rec.redis
+
+
+# ──────────────────────────────────────────────────────────────
+# RECORDING
+# ──────────────────────────────────────────────────────────────
+def observe(stage: str, seconds: float) -> None:
+    """Record one span of *stage* lasting *seconds*."""
+    if not config.INGEST_METRICS_ENABLED:
+        return
+    if _get_recorder().add(stage, seconds):
+        flush()
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block as one observation of *stage* (also when it raises)."""
+    if not config.INGEST_METRICS_ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0)
+
+
+def flush() -> None:
+    """Add this process's observations to the shared Redis histograms (best-effort)."""
+    if not config.INGEST_METRICS_ENABLED:
+        return
+    rec = _get_recorder()
+    buckets, sums = rec.take()
+    if not buckets:
+        return
+    try:
+        pipe = _redis(rec).pipeline(transaction=False)
+        for stage, counts in buckets.items():
+            for i, n in enumerate(counts):
+                if n:
+                    pipe.hincrby(_REDIS_KEY, f"{stage}|{i}", n)
+            pipe.hincrby(_REDIS_KEY, f"{stage}|count", sum(counts))
+            pipe.hincrbyfloat(_REDIS_KEY, f"{stage}|sum", sums[stage])
+        pipe.execute()
+    except Exception as e:
+        log.warning("[STAGE-METRICS] Could not flush ingest stage histograms: %s", e)
+
+
+# ──────────────────────────────────────────────────────────────
+# EXPORT
+# ──────────────────────────────────────────────────────────────
+def render_prometheus(redis_client=None) -> str:
+    """Fleet-wide stage histograms in the Prometheus text exposition format."""
+    if redis_client is None:
+        from redis_setup import get_redis
+        redis_client = get_redis()
+    raw = redis_client.hgetall(_REDIS_KEY) or {}
+
+    stages: dict[str, dict[str, float]] = {}
+    for field, value in raw.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        value = value.decode() if isinstance(value, bytes) else value
+        stage, _, part = field.rpartition("|")
+        stages.setdefault(stage, {})[part] = float(value)
+
+    lines = [
+        f"# HELP {METRIC_NAME} Wall time of one ingest stage span.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    for stage in sorted(stages):
+        parts = stages[stage]
+        cumulative = 0
+        for i, bound in enumerate(BUCKETS):
+            cumulative += int(parts.get(str(i), 0))
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        cumulative += int(parts.get(str(len(BUCKETS)), 0))
+        lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {parts.get("sum", 0.0)}')
+        lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {int(parts.get("count", 0))}')
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(port: int) -> ThreadingHTTPServer:
+    """Start a /metrics sidecar on *port* in a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            try:
+                body = render_prometheus(redis_client).encode()
+            except Exception as e:
+                log.warning("[STAGE-METRICS] /metrics render failed: %s", e)
+                self.send_error(503)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    from redis_setup import get_redis
+    redis_client = get_redis()
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-sidecar", daemon=True).start()
+    log.info("[STAGE-METRICS] Serving ingest histograms on :%d/metrics", port)
+    return server
+
+
+def start_pushing(gateway: str, interval_s: int) -> threading.Thread:
+    """
+    Push the histograms to a Pushgateway every *interval_s* seconds from a daemon thread.
+    The values are already fleet-wide, so every worker pushes to the same group
+    (job="ingest"); the latest push wins.
+    """
+    url = f"{gateway.rstrip('/')}/metrics/job/ingest"
+    if "://" not in url:
+        url = f"http://{url}"
+    instance = os.getenv("DYNO") or socket.gethostname()
+    from redis_setup import get_redis
+    redis_client = get_redis()
+
+    def loop():
+        while True:
+            time.sleep(interval_s)
+            try:
+                resp = requests.put(url, data=render_prometheus(redis_client).encode(),
+                                    headers={"Content-Type": CONTENT_TYPE}, timeout=10)
+                resp.raise_for_status()
+            except Exception as e:
+                log.warning("[STAGE-METRICS] Push from %s to %s failed: %s", instance, gateway, e)
+
+    thread = threading.Thread(target=loop, name="metrics-push", daemon=True)
+    thread.start()
+    log.info("[STAGE-METRICS] Pushing ingest histograms to %s every %ds", url, interval_s)
+    return thread
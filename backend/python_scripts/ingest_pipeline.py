@@ -0,0 +1,413 @@
+# ingest_pipeline.py - Staged, bounded ingest pipeline shared by PDF and DOCX paths
+#
+#   producer (parse) ──▶ pack ──▶ embed × N ──▶ write × M
+#
+# Every hand-off is a bounded queue, so a slow stage applies backpressure to the
+# one before it instead of buffering the whole document in memory. Embedding and
+# insert_many run in separate thread pools, so batch N+1 is embedding while
+# batch N is being written. The pack stage closes a batch at the embedding
+# request token ceiling (embed_batcher.py), so each batch is one full request.
+#
+# Producers call end_page(n) after the last chunk of page n; once every chunk of
+# that page has been written (or was already stored) on_page_durable(n, hashes)
+# fires with the page's chunk hashes, which is what ingest checkpoints record.
+#
+# With reuse_class_id set, a chunk whose raw text is already stored for another
+# document of that class copies that chunk's vectors (dup_of = its _id) rather
+# than being embedded again.
+import threading
+import time
+from queue import Queue
+from typing import Callable
+
+from pymongo.errors import BulkWriteError
+
+import config
+from chunk_schema import VECTOR_FIELDS, content_hash, reusable_vector_fields, vector_fields
+from embed_batcher import get_batch_controller
+from ingest_metrics import observe
+from logger_setup import log
+from token_counter import count_tokens
+
+_STOP = object()       # poison-pill shared by every stage
+_PAGE_END = object()   # pack-queue marker: no more chunks for this page
+
+
+class IngestPipeline:
+    """
+    Producer-facing handle for one document ingest.
+
+    Usage:
+        pipeline = IngestPipeline(embed_fn=..., collection=...)
+        pipeline.put(text, meta)   # from the parsing thread, any number of times
+        pipeline.end_page(n)       # optional: page n is fully queued
+        metrics = pipeline.close() # flushes, drains every stage, returns counters
+
+    Chunks whose hash is in skip_hashes are recorded in chunk_pages but never
+    embedded or written (incremental re-ingest). batch_tokens fixes the tokens
+    per embed batch; by default it follows the adaptive request ceiling.
+    embed_fn(texts, max_tokens=...) receives the ceiling each batch was packed at.
+    """
+
+    def __init__(
+        self,
+        *,
+        embed_fn: Callable[..., list[list[float]]],
+        collection,
+        cache=None,
+        skip_hashes: set[str] | None = None,
+        batch_tokens: int | None = None,
+        embed_workers: int | None = None,
+        write_workers: int | None = None,
+        queue_depth: int | None = None,
+        on_page_durable: Callable[[int, list[str]], None] | None = None,
+        reuse_class_id: str | None = None,
+    ):
+        self._embed_fn = embed_fn
+        self._collection = collection
+        self._cache = cache
+        self._skip_hashes = skip_hashes or set()
+        self._reuse_class_id = reuse_class_id
+        # chunk_hash -> page_number for every distinct chunk seen (incl. skipped)
+        self.chunk_pages: dict[str, int | None] = {}
+        self._batch_tokens = batch_tokens
+        self._batch_inputs = config.EMBED_MAX_INPUTS_PER_REQUEST
+        self._embed_workers = embed_workers or config.INGEST_EMBED_CONCURRENCY
+        self._write_workers = write_workers or config.INGEST_WRITE_CONCURRENCY
+        depth = queue_depth or config.INGEST_QUEUE_DEPTH
+
+        self._pack_q: Queue = Queue(maxsize=depth * 256)   # single chunks
+        self._embed_q: Queue = Queue(maxsize=depth)        # packed batches
+        self._write_q: Queue = Queue(maxsize=depth)        # embedded docs
+
+        self._lock = threading.Lock()
+        # Set if the pack stage dies; re-raised to the producer by put() / close()
+        self._error: Exception | None = None
+        self._pack_stopped = False
+
+        # Page durability: chunks queued but not yet written, per page
+        self._on_page_durable = on_page_durable
+        self._page_pending: dict[int, int] = {}
+        self._page_hashes: dict[int, list[str]] = {}
+        self._pages_sealed: set[int] = set()
+        self._pages_failed: set[int] = set()
+        self.durable_pages: set[int] = set()
+
+        self.metrics = {
+            "embed_workers": self._embed_workers,
+            "write_workers": self._write_workers,
+            "duplicates_skipped": 0,
+            "chunks_unchanged": 0,
+            "embed_batches": 0,
+            "embed_batch_tokens_total": 0,
+            "embed_latency_ms_total": 0,
+            "embed_failures": 0,
+            "embed_cache_hits": 0,
+            "embed_cache_misses": 0,
+            "dup_vectors_reused": 0,
+            "chunks_inserted": 0,
+            "insert_latency_ms_total": 0,
+            "insert_retries_total": 0,
+            "insert_failures": 0,
+        }
+
+        self._pack_thread = threading.Thread(target=self._pack, daemon=True)
+        self._embed_threads = [
+            threading.Thread(target=self._embed, daemon=True) for _ in range(self._embed_workers)
+        ]
+        self._write_threads = [
+            threading.Thread(target=self._write, daemon=True) for _ in range(self._write_workers)
+        ]
+        for t in [self._pack_thread, *self._embed_threads, *self._write_threads]:
+            t.start()
+
+    # ---------------- producer API ----------------
+    def put(self, text: str, meta: dict) -> None:
+        """Queue one chunk (text to embed + metadata). Blocks when the pipeline is full."""
+        self._raise_if_failed()
+        self._pack_q.put((text, meta))
+
+    def end_page(self, page_number: int) -> None:
+        """Signal that every chunk of page_number has been put()."""
+        self._raise_if_failed()
+        self._pack_q.put((_PAGE_END, page_number))
+
+    def close(self) -> dict:
+        """
+        Flush the last batch, stop every stage in order and return metrics.
+        Raises the pack stage's error, after shutting down, if it failed.
+        """
+        self._pack_q.put(_STOP)
+        self._pack_thread.join()
+        for _ in self._embed_threads:
+            self._embed_q.put(_STOP)
+        for t in self._embed_threads:
+            t.join()
+        for _ in self._write_threads:
+            self._write_q.put(_STOP)
+        for t in self._write_threads:
+            t.join()
+        self._raise_if_failed()
+        return {
+            **self.metrics,
+            "pages_durable": len(self.durable_pages),
+            "pages_failed": len(self._pages_failed),
+        }
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError("ingest pack stage failed") from self._error
+
+    def _bump(self, **deltas: int) -> None:
+        with self._lock:
+            for k, v in deltas.items():
+                self.metrics[k] += v
+
+    # ---------------- page durability ----------------
+    def _seal_page(self, page: int) -> None:
+        with self._lock:
+            self._pages_sealed.add(page)
+            ready = self._ready_pages([page])
+        self._notify(ready)
+
+    def _settle(self, metas, ok: bool) -> None:
+        """Record that these chunks were written (ok) or dropped after a failure."""
+        with self._lock:
+            pages = set()
+            for meta in metas:
+                page = meta.get("page_number")
+                if page is None:
+                    continue
+                self._page_pending[page] -= 1
+                if not ok:
+                    self._pages_failed.add(page)
+                pages.add(page)
+            ready = self._ready_pages(pages)
+        self._notify(ready)
+
+    def _ready_pages(self, pages) -> list[tuple[int, list[str]]]:
+        # Caller holds self._lock
+        ready = [
+            p for p in pages
+            if p in self._pages_sealed
+            and p not in self._pages_failed
+            and p not in self.durable_pages
+            and self._page_pending.get(p, 0) == 0
+        ]
+        self.durable_pages.update(ready)
+        return [(p, self._page_hashes.pop(p, [])) for p in ready]
+
+    def _notify(self, ready: list[tuple[int, list[str]]]) -> None:
+        if self._on_page_durable is None:
+            return
+        for page, hashes in ready:
+            try:
+                self._on_page_durable(page, hashes)
+            except Exception as e:
+                log.warning("[INGEST] on_page_durable(%s) failed: %s", page, e)
+
+    # ---------------- stage: pack ----------------
+    def _pack(self):
+        try:
+            self._pack_chunks()
+        except Exception as e:
+            # Chunks of the unfinished batch were never written, so their pages
+            # never become durable; the producer sees the error on its next call
+            log.error("[INGEST] pack stage failed: %s", e, exc_info=True)
+            self._error = e
+            # Keep draining so put() / close() never block on a dead consumer
+            while not self._pack_stopped and self._pack_q.get() is not _STOP:
+                pass
+
+    def _pack_chunks(self):
+        seen_hashes = self.chunk_pages   # dedup across the whole document
+        batch: list[tuple[str, dict]] = []
+        token_sum = 0
+        ceiling = 0
+        while True:
+            item = self._pack_q.get()
+            if item is _STOP:
+                self._pack_stopped = True
+                break
+            text, meta = item
+            if text is _PAGE_END:
+                self._seal_page(meta)
+                continue
+            # Stable hash per doc for dedup within this ingest
+            h = content_hash(text)
+            if h in seen_hashes:
+                self._bump(duplicates_skipped=1)
+                continue
+            seen_hashes[h] = meta.get("page_number")
+            if meta.get("page_number") is not None:
+                with self._lock:
+                    self._page_hashes.setdefault(meta["page_number"], []).append(h)
+            if h in self._skip_hashes:
+                # Already stored for this doc_id (incremental re-ingest)
+                self._bump(chunks_unchanged=1)
+                continue
+            # raw_hash ignores the contextual header (producers pass the bare text in meta)
+            raw_hash = content_hash(meta["text"]) if meta.get("text") else h
+            n = count_tokens(text, model=config.EMBEDDING_MODEL)
+            # Same rule as embed_batcher.pack(): close the batch before a chunk would
+            # take it past the ceiling, so the service sends it as one request
+            if batch and (token_sum + n > ceiling or len(batch) >= self._batch_inputs):
+                self._embed_q.put((batch, ceiling))
+                self._bump(embed_batch_tokens_total=token_sum)
+                batch, token_sum = [], 0
+            if not batch:
+                # Fixed for the life of the batch; the embed stage packs at the same value
+                ceiling = self._batch_tokens or get_batch_controller().current
+            batch.append((text, {**meta, "chunk_hash": h, "raw_hash": raw_hash}))
+            if meta.get("page_number") is not None:
+                with self._lock:
+                    page = meta["page_number"]
+                    self._page_pending[page] = self._page_pending.get(page, 0) + 1
+            token_sum += n
+        if batch:
+            self._embed_q.put((batch, ceiling))
+            self._bump(embed_batch_tokens_total=token_sum)
+
+    # ---------------- stage: embed ----------------
+    def _embed(self):
+        while True:
+            item = self._embed_q.get()
+            if item is _STOP:
+                break
+            batch, ceiling = item
+            texts, metas = zip(*batch)
+            reused = self._class_duplicates(metas)
+            todo = [i for i in range(len(texts)) if i not in reused]
+            vectors = [None] * len(texts)
+            for i, vec in zip(todo, self._cached_vectors([texts[i] for i in todo])):
+                vectors[i] = vec
+            misses = [i for i in todo if vectors[i] is None]
+            self._bump(
+                embed_cache_hits=len(todo) - len(misses),
+                embed_cache_misses=len(misses),
+                dup_vectors_reused=len(reused),
+            )
+
+            if misses:
+                miss_texts = [texts[i] for i in misses]
+                log.info("Embedding %d texts (%d cached)", len(miss_texts), len(texts) - len(misses))
+                t0 = time.time()
+                try:
+                    fresh = self._embed_fn(miss_texts, max_tokens=ceiling)
+                except Exception as e:
+                    # Keep draining so upstream stages never block on a dead consumer
+                    log.error("Embedding batch of %d failed: %s", len(miss_texts), e)
+                    self._bump(embed_failures=1)
+                    self._settle(metas, ok=False)
+                    continue
+                self._bump(embed_batches=1, embed_latency_ms_total=int((time.time() - t0) * 1000))
+                for i, vec in zip(misses, fresh):
+                    vectors[i] = vec
+                self._store_vectors(miss_texts, fresh)
+
+            docs = []
+            for i, (vec, txt, meta_d) in enumerate(zip(vectors, texts, metas)):
+                doc_record = meta_d.copy()
+                doc_record.setdefault("text", txt)   # producers may store text without the header
+                if i in reused:
+                    canonical_id, fields = reused[i]
+                    doc_record.update(fields)
+                    doc_record["dup_of"] = canonical_id
+                else:
+                    doc_record.update(vector_fields(vec))   # per config embedding profile
+                docs.append(doc_record)
+            self._write_q.put(docs)
+
+    def _class_duplicates(self, metas) -> dict[int, tuple]:
+        """
+        Batch positions whose raw text is already stored for another doc of the class.
+
+        Returns:
+            {index: (canonical _id, vector fields to copy)}; lookup errors degrade to {}
+        """
+        if self._reuse_class_id is None or not metas:
+            return {}
+        wanted = {m["raw_hash"] for m in metas if m.get("raw_hash")}
+        try:
+            cursor = self._collection.find(
+                {
+                    "user_id": metas[0].get("user_id"),
+                    "class_id": self._reuse_class_id,
+                    "raw_hash": {"$in": list(wanted)},
+                    "is_summary": False,
+                    "doc_id": {"$ne": metas[0].get("doc_id")},
+                    "dup_of": {"$exists": False},   # always link to the canonical copy
+                },
+                {"raw_hash": 1, **{f: 1 for f in VECTOR_FIELDS}},
+            )
+            canonical: dict[str, tuple] = {}
+            for d in cursor:
+                if d["raw_hash"] in canonical:
+                    continue
+                fields = reusable_vector_fields(d)
+                if fields is not None:
+                    canonical[d["raw_hash"]] = (d["_id"], fields)
+        except Exception as e:
+            log.warning("[INGEST] duplicate lookup failed: %s", e)
+            return {}
+        return {i: canonical[m["raw_hash"]] for i, m in enumerate(metas) if m.get("raw_hash") in canonical}
+
+    def _cached_vectors(self, texts: list[str]) -> list:
+        """Bulk cache lookup; cache errors degrade to all-miss."""
+        if self._cache is None:
+            return [None] * len(texts)
+        try:
+            return self._cache.get_many(texts)
+        except Exception as e:
+            log.warning("[EMBED-CACHE] lookup failed: %s", e)
+            return [None] * len(texts)
+
+    def _store_vectors(self, texts: list[str], vectors: list[list[float]]) -> None:
+        if self._cache is None:
+            return
+        try:
+            self._cache.put_many(texts, vectors)
+        except Exception as e:
+            log.warning("[EMBED-CACHE] store failed: %s", e)
+
+    # ---------------- stage: write ----------------
+    def _write(self):
+        while True:
+            docs = self._write_q.get()
+            if docs is _STOP:
+                break
+            attempts = 0
+            t0 = time.time()
+            ok = False
+            while True:
+                try:
+                    self._collection.insert_many(docs, ordered=False)
+                    self._bump(chunks_inserted=len(docs))
+                    ok = True
+                    break
+                except BulkWriteError as e:
+                    # Duplicate keys mean an earlier attempt (or a resumed run) already stored them
+                    errors = e.details.get("writeErrors", [])
+                    if errors and all(err.get("code") == 11000 for err in errors):
+                        self._bump(chunks_inserted=len(docs) - len(errors))
+                        ok = True
+                        break
+                    attempts += 1
+                    self._bump(insert_retries_total=1)
+                    if attempts > 3:
+                        log.error("insert_many failed after retries: %s", e)
+                        self._bump(insert_failures=1)
+                        break
+                    time.sleep(0.75 * attempts)
+                except Exception as e:
+                    attempts += 1
+                    self._bump(insert_retries_total=1)
+                    if attempts > 3:
+                        log.error("insert_many failed after retries: %s", e)
+                        self._bump(insert_failures=1)
+                        break
+                    time.sleep(0.75 * attempts)
+            self._settle(docs, ok)
+            elapsed = time.time() - t0
+            self._bump(insert_latency_ms_total=int(elapsed * 1000))
+            observe("insert_many", elapsed)
@@ -0,0 +1,186 @@
+# lexical_splitter.py - Embedding-free semantic boundary detection for ingestion
+#
+# Drop-in replacement for langchain_experimental's SemanticChunker on long
+# markdown sections. SemanticChunker embeds every sentence group through the
+# OpenAI API only to throw the vectors away; this splitter scores topic shifts
+# locally with lexical cohesion (TextTiling-style depth scores over hashed
+# term vectors) in NumPy, so splitting costs no API calls or TPM.
+import math
+import re
+import zlib
+
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+_SENTENCE_RE = re.compile(r"(?<=[.?!])\s+")   # same sentence split as SemanticChunker
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class LexicalSemanticSplitter:
+    """
+    Split text at the strongest lexical-cohesion dips, within size bounds.
+
+    Args:
+        target_chunk_chars: Desired average chunk length (RecursiveCharacterTextSplitter
+            uses 1200 elsewhere in the pipeline); gaps are only taken as topic
+            boundaries while they are deeper than average, so one topic is not
+            cut at every small dip
+        min_chunk_chars: Breaks that would leave a smaller chunk are skipped, and
+            any smaller fragment left over is merged into a neighbour
+        max_chunk_chars: Hard cap (the 2,000-char threshold that sends a section
+            here); a segment with no usable boundary above it is cut by a
+            recursive character split
+        block_size: Sentences compared on each side of a gap
+        n_features: Hash buckets for term vectors
+    """
+
+    # Bumped when the boundary algorithm changes, so cached splits are redone
+    version = 2
+
+    def __init__(
+        self,
+        *,
+        target_chunk_chars: int = 1200,
+        min_chunk_chars: int = 300,
+        max_chunk_chars: int = 2000,
+        block_size: int = 3,
+        n_features: int = 4096,
+    ):
+        self.target_chunk_chars = target_chunk_chars
+        self.min_chunk_chars = min_chunk_chars
+        self.max_chunk_chars = max_chunk_chars
+        self.block_size = block_size
+        self.n_features = n_features
+
+    def split_text(self, text: str) -> list[str]:
+        sentences = [s for s in _SENTENCE_RE.split(text) if s.strip()]
+        if len(sentences) < 3 or len(text) <= self.target_chunk_chars:
+            return self._merge_small(self._enforce_max([text]))
+
+        depth = self._depth_scores(sentences)              # one score per gap
+        # Gap i sits after sentence i; offsets[i] is where sentence i starts
+        offsets = np.concatenate([[0], np.cumsum([len(s) + 1 for s in sentences])])
+
+        def fits(chosen: list[int]) -> bool:
+            bounds = [0, *(int(offsets[g + 1]) for g in chosen), int(offsets[-1])]
+            return min(b - a for a, b in zip(bounds, bounds[1:])) >= self.min_chunk_chars
+
+        # 1) Topic boundaries: local depth maxima deeper than average, deepest first,
+        #    up to as many as the target chunk size calls for (plus one for slack)
+        n_breaks = math.ceil(len(text) / self.target_chunk_chars)
+        cutoff = float(depth.mean()) if len(depth) else 0.0
+        chosen: list[int] = []
+        for gap in np.argsort(-depth, kind="stable"):
+            gap = int(gap)
+            if len(chosen) == n_breaks or depth[gap] <= cutoff:
+                break
+            candidate = sorted(chosen + [gap])
+            if fits(candidate):
+                chosen = candidate
+
+        # 2) Size cap: split any segment over max_chunk_chars at its deepest usable gap
+        changed = True
+        while changed:
+            changed = False
+            bounds = [-1, *chosen, len(sentences) - 1]
+            for a, b in zip(bounds, bounds[1:]):
+                if offsets[b + 1] - offsets[a + 1] <= self.max_chunk_chars:
+                    continue
+                for gap in sorted(range(a + 1, b), key=lambda g: -depth[g]):
+                    candidate = sorted(chosen + [gap])
+                    if fits(candidate):
+                        chosen, changed = candidate, True
+                        break
+                if changed:
+                    break
+
+        chunks, start = [], 0
+        for gap in chosen:
+            chunks.append(" ".join(sentences[start:gap + 1]))
+            start = gap + 1
+        chunks.append(" ".join(sentences[start:]))
+        return self._merge_small(self._enforce_max(chunks))
+
+    # ---------------- size bounds ----------------
+    def _enforce_max(self, chunks: list[str]) -> list[str]:
+        """Recursive character split of any chunk still over max_chunk_chars (e.g. one huge sentence)."""
+        out = []
+        for chunk in chunks:
+            if len(chunk) <= self.max_chunk_chars:
+                out.append(chunk)
+                continue
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=min(self.target_chunk_chars, self.max_chunk_chars), chunk_overlap=0
+            )
+            out.extend(splitter.split_text(chunk))
+        return out
+
+    def _merge_small(self, chunks: list[str]) -> list[str]:
+        """Merge fragments under min_chunk_chars into the smaller neighbour that stays under the cap."""
+        chunks = list(chunks)
+        i = 0
+        while len(chunks) > 1 and i < len(chunks):
+            if len(chunks[i]) >= self.min_chunk_chars:
+                i += 1
+                continue
+            options = [j for j in (i - 1, i + 1) if 0 <= j < len(chunks)
+                       and len(chunks[j]) + len(chunks[i]) + 1 <= self.max_chunk_chars]
+            if not options:
+                i += 1
+                continue
+            j = min(options, key=lambda k: len(chunks[k]))
+            lo, hi = min(i, j), max(i, j)
+            chunks[lo:hi + 1] = [chunks[lo] + " " + chunks[hi]]
+            i = lo
+        return chunks
+
+    # ---------------- scoring ----------------
+    def _term_counts(self, sentences: list[str]) -> np.ndarray:
+        """Hashed term counts, one row per sentence."""
+        tf = np.zeros((len(sentences), self.n_features), dtype=np.float32)
+        for i, sent in enumerate(sentences):
+            for tok in _TOKEN_RE.findall(sent.lower()):
+                tf[i, zlib.crc32(tok.encode()) % self.n_features] += 1.0
+        return tf
+
+    def _gap_similarities(self, sentences: list[str]) -> np.ndarray:
+        """
+        Cosine similarity, for each gap, between the block of block_size sentences
+        before it and the block after it (idf-weighted, log-scaled counts). The
+        blocks do not overlap, so shared sentences cannot mask a topic shift.
+        """
+        tf = self._term_counts(sentences)
+        n = len(sentences)
+        df = np.count_nonzero(tf, axis=0)
+        idf = np.log((1 + n) / (1 + df)) + 1.0
+
+        csum = np.vstack([np.zeros((1, self.n_features), dtype=np.float32), np.cumsum(tf, axis=0)])
+        gaps = np.arange(n - 1)
+        cut = gaps + 1
+        left = csum[cut] - csum[np.clip(cut - self.block_size, 0, n)]
+        right = csum[np.clip(cut + self.block_size, 0, n)] - csum[cut]
+        left = np.log1p(left) * idf
+        right = np.log1p(right) * idf
+        norms = np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1)
+        norms[norms == 0] = 1.0
+        return np.einsum("ij,ij->i", left, right) / norms
+
+    def _depth_scores(self, sentences: list[str]) -> np.ndarray:
+        """
+        TextTiling depth score for each gap between adjacent sentences:
+        how far the (smoothed) similarity dips below the nearest peaks on either side.
+        """
+        sims = self._gap_similarities(sentences)
+        if len(sims) >= 3:
+            # One sentence with unusual vocabulary should not look like a topic shift
+            sims[1:-1] = 0.25 * sims[:-2] + 0.5 * sims[1:-1] + 0.25 * sims[2:]
+        depth = np.zeros_like(sims)
+        for i, s in enumerate(sims):
+            left = i
+            while left > 0 and sims[left - 1] >= sims[left]:
+                left -= 1
+            right = i
+            while right < len(sims) - 1 and sims[right + 1] >= sims[right]:
+                right += 1
+            depth[i] = (sims[left] - s) + (sims[right] - s)
+        return depth
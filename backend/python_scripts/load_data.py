@@ -1,19 +1,16 @@
 # load_data.py  – 25 Jul 2025
-import os, argparse
 import hashlib
-from io import BytesIO
-from queue import SimpleQueue
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os, argparse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import boto3  # AWS S3 client
 import pymupdf
-import asyncio
 import time
 import json
 
 from bson import ObjectId
 from pymongo import MongoClient
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain_text_splitters import (
     RecursiveCharacterTextSplitter,
     MarkdownHeaderTextSplitter,
@@ -22,52 +19,39 @@ from langchain_experimental.text_splitter import SemanticChunker
 from langchain_core.output_parsers import StrOutputParser
 from langchain.prompts import PromptTemplate
 from langchain_mongodb import MongoDBAtlasVectorSearch
-from openai import AsyncOpenAI, RateLimitError, APIConnectionError, Timeout as OpenAITimeout
 
 import config
 from logger_setup import log
+from rate_limiter import PRIORITY_BATCH, get_tpm_limiter
 from redis_setup import get_redis
-from docx_processor import extract_docx_paragraphs, extract_docx_metadata, get_docx_stats, convert_docx_to_pdf, convert_docx_to_pdf_cloudmersive
+from rq import get_current_job
+from ingest_checkpoint import (
+    STAGE_CHUNKS_DURABLE,
+    STAGE_FANNED_OUT,
+    STAGE_STARTED,
+    STAGE_SUMMARY_ENQUEUED,
+    IngestCheckpoint,
+    file_sha256,
+)
+from token_counter import count_tokens, count_tokens_batch, truncate_to_tokens
+from ingest_metrics import span
+from docx_processor import extract_docx_content, convert_docx_to_pdf_cloudmersive
+from office_pool import convert_docx_to_pdf_pooled, pool_enabled
+from pdf_extractor import iter_page_markdown, open_pdf, resolve_parser_workers
+from lexical_splitter import LexicalSemanticSplitter
+from ingest_pipeline import IngestPipeline
+from embedding_service import ServiceEmbeddings, get_embedding_service
+from embedding_cache import get_embedding_cache
+from s3_download import download_to_tempfile
+import parse_cache
+from chunk_schema import chunk_text, create_contextual_header, model_fields
 
 
 # ──────────────────────────────────────────────────────────────
 # CONTEXTUAL CHUNK HEADERS (P0 - RAG Architecture v1.1)
+# The header is embedded with the chunk but not stored; readers rebuild it
+# from the chunk's metadata (chunk_schema.chunk_text).
 # ──────────────────────────────────────────────────────────────
-def create_contextual_header(
-    doc_title: str,
-    section_headers: list[str] | None = None,
-    doc_type: str | None = None,
-    page_number: int | None = None
-) -> str:
-    """
-    Create a contextual header to prepend to chunks.
-    This improves retrieval by embedding document context with content.
-
-    Args:
-        doc_title: The document filename or title
-        section_headers: List of section headers from markdown parsing
-        doc_type: File type (pdf, docx)
-        page_number: Page or paragraph number
-
-    Returns:
-        Formatted header string to prepend to chunk text
-    """
-    parts = [f"Document: {doc_title}"]
-
-    if doc_type:
-        parts.append(f"Type: {doc_type.upper()}")
-
-    if page_number is not None:
-        parts.append(f"Page: {page_number}")
-
-    if section_headers:
-        # Include up to 2 levels of section hierarchy
-        hierarchy = " > ".join(section_headers[-2:])
-        parts.append(f"Section: {hierarchy}")
-
-    return " | ".join(parts) + "\n\n"
-
-
 def add_context_to_chunk(
     chunk_text: str,
     doc_title: str,
@@ -119,95 +103,45 @@ s3_client = boto3.client(
 
 # LLM and embedding models
 llm = ChatOpenAI(model=config.OPENAI_CHAT_MODEL, temperature=0)
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = ServiceEmbeddings()   # LangChain adapter over embedding_service
 
-# Token estimation configuration
-TOK_PER_CHAR = 1 / 4
+# Token accounting (exact counts via token_counter)
 MAX_TOKENS_PER_REQUEST = 300_000
-est_tokens = lambda txt: int(len(txt) * TOK_PER_CHAR)
 
-# Rate-limit guard using Redis
-r = get_redis()
-TPM_LIMIT = config.OPENAI_TPM_LIMIT
 
 
 
 # ──────────────────────────────────────────────────────────────
-# ASYNC EMBEDDING HELPER
+# EMBEDDING HELPER
+# All ingest embeddings go through the process-wide embedding provider
+# (embedding_service.get_embedding_service(): OpenAI or local CPU model).
 # ──────────────────────────────────────────────────────────────
-async_client = AsyncOpenAI()       # one shared client
-
-async def async_embed_texts(
-    texts: list[str],
-    *,
-    batch_size: int = 80,
-    concurrency: int = 2,
-) -> list[list[float]]:
+def embed_batch(texts: list[str], max_tokens: int | None = None) -> list[list[float]]:
     """
-    Embed *texts* concurrently.
-    Splits into ≤batch_size chunks and keeps ≤concurrency requests in flight.
+    Embed one ingest batch under the shared TPM guard (IngestPipeline embed stage).
+    max_tokens is the request ceiling the batch was packed at, so it goes out unsplit.
     """
-    sem     = asyncio.Semaphore(concurrency)
-    results = [None] * len(texts)   # type: ignore
-
-    async def worker(start_idx: int, slice_: list[str]):
-        async with sem:
-            retries = 2
-            while True:
-                try:
-                    resp = await async_client.embeddings.create(
-                        model="text-embedding-3-small", input=slice_
-                    )
-                    break
-                except (RateLimitError, APIConnectionError, OpenAITimeout) as e:
-                    if retries == 0:
-                        raise e
-                    retries -= 1
-                    await asyncio.sleep(1.5)
-            for i, d in enumerate(resp.data):
-                results[start_idx + i] = d.embedding   # type: ignore
-
-    tasks = [
-        worker(i, texts[i:i + batch_size])
-        for i in range(0, len(texts), batch_size)
-    ]
-    await asyncio.gather(*tasks)
-    return results
-
-def embed_texts_sync(texts: list[str]) -> list[list[float]]:
-    """Sync wrapper so the consumer thread can call it easily."""
-    return asyncio.run(async_embed_texts(texts))
-
-
-def reserve_tokens(tokens_needed: int, bucket_key: str = "openai:tpm") -> bool:
-    """
-    Try to reserve `tokens_needed` tokens for the next minute.
-    Returns True if reservation succeeded, else False.
-    """
-    now = int(time.time())
-    pipe = r.pipeline()
-
-    # 1) Leak tokens older than 60 s
-    pipe.zremrangebyscore(bucket_key, 0, now - 60)
-
-    # 2) How many tokens remain after leak?
-    pipe.zcard(bucket_key)
-    current = pipe.execute()[-1]
+    service = get_embedding_service()
+    if not service.remote:
+        with span("embed_request"):
+            return service.embed(texts)
+    reserved = sum(count_tokens_batch(texts, model=config.EMBEDDING_MODEL))
+    acquire_tokens(reserved)
+    try:
+        with span("embed_request"):
+            vectors, used = service.embed_with_usage(texts, max_tokens=max_tokens)
+    except Exception:
+        # A failed request is not billed; hand the reservation back
+        get_tpm_limiter().reconcile(reserved, 0, PRIORITY_BATCH)
+        raise
+    get_tpm_limiter().reconcile(reserved, used, PRIORITY_BATCH)
+    return vectors
 
-    # 3) Reserve if room
-    if current + tokens_needed <= TPM_LIMIT:
-        pipe = r.pipeline()
-        # Any unique member IDs; we add one per token (fast for TPM ≤ 300k)
-        for i in range(tokens_needed):
-            pipe.zadd(bucket_key, {f"{now}:{i}": now})
-        pipe.execute()
-        return True
-    return False
 
 def acquire_tokens(tokens_needed: int):
-    """Block until tokens are available."""
-    while not reserve_tokens(tokens_needed):
-        time.sleep(0.5)        # half‑second back‑off
+    """Block until tokens are available in the shared TPM bucket."""
+    with span("limiter_wait"):
+        get_tpm_limiter().acquire(tokens_needed, priority=PRIORITY_BATCH)
 
 
 # ──────────────────────────────────────────────────────────────
@@ -236,6 +170,122 @@ def summarize_document(text_input: str) -> str:
 # Generate section-level summaries during ingestion for fast
 # query-time document summarization.
 # ──────────────────────────────────────────────────────────────
+# Prompt template + summary output (~300 words) on top of the section text
+_SECTION_PROMPT_OVERHEAD_TOKENS = 700
+
+
+def plan_sections(
+    chunks_by_page: dict[int, list[str]],
+    breaks: set[int] | None = None,
+    *,
+    max_tokens: int,
+    min_tokens: int,
+) -> list[dict]:
+    """
+    Group pages into sections by token count.
+
+    A section closes before a page that would take it past max_tokens, or at a
+    preferred break page (PDF outline entry / new top-level header) once it holds
+    at least min_tokens. A single page larger than max_tokens becomes its own
+    section, truncated to fit. A trailing section under min_tokens is merged into
+    the previous one when they fit together.
+
+    Returns:
+        [{"index", "start_page", "end_page", "text", "tokens"}] in page order
+    """
+    pages = sorted(chunks_by_page)
+    page_texts = ["\n\n".join(chunks_by_page[p]) for p in pages]
+    page_tokens = count_tokens_batch(page_texts, model=config.SECTION_SUMMARY_MODEL)
+    breaks = breaks or set()
+
+    groups: list[list[int]] = []   # indexes into pages
+    current: list[int] = []
+    current_tokens = 0
+    for i, page in enumerate(pages):
+        n = page_tokens[i]
+        if current and (
+            current_tokens + n > max_tokens
+            or (page in breaks and current_tokens >= min_tokens)
+        ):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n
+    if current:
+        groups.append(current)
+
+    if len(groups) > 1:
+        last_tokens = sum(page_tokens[i] for i in groups[-1])
+        prev_tokens = sum(page_tokens[i] for i in groups[-2])
+        if last_tokens < min_tokens and last_tokens + prev_tokens <= max_tokens:
+            groups[-2].extend(groups.pop())
+
+    sections = []
+    for group in groups:
+        text = "\n\n".join(page_texts[i] for i in group)
+        tokens = sum(page_tokens[i] for i in group)
+        if tokens > max_tokens:
+            text = truncate_to_tokens(text, max_tokens, model=config.SECTION_SUMMARY_MODEL)
+            tokens = max_tokens
+            log.warning("[SECTION-SUMMARY] Page %d exceeds %d tokens; truncated", pages[group[0]], max_tokens)
+        sections.append({
+            "index": len(sections),
+            "start_page": pages[group[0]],
+            "end_page": pages[group[-1]],
+            "text": text,
+            "tokens": tokens,
+        })
+    return sections
+
+
+def sections_to_regenerate(
+    sections: list[dict],
+    only_pages: set[int],
+    stored_ranges: list[dict],
+) -> list[dict]:
+    """
+    Sections to regenerate when only_pages changed (incremental re-ingest).
+
+    Token-sized boundaries can shift past the edited pages, and storing a section
+    deletes every stored one it overlaps (delete_section_summaries_overlapping).
+    So the selection is closed over that: any new section overlapping a stored
+    range that will be deleted is added too, until no more are. Every page of a
+    deleted section is then covered by a regenerated one.
+
+    Args:
+        sections: Output of plan_sections for the current chunks
+        only_pages: Pages whose chunks changed
+        stored_ranges: [{"start_page", "end_page"}] of the stored section summaries
+    """
+    def overlaps(a, b) -> bool:
+        return a["start_page"] <= b["end_page"] and b["start_page"] <= a["end_page"]
+
+    chosen = {
+        s["index"] for s in sections
+        if any(s["start_page"] <= p <= s["end_page"] for p in only_pages)
+    }
+    while True:
+        deleted = [r for r in stored_ranges if any(overlaps(r, sections[i]) for i in chosen)]
+        grown = chosen | {s["index"] for s in sections if any(overlaps(s, r) for r in deleted)}
+        if grown == chosen:
+            return [s for s in sections if s["index"] in chosen]
+        chosen = grown
+
+
+def section_summary_concurrency(section_tokens: int) -> int:
+    """
+    How many sections to have in flight: as many as the TPM bucket can currently
+    fund for batch work, between 1 and config.SECTION_SUMMARY_CONCURRENCY.
+    """
+    try:
+        headroom = get_tpm_limiter().available(PRIORITY_BATCH)
+    except Exception as e:
+        log.warning("[SECTION-SUMMARY] Could not read TPM headroom: %s", e)
+        return 1
+    per_call = max(1, section_tokens + _SECTION_PROMPT_OVERHEAD_TOKENS)
+    return max(1, min(config.SECTION_SUMMARY_CONCURRENCY, headroom // per_call))
+
+
 def generate_section_summary(
     section_text: str,
     section_index: int,
@@ -257,15 +307,23 @@ def generate_section_summary(
         "Use markdown formatting with bullet points for clarity."
     )
 
+    reserved = count_tokens(section_text, model=config.SECTION_SUMMARY_MODEL) + _SECTION_PROMPT_OVERHEAD_TOKENS
+    acquire_tokens(reserved)
+    used = 0
     try:
-        return (prompt | section_llm | StrOutputParser()).invoke({
-            "context": section_text,
-            "start_page": start_page,
-            "end_page": end_page,
-        })
+        with span("section_summary"):
+            message = (prompt | section_llm).invoke({
+                "context": section_text,
+                "start_page": start_page,
+                "end_page": end_page,
+            })
+        used = (message.usage_metadata or {}).get("total_tokens")
+        return StrOutputParser().invoke(message)
     except Exception as e:
         log.error(f"[SECTION-SUMMARY] Failed to generate summary for section {section_index}: {e}")
         return ""
+    finally:
+        get_tpm_limiter().reconcile(reserved, used, PRIORITY_BATCH)
 
 
 def generate_section_summaries_parallel(
@@ -274,13 +332,18 @@ def generate_section_summaries_parallel(
     class_name: str,
     doc_id: str,
     file_name: str,
+    only_pages: set[int] | None = None,
+    breaks: set[int] | None = None,
 ) -> list[dict]:
     """
-    Generate section summaries in parallel during ingestion.
+    Generate section summaries in parallel (summarize_document_sections job).
 
     Args:
         chunks_by_page: Dict mapping page numbers to list of chunk texts
         user_id, class_name, doc_id, file_name: Document metadata
+        only_pages: If set, only sections containing one of these pages (and any
+            whose stored predecessors they displace) are summarized
+        breaks: Preferred section start pages (outline entries / header changes)
 
     Returns:
         List of section summary metadata dicts ready for storage
@@ -292,40 +355,25 @@ def generate_section_summaries_parallel(
     if not chunks_by_page:
         return []
 
-    pages_per_section = config.SECTION_SUMMARY_PAGES
-    max_concurrency = config.SECTION_SUMMARY_CONCURRENCY
-
-    # Sort pages and group into sections
-    sorted_pages = sorted(chunks_by_page.keys())
-    total_pages = len(sorted_pages)
-
-    if total_pages < 5:
+    sections = plan_sections(
+        chunks_by_page,
+        breaks,
+        max_tokens=config.SECTION_SUMMARY_MAX_TOKENS,
+        min_tokens=config.SECTION_SUMMARY_MIN_TOKENS,
+    )
+    total_tokens = sum(s["tokens"] for s in sections)
+    if len(sections) < 2 and total_tokens < config.SECTION_SUMMARY_MIN_TOKENS:
         # Too small for section summaries - will use direct summarization
-        log.info(f"[SECTION-SUMMARY] Document too small ({total_pages} pages), skipping sections")
+        log.info(f"[SECTION-SUMMARY] Document too small ({total_tokens} tokens), skipping sections")
         return []
 
-    # Build sections
-    sections = []
-    for i in range(0, total_pages, pages_per_section):
-        section_pages = sorted_pages[i:i + pages_per_section]
-        start_page = section_pages[0]
-        end_page = section_pages[-1]
+    if only_pages is not None:
+        sections = sections_to_regenerate(sections, only_pages, fetch_section_ranges(doc_id))
 
-        # Combine all chunk texts for this section
-        section_chunks = []
-        for page in section_pages:
-            section_chunks.extend(chunks_by_page[page])
-
-        section_text = "\n\n".join(section_chunks)
-
-        sections.append({
-            "index": len(sections),
-            "start_page": start_page,
-            "end_page": end_page,
-            "text": section_text,
-        })
-
-    log.info(f"[SECTION-SUMMARY] Generating {len(sections)} section summaries for {total_pages} pages")
+    log.info(
+        f"[SECTION-SUMMARY] Generating {len(sections)} section summaries for "
+        f"{len(chunks_by_page)} pages ({total_tokens} tokens)"
+    )
 
     # Generate summaries in parallel
     section_summaries = []
@@ -357,17 +405,28 @@ def generate_section_summaries_parallel(
             }
         return None
 
-    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
-        futures = {executor.submit(process_section, s): s for s in sections}
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                section_summaries.append(result)
+    # Concurrency is re-evaluated as sections finish, following TPM headroom
+    pending = deque(sections)
+    running = set()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, config.SECTION_SUMMARY_CONCURRENCY)) as executor:
+        while pending or running:
+            if pending:
+                limit = section_summary_concurrency(pending[0]["tokens"])
+                while pending and len(running) < limit:
+                    running.add(executor.submit(process_section, pending.popleft()))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result:
+                    section_summaries.append(result)
+                else:
+                    failed += 1
 
     # Sort by section index
     section_summaries.sort(key=lambda x: x["section_index"])
 
-    log.info(f"[SECTION-SUMMARY] Generated {len(section_summaries)} section summaries")
+    log.info(f"[SECTION-SUMMARY] Generated {len(section_summaries)} section summaries ({failed} failed)")
     return section_summaries
 
 
@@ -381,7 +440,7 @@ def store_section_summaries(section_summaries: list[dict]) -> int:
         return 0
 
     texts = [s["text"] for s in section_summaries]
-    metadatas = [{k: v for k, v in s.items() if k != "text"} for s in section_summaries]
+    metadatas = [{**{k: v for k, v in s.items() if k != "text"}, **model_fields()} for s in section_summaries]
 
     try:
         MongoDBAtlasVectorSearch.from_texts(
@@ -396,214 +455,404 @@ def store_section_summaries(section_summaries: list[dict]) -> int:
         log.error(f"[SECTION-SUMMARY] Failed to store summaries: {e}")
         return 0
 
+def fetch_section_ranges(doc_id: str) -> list[dict]:
+    """Page ranges of the section summaries currently stored for doc_id."""
+    cursor = collection.find(
+        {"doc_id": doc_id, "is_summary": True, "summary_type": "section"},
+        {"_id": 0, "start_page": 1, "end_page": 1},
+    )
+    return [d for d in cursor if d.get("start_page") is not None and d.get("end_page") is not None]
+
+
+def delete_section_summaries_overlapping(doc_id: str, section_summaries: list[dict]) -> int:
+    """
+    Remove stored section summaries whose page range overlaps any of the
+    regenerated sections. Returns number of summaries deleted.
+    """
+    ranges = [
+        {"start_page": {"$lte": s["end_page"]}, "end_page": {"$gte": s["start_page"]}}
+        for s in section_summaries
+    ]
+    if not ranges:
+        return 0
+    result = collection.delete_many(
+        {"doc_id": doc_id, "is_summary": True, "summary_type": "section", "$or": ranges}
+    )
+    return result.deleted_count
+
+
+# Document.sectionSummaryStatus; isProcessing only tracks whether the doc is queryable
+SECTION_STATUS_PENDING = "pending"
+SECTION_STATUS_RUNNING = "running"
+SECTION_STATUS_DONE = "done"
+SECTION_STATUS_FAILED = "failed"
+SECTION_STATUS_SKIPPED = "skipped"
+
+
+def set_section_summary_status(doc_id: str, status: str) -> None:
+    try:
+        main_collection.update_one({"_id": ObjectId(doc_id)}, {"$set": {"sectionSummaryStatus": status}})
+    except Exception as e:
+        log.error("Error updating sectionSummaryStatus for doc %s: %s", doc_id, e)
+
+
+def fetch_section_breaks(doc_id: str) -> set[int]:
+    """
+    Preferred section start pages: the PDF outline's top entries when the file has
+    one (stored at ingest as sectionBreaks), else pages where the top-level
+    markdown header changes.
+    """
+    try:
+        main_doc = main_collection.find_one({"_id": ObjectId(doc_id)}, {"sectionBreaks": 1}) or {}
+    except Exception as e:
+        log.warning("[SECTION-SUMMARY] Could not read outline for doc %s: %s", doc_id, e)
+        main_doc = {}
+    if main_doc.get("sectionBreaks"):
+        return set(main_doc["sectionBreaks"])
+
+    breaks: set[int] = set()
+    last_header = None
+    cursor = collection.find(
+        {"doc_id": doc_id, "is_summary": False, "page_number": {"$ne": None}, "section_headers.0": {"$exists": True}},
+        {"_id": 0, "page_number": 1, "section_headers": 1},
+    ).sort([("page_number", 1), ("_id", 1)])
+    for d in cursor:
+        header = d["section_headers"][0]
+        if header != last_header:
+            if last_header is not None:
+                breaks.add(d["page_number"])
+            last_header = header
+    return breaks
+
+
+def outline_breaks(doc) -> list[int]:
+    """1-based start pages of the top two levels of a PDF's outline (bookmarks)."""
+    try:
+        toc = doc.get_toc(simple=True)
+    except Exception:
+        return []
+    return sorted({page for level, _title, page in toc if level <= 2 and page > 0})
+
+
+def summarize_document_sections(
+    user_id: str,
+    class_name: str,
+    doc_id: str,
+    file_name: str,
+    only_pages: list[int] | None = None,
+):
+    """
+    RQ job: generate and store section summaries for a document whose chunks are
+    already stored. Enqueued by finalize_document_ingest.
+
+    Args:
+        only_pages: Regenerate only sections touching these pages (incremental re-ingest)
+    """
+    set_section_summary_status(doc_id, SECTION_STATUS_RUNNING)
+    try:
+        section_summaries = generate_section_summaries_parallel(
+            chunks_by_page=fetch_chunks_by_page(doc_id),
+            user_id=user_id,
+            class_name=class_name,
+            doc_id=doc_id,
+            file_name=file_name,
+            only_pages=set(only_pages) if only_pages is not None else None,
+            breaks=fetch_section_breaks(doc_id),
+        )
+        if section_summaries:
+            # Replaces the previous version's sections, or a failed attempt's
+            delete_section_summaries_overlapping(doc_id, section_summaries)
+            stored_count = store_section_summaries(section_summaries)
+            if not stored_count:
+                raise RuntimeError(f"Failed to store section summaries for doc {doc_id}")
+            log.info(f"[SECTION-SUMMARY] Stored {stored_count} section summaries for doc {doc_id}")
+    except Exception:
+        set_section_summary_status(doc_id, SECTION_STATUS_FAILED)
+        raise
+    set_section_summary_status(doc_id, SECTION_STATUS_DONE)
+
+
+# ──────────────────────────────────────────────────────────────
+# INCREMENTAL RE-INGEST
+# ──────────────────────────────────────────────────────────────
+def fetch_existing_chunk_pages(doc_id: str) -> dict[str, int | None]:
+    """
+    Map chunk_hash -> page_number for every chunk already stored for doc_id.
+    Served by the uniq_doc_chunkhash index.
+    """
+    cursor = collection.find(
+        {"doc_id": doc_id, "is_summary": False, "chunk_hash": {"$exists": True}},
+        {"_id": 0, "chunk_hash": 1, "page_number": 1},
+    )
+    return {d["chunk_hash"]: d.get("page_number") for d in cursor}
+
+
+def fetch_chunks_by_page(doc_id: str, pages: set[int] | None = None) -> dict[int, list[str]]:
+    """
+    Rebuild chunks_by_page (page -> chunk texts without header, in insertion order)
+    from the stored chunks, for every page or only *pages*.
+    """
+    chunks_by_page: dict[int, list[str]] = {}
+    query = {"doc_id": doc_id, "is_summary": False, "page_number": {"$ne": None}}
+    if pages is not None:
+        if not pages:
+            return chunks_by_page
+        query["page_number"] = {"$in": sorted(pages)}
+    cursor = collection.find(
+        query,
+        {"_id": 0, "page_number": 1, "original_text": 1, "text": 1},
+    ).sort("_id", 1)
+    for d in cursor:
+        chunks_by_page.setdefault(d["page_number"], []).append(chunk_text(d, with_header=False))
+    return chunks_by_page
+
+
 # ──────────────────────────────────────────────────────────────
 # PRODUCER → CONSUMER INGEST
 # ──────────────────────────────────────────────────────────────
 def stream_chunks_to_atlas(
-    pdf_stream,
+    pdf_source,
     *,                    # force keyword args for clarity
     user_id: str,
     class_id: str,
     doc_id: str,
     file_name: str,
-    batch_chars: int = 8_000,
-) -> tuple[str, list[str], dict[int, list[str]]]:
+    batch_tokens: int | None = None,
+    parser_workers: int | None = None,
+    skip_hashes: set[str] | None = None,
+    skip_pages: set[int] | None = None,
+    on_page_durable=None,
+    page_range: tuple[int, int] | None = None,
+    fingerprint: str | None = None,
+) -> tuple[str, list[str], dict[int, list[str]], dict[str, int | None]]:
     """
-    Parse PDF pages in parallel, push small batches through a queue.
-    Consumer thread embeds + inserts each batch immediately.
-    Returns a tuple: (full_doc_text, summary_parts, chunks_by_page) for downstream summarisation.
+    Extract PDF pages in a process pool, split them in threads and feed chunks
+    into an IngestPipeline (pack → embed × N → write × M).
+    fingerprint is the SHA-256 of the PDF being parsed (for a DOCX, the converted PDF);
+    with it, a parse-cache hit (parse_cache.py) replaces extraction and splitting, and a full parse is stored.
+    pdf_source is a local file path (preferred; never loaded into memory) or a PDF stream.
+    parser_workers overrides config.INGEST_PARSER_WORKERS for page extraction.
+    skip_hashes are chunk hashes already stored for this doc (incremental re-ingest).
+    skip_pages are 1-based pages made durable by an earlier attempt; they are not
+    rendered at all. on_page_durable(page_number, chunk_hashes) fires as each page is fully written.
+    page_range=(first, last) limits the ingest to those 1-based pages (fan-out sub-jobs).
+    Returns a tuple: (full_doc_text, summary_parts, chunks_by_page, chunk_pages) for downstream summarisation.
     chunks_by_page maps page numbers to original chunk texts for section summary generation.
+    chunk_pages maps every chunk_hash in the new version to its page number.
     """
-    q: SimpleQueue[list[tuple[str, dict]]] = SimpleQueue()
-    # Ingest metrics counters
+    # Ingest metrics counters (embed/insert counters live in the pipeline)
     pages_total = 0
     pages_empty = 0
     chunks_produced = 0
-    chunks_inserted = 0
-    duplicates_skipped = 0
-    embed_batches = 0
-    embed_latency_ms_total = 0
-    insert_retries_total = 0
     total_chars = 0
     max_chunk_chars = 0
 
-    # ---------------- consumer ----------------
-    # ---------------- consumer ----------------
-    def consumer():
-        nonlocal embed_batches, embed_latency_ms_total, duplicates_skipped, chunks_inserted, insert_retries_total
-        while True:
-            batch = q.get()
-            if batch is None:            # poison‑pill
-                break
-            texts, metas = zip(*batch)
-            log.info("Embedding + inserting %d texts", len(texts))
-
-            # ① async embed (non‑blocking)
-            tokens_needed = sum(int(len(t) * TOK_PER_CHAR) for t in texts)
-            acquire_tokens(tokens_needed)          # NEW guard
-            t0 = time.time()
-            vectors = embed_texts_sync(list(texts))
-            embed_batches += 1
-            embed_latency_ms_total += int((time.time() - t0) * 1000)
-
-
-            # ② build docs and insert directly (since from_embeddings not present)
-            docs = []
-            seen_hashes: set[str] = set()
-            for vec, txt, meta_d in zip(vectors, texts, metas):
-                doc_record = meta_d.copy()
-                doc_record["text"]      = txt
-                doc_record["embedding"] = vec
-                # Stable hash per doc for dedup within this ingest
-                norm = " ".join(txt.split()).lower()
-                h = hashlib.sha1(norm.encode("utf-8")).hexdigest()
-                if h in seen_hashes:
-                    duplicates_skipped += 1
-                    continue
-                seen_hashes.add(h)
-                doc_record["chunk_hash"] = h
-                docs.append(doc_record)
-
-            if docs:
-                attempts = 0
-                while True:
-                    try:
-                        collection.insert_many(docs)
-                        chunks_inserted += len(docs)
-                        break
-                    except Exception as e:
-                        attempts += 1
-                        insert_retries_total += 1
-                        if attempts > 3:
-                            log.error("insert_many failed after retries: %s", e)
-                            break
-                        time.sleep(0.75 * attempts)
-
-    t_cons = threading.Thread(target=consumer, daemon=True)
-    t_cons.start()
-
     # ---------------- producer (page parsing) ----------------
-    doc = pymupdf.open(stream=pdf_stream, filetype="pdf")
+    if isinstance(pdf_source, (str, os.PathLike)):
+        pdf_input = os.fspath(pdf_source)
+    else:
+        pdf_input = pdf_source.getvalue() if hasattr(pdf_source, "getvalue") else pdf_source.read()
+    parser_workers = resolve_parser_workers(parser_workers)
 
     headers           = [("#","H1"),("##","H2"),("###","H3"),("####","H4"),("#####","H5"),("######","H6")]
     md_splitter       = MarkdownHeaderTextSplitter(headers)
-    semantic_splitter = SemanticChunker(embeddings, breakpoint_threshold_type="standard_deviation")
+    # "lexical" finds boundaries locally; "embedding" is the original SemanticChunker path
+    use_embedding_splitter = config.SEMANTIC_SPLITTER == "embedding"
+    if use_embedding_splitter:
+        semantic_splitter = SemanticChunker(embeddings, breakpoint_threshold_type="standard_deviation")
+    else:
+        semantic_splitter = LexicalSemanticSplitter()
+
+    # ---------- parse cache: identical uploads skip extraction (and splitting) ----------
+    extractor = f"pymupdf-{getattr(pymupdf, 'VersionBind', '')}"
+    splitter_sig = config.SEMANTIC_SPLITTER
+    if not use_embedding_splitter:
+        splitter_sig += f"-v{LexicalSemanticSplitter.version}"
+    cache_key = parse_cache.cache_key(fingerprint, page_range) if fingerprint else None
+    cached = parse_cache.lookup(cache_key) if cache_key else None
+    if cached is not None and cached.get("extractor") != extractor:
+        cached = None
+    cached_md = {int(i): md for i, md in cached["pages"].items()} if cached else None
+    cached_chunks = (
+        {int(i): [(piece, headers) for piece, headers in items] for i, items in cached["chunks"].items()}
+        if cached and cached.get("splitter") == splitter_sig else None
+    )
 
-    meta   = doc.metadata or {}
-    title  = meta.get("title",  "Unknown")
-    author = meta.get("author", "Unknown")
+    if cached is not None:
+        page_count = cached["page_count"]
+        title, author, breaks = cached["title"], cached["author"], cached["breaks"]
+    else:
+        doc = open_pdf(pdf_input)
+        page_count = len(doc)
+        meta   = doc.metadata or {}
+        title  = meta.get("title",  "Unknown")
+        author = meta.get("author", "Unknown")
+        breaks = outline_breaks(doc) if page_range is None or page_range[0] == 1 else []
+        doc.close()   # page text is rendered by pdf_extractor workers
+    if breaks:
+        # Section summaries start sections at outline entries where possible
+        try:
+            main_collection.update_one({"_id": ObjectId(doc_id)}, {"$set": {"sectionBreaks": breaks}})
+        except Exception as e:
+            log.warning("Could not store outline for doc %s: %s", doc_id, e)
 
     summary_parts: list[str] = []
     chunks_by_page: dict[int, list[str]] = {}  # Track original chunks by page for section summaries
-    batch, char_sum = [], 0
-
-    def flush_batch():
-        nonlocal char_sum
-        if batch:
-            q.put(batch.copy())
-            batch.clear(); char_sum = 0
-
-    def parse_page(idx: int):
-        nonlocal pages_total, pages_empty, chunks_produced, total_chars, max_chunk_chars, chunks_by_page
-        page_md = doc.load_page(idx).get_text("markdown")
-        pages_total += 1
-        if not page_md.strip():
-            log.warning("Empty markdown on page %d; skipping (extracted=false)", idx + 1)
-            pages_empty += 1
-            return []
-        page_items = []
-        docs = md_splitter.split_text(page_md) or RecursiveCharacterTextSplitter(
-            chunk_size=1200, chunk_overlap=120
-        ).create_documents(page_md)
+    # What a full parse stores in the cache (page index -> markdown / chunks)
+    parsed_md: dict[int, str] = {}
+    parsed_chunks: dict[int, list[tuple[str, list[str]]]] = {}
+
+    def split_page(page_md: str) -> list[tuple[str, list[str]]]:
+        """(chunk text, section headers) for one page of markdown."""
+        out = []
+        with span("markdown_split"):
+            docs = md_splitter.split_text(page_md) or RecursiveCharacterTextSplitter(
+                chunk_size=1200, chunk_overlap=120
+            ).create_documents(page_md)
         for d in docs:
             text = d.page_content.strip()
             if not text:
                 continue
             if len(text) > 2000:
-                # Guard SemanticChunker embedding calls with the same token limiter
-                acquire_tokens(int(len(text) * TOK_PER_CHAR))
-                pieces = semantic_splitter.split_text(text)
+                if use_embedding_splitter and get_embedding_service().remote:
+                    # Guard SemanticChunker embedding calls with the same token limiter
+                    acquire_tokens(count_tokens(text, model=config.EMBEDDING_MODEL))
+                with span("semantic_split"):
+                    pieces = semantic_splitter.split_text(text)
             else:
                 pieces = [text]
-            for piece in pieces:
-                summary_parts.append(piece)
-                # Track chunks by page for section summary generation
-                page_num = idx + 1
-                if page_num not in chunks_by_page:
-                    chunks_by_page[page_num] = []
-                chunks_by_page[page_num].append(piece)
-                # Extract section headers from markdown metadata if available
-                section_headers = d.metadata.get("Header 1", []) if hasattr(d, "metadata") else []
-                if isinstance(section_headers, str):
-                    section_headers = [section_headers]
+            # Extract section headers from markdown metadata if available
+            section_headers = d.metadata.get("Header 1", []) if hasattr(d, "metadata") else []
+            if isinstance(section_headers, str):
+                section_headers = [section_headers]
+            out.extend((piece, section_headers) for piece in pieces)
+        return out
+
+    def parse_page(idx: int, page_md: str):
+        nonlocal pages_total, pages_empty, chunks_produced, total_chars, max_chunk_chars
+        pages_total += 1
+        parsed_md[idx] = page_md
+        if not page_md.strip():
+            log.warning("Empty markdown on page %d; skipping (extracted=false)", idx + 1)
+            pages_empty += 1
+            return []
+        pieces = cached_chunks[idx] if cached_chunks is not None else split_page(page_md)
+        parsed_chunks[idx] = pieces
+        page_items = []
+        for piece, section_headers in pieces:
+            summary_parts.append(piece)
+            # Track chunks by page for section summary generation
+            page_num = idx + 1
+            if page_num not in chunks_by_page:
+                chunks_by_page[page_num] = []
+            chunks_by_page[page_num].append(piece)
 
-                # Add contextual header to chunk for improved retrieval (P0)
-                contextualized_text, original_text = add_context_to_chunk(
-                    chunk_text=piece,
-                    doc_title=file_name,
-                    section_headers=section_headers if section_headers else None,
-                    doc_type="pdf",
-                    page_number=idx + 1
-                )
+            # Add contextual header to chunk for improved retrieval (P0)
+            contextualized_text, original_text = add_context_to_chunk(
+                chunk_text=piece,
+                doc_title=file_name,
+                section_headers=section_headers if section_headers else None,
+                doc_type="pdf",
+                page_number=idx + 1
+            )
 
-                page_items.append(
-                    (
-                        contextualized_text,  # This gets embedded
-                        {
-                            "file_name":  file_name,
-                            "title":      title,
-                            "author":     author,
-                            "user_id":    user_id,
-                            "class_id":   class_id,
-                            "doc_id":     doc_id,
-                            "is_summary": False,
-                            "page_number": idx + 1,
-                            "source_type": "pdf",
-                            "original_text": original_text,  # For display without header
-                            "section_headers": section_headers if section_headers else [],
-                        },
-                    )
+            page_items.append(
+                (
+                    contextualized_text,  # This gets embedded
+                    {
+                        "file_name":  file_name,
+                        "title":      title,
+                        "author":     author,
+                        "user_id":    user_id,
+                        "class_id":   class_id,
+                        "doc_id":     doc_id,
+                        "is_summary": False,
+                        "page_number": idx + 1,
+                        "source_type": "pdf",
+                        "text": original_text,   # stored without the header
+                        "ctx_header": contextualized_text != original_text,
+                        "section_headers": section_headers if section_headers else [],
+                    },
                 )
-                chunks_produced += 1
-                total_chars += len(piece)
-                if len(piece) > max_chunk_chars:
-                    max_chunk_chars = len(piece)
+            )
+            chunks_produced += 1
+            total_chars += len(piece)
+            if len(piece) > max_chunk_chars:
+                max_chunk_chars = len(piece)
         return page_items
 
-    with ThreadPoolExecutor(max_workers=os.cpu_count() or 2) as ex:
-        futures = [ex.submit(parse_page, i) for i in range(len(doc))]
-        for fut in as_completed(futures):
+    # Pages arrive in order from the extractor; splitting (which calls the
+    # embeddings API when SEMANTIC_SPLITTER=embedding) runs in threads over a bounded window.
+    split_workers = os.cpu_count() or 2
+    pending: deque = deque()
+
+    pipeline = IngestPipeline(
+        embed_fn=embed_batch,
+        collection=collection,
+        cache=get_embedding_cache(),
+        skip_hashes=skip_hashes,
+        batch_tokens=batch_tokens,
+        on_page_durable=on_page_durable,
+        reuse_class_id=class_id if config.DUP_CHUNK_REUSE_ENABLED else None,
+    )
+
+    def drain(limit: int):
+        while len(pending) > limit:
+            idx, fut = pending.popleft()
             for text, meta_d in fut.result():
-                batch.append((text, meta_d))
-                char_sum += len(text)
-                if char_sum >= batch_chars:
-                    flush_batch()
-
-    doc.close()
-    flush_batch()    # final producer flush
-    q.put(None)      # stop consumer
-    t_cons.join()
+                pipeline.put(text, meta_d)
+            pipeline.end_page(idx + 1)
+
+    skip_idx = {p - 1 for p in skip_pages} if skip_pages else set()
+    if page_range is not None:
+        first, last = page_range
+        skip_idx |= {i for i in range(page_count) if not first - 1 <= i < last}
+    if cached_md is not None:
+        pages_iter = ((i, cached_md.get(i, "")) for i in range(page_count) if i not in skip_idx)
+    else:
+        pages_iter = iter_page_markdown(pdf_input, page_count, workers=parser_workers, skip_pages=skip_idx or None)
+    try:
+        with ThreadPoolExecutor(max_workers=split_workers) as ex:
+            for idx, page_md in pages_iter:
+                pending.append((idx, ex.submit(parse_page, idx, page_md)))
+                drain(split_workers * 2)
+            drain(0)
+    finally:
+        pipeline_metrics = pipeline.close()   # flush + drain embed/write stages
+
+    # Store the parse unless it was a full hit, or pages were skipped (resume)
+    if cache_key and not skip_pages and cached_chunks is None:
+        parse_cache.store(cache_key, {
+            "extractor": extractor,
+            "splitter": splitter_sig,
+            "title": title,
+            "author": author,
+            "page_count": page_count,
+            "breaks": breaks,
+            "pages": {str(i): md for i, md in parsed_md.items()},
+            "chunks": {str(i): [[piece, headers] for piece, headers in items] for i, items in parsed_chunks.items()},
+        })
+
     # Emit final metrics for this ingest
     try:
         metrics = {
             "doc_id": doc_id,
+            "parser_workers": parser_workers,
+            "parse_cache": "chunks" if cached_chunks is not None else "markdown" if cached_md is not None else "miss",
             "pages_total": pages_total,
             "pages_empty": pages_empty,
             "chunks_produced": chunks_produced,
-            "chunks_inserted": chunks_inserted,
-            "duplicates_skipped": duplicates_skipped,
-            "embed_batches": embed_batches,
-            "embed_latency_ms_total": embed_latency_ms_total,
-            "insert_retries_total": insert_retries_total,
+            **pipeline_metrics,
             "total_chars": total_chars,
             "max_chunk_chars": max_chunk_chars,
+            "tpm": get_tpm_limiter().utilization(),
         }
         log.info("[METRICS] ingest %s", json.dumps(metrics))
     except Exception:
         pass
     log.info("Streaming ingest complete")
 
-    return " ".join(summary_parts), summary_parts, chunks_by_page
+    return " ".join(summary_parts), summary_parts, chunks_by_page, pipeline.chunk_pages
 
 
 # ──────────────────────────────────────────────────────────────
@@ -616,145 +865,88 @@ def stream_docx_chunks_to_atlas(
     class_id: str,
     doc_id: str,
     file_name: str,
-    batch_chars: int = 8_000,
-) -> tuple[str, list[str], dict[int, list[str]]]:
+    batch_tokens: int | None = None,
+    skip_hashes: set[str] | None = None,
+    skip_pages: set[int] | None = None,
+    on_page_durable=None,
+) -> tuple[str, list[str], dict[int, list[str]], dict[str, int | None]]:
     """
-    Process DOCX paragraphs and push batches through a queue.
-    Consumer thread embeds + inserts each batch immediately.
-    Returns a tuple: (full_doc_text, summary_parts, chunks_by_page) for downstream summarization.
+    Process DOCX paragraphs and feed chunks into an IngestPipeline
+    (pack → embed × N → write × M), shared with the PDF path.
+    skip_hashes are chunk hashes already stored for this doc (incremental re-ingest).
+    skip_pages / on_page_durable work as in stream_chunks_to_atlas, keyed by paragraph number.
+    Returns a tuple: (full_doc_text, summary_parts, chunks_by_page, chunk_pages) for downstream summarization.
     chunks_by_page maps paragraph numbers to original chunk texts for section summary generation.
+    chunk_pages maps every chunk_hash in the new version to its paragraph number.
     """
-    q: SimpleQueue[list[tuple[str, dict]]] = SimpleQueue()
-
-    # Ingest metrics counters
+    # Ingest metrics counters (embed/insert counters live in the pipeline)
     paragraphs_total = 0
     chunks_produced = 0
-    chunks_inserted = 0
-    duplicates_skipped = 0
-    embed_batches = 0
-    embed_latency_ms_total = 0
-    insert_retries_total = 0
     total_chars = 0
     max_chunk_chars = 0
 
-    # ---------------- consumer (identical to PDF) ----------------
-    def consumer():
-        nonlocal embed_batches, embed_latency_ms_total, duplicates_skipped, chunks_inserted, insert_retries_total
-        while True:
-            batch = q.get()
-            if batch is None:  # poison-pill
-                break
-            texts, metas = zip(*batch)
-            log.info("Embedding + inserting %d texts", len(texts))
-
-            # ① async embed
-            tokens_needed = sum(int(len(t) * TOK_PER_CHAR) for t in texts)
-            acquire_tokens(tokens_needed)
-            t0 = time.time()
-            vectors = embed_texts_sync(list(texts))
-            embed_batches += 1
-            embed_latency_ms_total += int((time.time() - t0) * 1000)
-
-            # ② build docs and insert
-            docs = []
-            seen_hashes: set[str] = set()
-            for vec, txt, meta_d in zip(vectors, texts, metas):
-                doc_record = meta_d.copy()
-                doc_record["text"] = txt
-                doc_record["embedding"] = vec
-                # Dedup hash
-                norm = " ".join(txt.split()).lower()
-                h = hashlib.sha1(norm.encode("utf-8")).hexdigest()
-                if h in seen_hashes:
-                    duplicates_skipped += 1
-                    continue
-                seen_hashes.add(h)
-                doc_record["chunk_hash"] = h
-                docs.append(doc_record)
-
-            if docs:
-                attempts = 0
-                while True:
-                    try:
-                        collection.insert_many(docs)
-                        chunks_inserted += len(docs)
-                        break
-                    except Exception as e:
-                        attempts += 1
-                        insert_retries_total += 1
-                        if attempts > 3:
-                            log.error("insert_many failed after retries: %s", e)
-                            break
-                        time.sleep(0.75 * attempts)
-
-    t_cons = threading.Thread(target=consumer, daemon=True)
-    t_cons.start()
-
     # ---------------- producer (DOCX paragraph parsing) ----------------
     try:
-        # Extract metadata
+        # Metadata, numbered paragraphs (with heading hierarchy) and stats from one parse
         docx_stream.seek(0)
-        metadata = extract_docx_metadata(docx_stream)
+        t_parse = time.perf_counter()
+        content = extract_docx_content(docx_stream)
+        parse_ms = int((time.perf_counter() - t_parse) * 1000)
+        metadata = content["metadata"]
         title = metadata.get("title", "Unknown")
         author = metadata.get("author", "Unknown")
-
-        # Extract paragraphs with sequential numbering
-        docx_stream.seek(0)
-        paragraphs_with_numbers = extract_docx_paragraphs(docx_stream)
-
-        # Get stats for logging
-        docx_stream.seek(0)
-        stats = get_docx_stats(docx_stream)
-        log.info(f"DOCX stats: {stats}")
+        paragraphs_with_numbers = content["paragraphs"]
+        log.info(f"DOCX stats: {content['stats']} (parsed in {parse_ms} ms)")
 
     except Exception as e:
         log.error(f"Failed to extract DOCX content: {e}")
-        q.put(None)  # Stop consumer
-        t_cons.join()
         raise
 
     summary_parts: list[str] = []
     chunks_by_page: dict[int, list[str]] = {}  # Track original chunks by paragraph for section summaries
-    batch, char_sum = [], 0
-
-    def flush_batch():
-        nonlocal char_sum
-        if batch:
-            q.put(batch.copy())
-            batch.clear()
-            char_sum = 0
-
-    # Process each paragraph
-    for paragraph_text, paragraph_num in paragraphs_with_numbers:
-        paragraphs_total += 1
-
-        # Use RecursiveCharacterTextSplitter for long paragraphs
-        if len(paragraph_text) > 1200:
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1200, chunk_overlap=120
-            )
-            pieces = splitter.split_text(paragraph_text)
-        else:
-            pieces = [paragraph_text]
+    pipeline = IngestPipeline(
+        embed_fn=embed_batch,
+        collection=collection,
+        cache=get_embedding_cache(),
+        skip_hashes=skip_hashes,
+        batch_tokens=batch_tokens,
+        on_page_durable=on_page_durable,
+        reuse_class_id=class_id if config.DUP_CHUNK_REUSE_ENABLED else None,
+    )
 
-        for piece in pieces:
-            summary_parts.append(piece)
-            # Track chunks by paragraph for section summary generation
-            if paragraph_num not in chunks_by_page:
-                chunks_by_page[paragraph_num] = []
-            chunks_by_page[paragraph_num].append(piece)
+    try:
+        # Process each paragraph
+        for paragraph_text, paragraph_num, section_headers in paragraphs_with_numbers:
+            paragraphs_total += 1
+            if skip_pages and paragraph_num in skip_pages:
+                continue
 
-            # Add contextual header to chunk for improved retrieval (P0)
-            contextualized_text, original_text = add_context_to_chunk(
-                chunk_text=piece,
-                doc_title=file_name,
-                section_headers=None,  # DOCX paragraph extraction doesn't preserve headers
-                doc_type="docx",
-                page_number=paragraph_num
-            )
+            # Use RecursiveCharacterTextSplitter for long paragraphs
+            if len(paragraph_text) > 1200:
+                splitter = RecursiveCharacterTextSplitter(
+                    chunk_size=1200, chunk_overlap=120
+                )
+                pieces = splitter.split_text(paragraph_text)
+            else:
+                pieces = [paragraph_text]
 
-            batch.append(
-                (
+            for piece in pieces:
+                summary_parts.append(piece)
+                # Track chunks by paragraph for section summary generation
+                if paragraph_num not in chunks_by_page:
+                    chunks_by_page[paragraph_num] = []
+                chunks_by_page[paragraph_num].append(piece)
+
+                # Add contextual header to chunk for improved retrieval (P0)
+                contextualized_text, original_text = add_context_to_chunk(
+                    chunk_text=piece,
+                    doc_title=file_name,
+                    section_headers=section_headers or None,
+                    doc_type="docx",
+                    page_number=paragraph_num
+                )
+
+                pipeline.put(
                     contextualized_text,  # This gets embedded
                     {
                         "file_name": file_name,
@@ -766,23 +958,18 @@ def stream_docx_chunks_to_atlas(
                         "is_summary": False,
                         "page_number": paragraph_num,  # Store paragraph number as page_number
                         "source_type": "docx",
-                        "original_text": original_text,  # For display without header
-                        "section_headers": [],
+                        "text": original_text,   # stored without the header
+                        "ctx_header": contextualized_text != original_text,
+                        "section_headers": section_headers,
                     },
                 )
-            )
-            chunks_produced += 1
-            total_chars += len(piece)
-            if len(piece) > max_chunk_chars:
-                max_chunk_chars = len(piece)
-
-            char_sum += len(piece)
-            if char_sum >= batch_chars:
-                flush_batch()
-
-    flush_batch()  # final producer flush
-    q.put(None)    # stop consumer
-    t_cons.join()
+                chunks_produced += 1
+                total_chars += len(piece)
+                if len(piece) > max_chunk_chars:
+                    max_chunk_chars = len(piece)
+            pipeline.end_page(paragraph_num)
+    finally:
+        pipeline_metrics = pipeline.close()   # flush + drain embed/write stages
 
     # Emit final metrics
     try:
@@ -790,21 +977,19 @@ def stream_docx_chunks_to_atlas(
             "doc_id": doc_id,
             "format": "docx",
             "paragraphs_total": paragraphs_total,
+            "parse_ms": parse_ms,
             "chunks_produced": chunks_produced,
-            "chunks_inserted": chunks_inserted,
-            "duplicates_skipped": duplicates_skipped,
-            "embed_batches": embed_batches,
-            "embed_latency_ms_total": embed_latency_ms_total,
-            "insert_retries_total": insert_retries_total,
+            **pipeline_metrics,
             "total_chars": total_chars,
             "max_chunk_chars": max_chunk_chars,
+            "tpm": get_tpm_limiter().utilization(),
         }
         log.info("[METRICS] docx_ingest %s", json.dumps(metrics))
     except Exception:
         pass
 
     log.info("DOCX streaming ingest complete")
-    return " ".join(summary_parts), summary_parts, chunks_by_page
+    return " ".join(summary_parts), summary_parts, chunks_by_page, pipeline.chunk_pages
 
 
 # ──────────────────────────────────────────────────────────────
@@ -815,6 +1000,8 @@ def load_document_data(user_id: str, class_name: str, s3_key: str, doc_id: str):
     Load and process a document (PDF or DOCX) from S3.
 
     Detects file type from S3 key extension and routes to appropriate processor.
+    PDFs with at least config.INGEST_FANOUT_MIN_PAGES pages are split into
+    page-range sub-jobs (see fan_out_ingest) instead of being processed here.
     """
     # ---------- file type detection ----------
     file_ext = s3_key.lower().split('.')[-1]
@@ -824,29 +1011,157 @@ def load_document_data(user_id: str, class_name: str, s3_key: str, doc_id: str):
         log.error(f"Unsupported file type: {file_ext} for {s3_key}")
         return
 
-    # ---------- download from S3 ----------
+    # ---------- verify document exists in DB ----------
+    if not main_collection.find_one({"_id": ObjectId(doc_id)}):
+        log.error("No document with _id=%s", doc_id)
+        return
+
+    # ---------- download from S3 (ranged GETs into a temp file) ----------
     try:
-        obj = s3_client.get_object(
-            Bucket=config.AWS_S3_BUCKET_NAME, Key=s3_key
-        )
+        local_path = download_to_tempfile(s3_client, config.AWS_S3_BUCKET_NAME, s3_key)
     except Exception:
         log.error("Error downloading %s from S3", s3_key, exc_info=True)
-        return
+        raise   # let RQ retry transient S3 failures
 
-    if obj["ContentLength"] == 0:
+    if local_path is None:
         log.warning("S3 file %s is empty", s3_key)
         return
 
-    # ---------- verify document exists in DB ----------
-    file_stream = BytesIO(obj["Body"].read())
-    file_stream.seek(0)
+    try:
+        fingerprint = file_sha256(local_path)
+        page_count = fanout_page_count(local_path, file_ext)
+        if page_count:
+            fan_out_ingest(
+                user_id=user_id,
+                class_name=class_name,
+                s3_key=s3_key,
+                doc_id=doc_id,
+                fingerprint=fingerprint,
+                page_count=page_count,
+            )
+        else:
+            ingest_local_document(
+                local_path,
+                user_id=user_id,
+                class_name=class_name,
+                s3_key=s3_key,
+                doc_id=doc_id,
+                file_ext=file_ext,
+                fingerprint=fingerprint,
+            )
+    finally:
+        os.remove(local_path)
 
-    if not main_collection.find_one({"_id": ObjectId(doc_id)}):
-        log.error("No document with _id=%s", doc_id)
+
+def ingest_local_document(
+    local_path: str,
+    *,
+    user_id: str,
+    class_name: str,
+    s3_key: str,
+    doc_id: str,
+    file_ext: str,
+    fingerprint: str | None = None,
+):
+    """
+    Chunk, embed and summarise a document that has been downloaded to local_path.
+    PDFs are read from disk by pymupdf; DOCX files are opened as file handles.
+    fingerprint is the file's SHA-256 (computed here if not given) and keys the checkpoint.
+    """
+    ckpt, previous = open_ingest_checkpoint(doc_id, fingerprint or file_sha256(local_path))
+
+    result = ingest_document_chunks(
+        local_path,
+        user_id=user_id,
+        class_name=class_name,
+        s3_key=s3_key,
+        doc_id=doc_id,
+        file_ext=file_ext,
+        ckpt=ckpt,
+    )
+    if result is None:
         return
+    _, chunk_pages, incomplete = result
+    if incomplete:
+        retry_incomplete_pages(doc_id, incomplete)
+
+    finalize_document_ingest(
+        user_id=user_id,
+        class_name=class_name,
+        doc_id=doc_id,
+        file_name=os.path.basename(s3_key),
+        ckpt=ckpt,
+        previous=previous,
+        chunk_pages={**ckpt.durable_chunks(), **chunk_pages},
+        incomplete=incomplete,
+    )
+
 
+# ──────────────────────────────────────────────────────────────
+# INGEST PHASES (shared by single-job and fanned-out ingests)
+# ──────────────────────────────────────────────────────────────
+def open_ingest_checkpoint(doc_id: str, fingerprint: str) -> tuple[IngestCheckpoint, dict[str, int | None]]:
+    """
+    Open (or resume) the checkpoint for doc_id.
+
+    On a fresh start the chunks already stored for the doc are recorded as the
+    incremental re-ingest baseline, so the diff survives a resume.
+
+    Returns:
+        (checkpoint, previous_chunks) - previous_chunks maps chunk_hash -> page of
+        the earlier version ({} when this is a first ingest)
+    """
+    ckpt = IngestCheckpoint(get_redis(), doc_id, fingerprint)
+    if ckpt.resumed:
+        previous = ckpt.previous_chunks() if ckpt.incremental else {}
+        log.info("[CHECKPOINT] Resuming doc %s at stage %s", doc_id, ckpt.stage)
+    else:
+        previous = fetch_existing_chunk_pages(doc_id) if config.INCREMENTAL_REINGEST_ENABLED else {}
+        ckpt.set_previous_chunks(previous)
+    if previous:
+        log.info("[INGEST] Doc %s already has %d chunks; running incremental re-ingest", doc_id, len(previous))
+    return ckpt, previous
+
+
+def ingest_document_chunks(
+    local_path: str,
+    *,
+    user_id: str,
+    class_name: str,
+    s3_key: str,
+    doc_id: str,
+    file_ext: str,
+    ckpt: IngestCheckpoint,
+    page_range: tuple[int, int] | None = None,
+):
+    """
+    Parse, embed and store the chunks of a document, or of pages
+    page_range=(first, last) of a PDF. Pages the checkpoint records as durable are
+    skipped and newly durable pages are recorded as they land.
+
+    Returns:
+        (chunks_by_page, chunk_pages, incomplete_pages), or None for an unsupported type
+    """
     file_name = os.path.basename(s3_key)
 
+    done_pages = ckpt.durable_pages() if ckpt.resumed else set()
+    durable_now: set[int] = set()
+
+    def on_page_durable(page_number: int, chunk_hashes: list[str]):
+        durable_now.add(page_number)
+        ckpt.mark_page_durable(page_number, chunk_hashes)
+
+    # Chunks already in Mongo (the previous version, or an interrupted attempt's)
+    # are skipped by hash, so nothing is embedded or inserted twice
+    stored = fetch_existing_chunk_pages(doc_id) if (ckpt.resumed or ckpt.incremental) else {}
+    if done_pages:
+        log.info("[CHECKPOINT] Doc %s: skipping %d durable pages", doc_id, len(done_pages))
+    resume_kwargs = dict(
+        skip_hashes=set(stored),
+        skip_pages=done_pages,
+        on_page_durable=on_page_durable,
+    )
+
     # ---------- route to format-specific processor ----------
     if file_ext == 'docx':
         log.info(f"Processing DOCX: {file_name}")
@@ -854,107 +1169,189 @@ def load_document_data(user_id: str, class_name: str, s3_key: str, doc_id: str):
         # Convert DOCX to PDF for viewing (with citation navigation)
         pdf_s3_key = None
         pdf_buffer = None
-        try:
+        with open(local_path, "rb") as file_stream:
             cloudmersive_api_key = os.getenv("CLOUDMERSIVE_API_KEY")
-            if cloudmersive_api_key:
-                log.info("[DOCX-CONVERSION] Converting DOCX to PDF using Cloudmersive")
-                file_stream.seek(0)
-                pdf_buffer = convert_docx_to_pdf_cloudmersive(file_stream, cloudmersive_api_key)
-
-                # Upload converted PDF to S3
-                base_name = os.path.splitext(s3_key)[0]  # Remove .docx extension
-                pdf_s3_key = f"{base_name}-converted.pdf"
-
-                log.info(f"[DOCX-CONVERSION] Uploading converted PDF to S3: {pdf_s3_key}")
-                s3_client.put_object(
-                    Bucket=config.AWS_S3_BUCKET_NAME,
-                    Key=pdf_s3_key,
-                    Body=pdf_buffer.getvalue(),
-                    ContentType="application/pdf"
-                )
-                log.info(f"[DOCX-CONVERSION] Successfully uploaded PDF to S3: {pdf_s3_key}")
+            if pool_enabled():
+                # First choice: warm local LibreOffice (no cold start, no remote round trip)
+                try:
+                    log.info("[DOCX-CONVERSION] Converting DOCX to PDF using the LibreOffice pool")
+                    pdf_buffer = convert_docx_to_pdf_pooled(local_path)
+                except Exception as e:
+                    log.error(f"[DOCX-CONVERSION] LibreOffice pool conversion failed: {e}")
+            try:
+                if pdf_buffer is None and cloudmersive_api_key:
+                    log.info("[DOCX-CONVERSION] Converting DOCX to PDF using Cloudmersive")
+                    file_stream.seek(0)
+                    pdf_buffer = convert_docx_to_pdf_cloudmersive(file_stream, cloudmersive_api_key)
+
+                if pdf_buffer is not None:
+                    # Upload converted PDF to S3
+                    base_name = os.path.splitext(s3_key)[0]  # Remove .docx extension
+                    pdf_s3_key = f"{base_name}-converted.pdf"
+
+                    log.info(f"[DOCX-CONVERSION] Uploading converted PDF to S3: {pdf_s3_key}")
+                    s3_client.put_object(
+                        Bucket=config.AWS_S3_BUCKET_NAME,
+                        Key=pdf_s3_key,
+                        Body=pdf_buffer.getvalue(),
+                        ContentType="application/pdf"
+                    )
+                    log.info(f"[DOCX-CONVERSION] Successfully uploaded PDF to S3: {pdf_s3_key}")
 
-                # Update document record with pdfS3Key
-                main_collection.update_one(
-                    {"_id": ObjectId(doc_id)},
-                    {"$set": {"pdfS3Key": pdf_s3_key}}
+                    # Update document record with pdfS3Key
+                    main_collection.update_one(
+                        {"_id": ObjectId(doc_id)},
+                        {"$set": {"pdfS3Key": pdf_s3_key}}
+                    )
+                    log.info(f"[DOCX-CONVERSION] Updated document {doc_id} with pdfS3Key")
+                else:
+                    log.warning("[DOCX-CONVERSION] LibreOffice pool unavailable and CLOUDMERSIVE_API_KEY not set - skipping PDF conversion")
+            except Exception as e:
+                log.error(f"[DOCX-CONVERSION] Failed to convert DOCX to PDF: {e}", exc_info=True)
+                # pdf_buffer will remain None, fall back to DOCX processing
+
+            # Process converted PDF for RAG (if conversion succeeded) or fall back to DOCX
+            if pdf_buffer is not None:
+                log.info("[DOCX-CONVERSION] Processing converted PDF for text extraction and chunking")
+                pdf_buffer.seek(0)
+                full_doc_text, parts, chunks_by_page, chunk_pages = stream_chunks_to_atlas(
+                    pdf_buffer,
+                    user_id=user_id,
+                    class_id=class_name,
+                    doc_id=doc_id,
+                    file_name=file_name,
+                    # Keyed by the converted PDF: LibreOffice and Cloudmersive paginate
+                    # differently, and cached page numbers must match pdfS3Key
+                    fingerprint=hashlib.sha256(pdf_buffer.getbuffer()).hexdigest(),
+                    **resume_kwargs,
                 )
-                log.info(f"[DOCX-CONVERSION] Updated document {doc_id} with pdfS3Key")
             else:
-                log.warning("[DOCX-CONVERSION] CLOUDMERSIVE_API_KEY not set - skipping PDF conversion")
-        except Exception as e:
-            log.error(f"[DOCX-CONVERSION] Failed to convert DOCX to PDF: {e}", exc_info=True)
-            # pdf_buffer will remain None, fall back to DOCX processing
-
-        # Process converted PDF for RAG (if conversion succeeded) or fall back to DOCX
-        if pdf_buffer is not None:
-            log.info(f"[DOCX-CONVERSION] Processing converted PDF for text extraction and chunking")
-            pdf_buffer.seek(0)
-            full_doc_text, parts, chunks_by_page = stream_chunks_to_atlas(
-                pdf_buffer,
-                user_id=user_id,
-                class_id=class_name,
-                doc_id=doc_id,
-                file_name=file_name,
-            )
-        else:
-            log.warning(f"[DOCX-CONVERSION] PDF conversion failed or disabled - falling back to DOCX processing")
-            file_stream.seek(0)
-            full_doc_text, parts, chunks_by_page = stream_docx_chunks_to_atlas(
-                file_stream,
-                user_id=user_id,
-                class_id=class_name,
-                doc_id=doc_id,
-                file_name=file_name,
-            )
+                log.warning("[DOCX-CONVERSION] PDF conversion failed or disabled - falling back to DOCX processing")
+                file_stream.seek(0)
+                full_doc_text, parts, chunks_by_page, chunk_pages = stream_docx_chunks_to_atlas(
+                    file_stream,
+                    user_id=user_id,
+                    class_id=class_name,
+                    doc_id=doc_id,
+                    file_name=file_name,
+                    **resume_kwargs,
+                )
     elif file_ext == 'pdf':
         log.info(f"Processing PDF: {file_name}")
-        full_doc_text, parts, chunks_by_page = stream_chunks_to_atlas(
-            file_stream,
+        full_doc_text, parts, chunks_by_page, chunk_pages = stream_chunks_to_atlas(
+            local_path,
             user_id=user_id,
             class_id=class_name,
             doc_id=doc_id,
             file_name=file_name,
+            page_range=page_range,
+            fingerprint=ckpt.fingerprint,
+            **resume_kwargs,
         )
     else:
         log.error(f"Unexpected file type after validation: {file_ext}")
-        return
+        return None
 
-    # ---------- generate section summaries (parallel, during ingestion) ----------
-    # Section summaries are generated here so they're available for fast query-time
-    # document summarization. This replaces the slow on-demand full-doc summarization.
-    section_summaries = []
-    if config.SECTION_SUMMARIES_ENABLED and chunks_by_page:
+    incomplete = set(chunks_by_page) - done_pages - durable_now
+    return chunks_by_page, chunk_pages, incomplete
+
+
+def retry_incomplete_pages(doc_id: str, incomplete: set[int]) -> None:
+    """
+    Fail the current RQ attempt when pages did not reach Mongo, so the retry
+    resumes them from the checkpoint. On the last attempt, log and carry on with
+    what was stored (the previous behaviour).
+    """
+    job = get_current_job()
+    if job is not None and (job.retries_left or 0) > 0:
+        raise RuntimeError(f"{len(incomplete)} pages of doc {doc_id} were not stored; retrying")
+    log.error("[INGEST] %d pages of doc %s failed to store and no retries remain", len(incomplete), doc_id)
+
+
+def finalize_document_ingest(
+    *,
+    user_id: str,
+    class_name: str,
+    doc_id: str,
+    file_name: str,
+    ckpt: IngestCheckpoint,
+    previous: dict[str, int | None],
+    chunk_pages: dict[str, int | None],
+    incomplete: set[int],
+):
+    """
+    Everything after the chunks are stored: incremental diff, section-summary and
+    document-summary jobs, and isProcessing=False.
+
+    Args:
+        previous: chunk_hash -> page of the version stored before this ingest
+        chunk_pages: chunk_hash -> page for every chunk of the new version
+        incomplete: Pages that failed to store (their old chunks are never treated as stale)
+    """
+    incremental = bool(previous)
+    if not incomplete:
+        ckpt.mark_stage(STAGE_CHUNKS_DURABLE)
+
+    # ---------- incremental diff: drop chunks that are no longer in the document ----------
+    changed_pages: set[int] = set()
+    if incremental:
+        stale = {h: p for h, p in previous.items() if h not in chunk_pages and p not in incomplete}
+        if stale:
+            collection.delete_many(
+                {"doc_id": doc_id, "is_summary": False, "chunk_hash": {"$in": list(stale)}}
+            )
+        added = {h: p for h, p in chunk_pages.items() if h not in previous}
+        changed_pages = {p for p in (set(added.values()) | set(stale.values())) if p is not None}
+        log.info(
+            "[INGEST] Incremental re-ingest doc %s: %d unchanged, %d new, %d removed, %d pages changed",
+            doc_id, len(chunk_pages) - len(added), len(added), len(stale), len(changed_pages),
+        )
+
+    # ---------- background summaries (the document is queryable without them) ----------
+    # Section summaries run as their own RQ job; the document summary job depends
+    # on it, since it combines the section summaries.
+    if ckpt.reached(STAGE_SUMMARY_ENQUEUED):
+        log.info("[CHECKPOINT] Summary jobs already enqueued for doc %s", doc_id)
+    elif incremental and not changed_pages:
+        log.info("[INGEST] No chunk changes for doc %s; keeping existing summaries", doc_id)
+    else:
+        section_job = None
+        if config.SECTION_SUMMARIES_ENABLED:
+            set_section_summary_status(doc_id, SECTION_STATUS_PENDING)
+            try:
+                from tasks import enqueue_section_summaries
+                section_job = enqueue_section_summaries(
+                    user_id=user_id,
+                    class_name=class_name,
+                    doc_id=doc_id,
+                    file_name=file_name,
+                    # On incremental re-ingest only sections touching changed pages are regenerated
+                    only_pages=sorted(changed_pages) if incremental else None,
+                )
+                log.info("[INGEST] Enqueued section summary job for doc %s", doc_id)
+            except Exception as e:
+                log.warning("[INGEST] Failed to enqueue section summaries for doc %s: %s", doc_id, e)
+                set_section_summary_status(doc_id, SECTION_STATUS_FAILED)
+        else:
+            set_section_summary_status(doc_id, SECTION_STATUS_SKIPPED)
         try:
-            section_summaries = generate_section_summaries_parallel(
-                chunks_by_page=chunks_by_page,
+            if incremental:
+                # The old document summary describes the previous version
+                collection.delete_many({"doc_id": doc_id, "is_summary": True, "source_type": "summary"})
+            from tasks import enqueue_summary
+            enqueue_summary(
                 user_id=user_id,
                 class_name=class_name,
                 doc_id=doc_id,
                 file_name=file_name,
+                depends_on=section_job,
             )
-            if section_summaries:
-                stored_count = store_section_summaries(section_summaries)
-                log.info(f"[INGEST] Stored {stored_count} section summaries for doc {doc_id}")
+            log.info("[INGEST] Enqueued background summary job for doc %s", doc_id)
+            ckpt.mark_stage(STAGE_SUMMARY_ENQUEUED)
         except Exception as e:
-            log.error(f"[INGEST] Failed to generate section summaries for doc {doc_id}: {e}", exc_info=True)
+            log.warning("[INGEST] Failed to enqueue summary job for doc %s: %s (will generate on-demand)", doc_id, e)
 
-    # ---------- enqueue background summary job (final document summary) ----------
-    # The background job will combine section summaries into a final document summary.
-    # This is much faster than summarizing all chunks from scratch.
-    try:
-        from tasks import enqueue_summary
-        enqueue_summary(
-            user_id=user_id,
-            class_name=class_name,
-            doc_id=doc_id,
-            file_name=file_name,
-        )
-        log.info("[INGEST] Enqueued background summary job for doc %s", doc_id)
-    except Exception as e:
-        log.warning("[INGEST] Failed to enqueue summary job for doc %s: %s (will generate on-demand)", doc_id, e)
-
-    # ---------- mark complete ----------
+    # ---------- mark queryable ----------
     try:
         main_collection.update_one(
             {"_id": ObjectId(doc_id)}, {"$set": {"isProcessing": False}}
@@ -963,8 +1360,135 @@ def load_document_data(user_id: str, class_name: str, s3_key: str, doc_id: str):
     except Exception as e:
         log.error("Error updating isProcessing for doc %s: %s", doc_id, e)
 
+    if incomplete:
+        # Keep the checkpoint (and re-open planning) so a re-run fills in the missing pages
+        ckpt.mark_stage(STAGE_STARTED)
+    else:
+        ckpt.clear()
     log.info("Ingest finished for doc %s", doc_id)
 
+
+# ──────────────────────────────────────────────────────────────
+# FAN-OUT INGEST (large PDFs across several RQ workers)
+# The page count is only known once the file is downloaded, so the first
+# ingest job plans the split; the web process never imports pymupdf.
+# ──────────────────────────────────────────────────────────────
+def fanout_page_count(local_path: str, file_ext: str) -> int:
+    """Page count if this document should be split into page-range sub-jobs, else 0."""
+    if file_ext != "pdf" or config.INGEST_FANOUT_MIN_PAGES <= 0:
+        return 0
+    doc = open_pdf(local_path)
+    try:
+        page_count = len(doc)
+    finally:
+        doc.close()
+    return page_count if page_count >= config.INGEST_FANOUT_MIN_PAGES else 0
+
+
+def fan_out_ingest(
+    *,
+    user_id: str,
+    class_name: str,
+    s3_key: str,
+    doc_id: str,
+    fingerprint: str,
+    page_count: int,
+):
+    """
+    Enqueue one ingest_page_range job per config.INGEST_FANOUT_PAGES_PER_JOB pages
+    plus a finalize_fanout_ingest job that runs once every range has finished.
+    """
+    ckpt, _ = open_ingest_checkpoint(doc_id, fingerprint)
+    if ckpt.reached(STAGE_FANNED_OUT):
+        log.info("[FANOUT] Doc %s was already fanned out; nothing to enqueue", doc_id)
+        return
+
+    ckpt.set_page_count(page_count)
+    per_job = max(1, config.INGEST_FANOUT_PAGES_PER_JOB)
+    ranges = [(first, min(first + per_job - 1, page_count)) for first in range(1, page_count + 1, per_job)]
+
+    from tasks import enqueue_ingest_fanout
+    fanin_job = enqueue_ingest_fanout(
+        user_id=user_id,
+        class_name=class_name,
+        s3_key=s3_key,
+        doc_id=doc_id,
+        fingerprint=fingerprint,
+        ranges=ranges,
+    )
+    ckpt.mark_stage(STAGE_FANNED_OUT)
+    log.info(
+        "[FANOUT] Doc %s: %d pages split into %d range jobs (fan-in job %s)",
+        doc_id, page_count, len(ranges), fanin_job.get_id(),
+    )
+
+
+def ingest_page_range(
+    user_id: str,
+    class_name: str,
+    s3_key: str,
+    doc_id: str,
+    fingerprint: str,
+    start_page: int,
+    end_page: int,
+):
+    """RQ sub-job: chunk, embed and store pages start_page..end_page (1-based, inclusive) of a PDF."""
+    ckpt = IngestCheckpoint(get_redis(), doc_id, fingerprint, create=False)
+    if not ckpt.resumed:
+        log.warning("[FANOUT] No checkpoint for doc %s; range %d-%d dropped", doc_id, start_page, end_page)
+        return
+
+    local_path = download_to_tempfile(s3_client, config.AWS_S3_BUCKET_NAME, s3_key)
+    if local_path is None:
+        log.warning("S3 file %s is empty", s3_key)
+        return
+    try:
+        log.info("[FANOUT] Doc %s: ingesting pages %d-%d", doc_id, start_page, end_page)
+        _, _, incomplete = ingest_document_chunks(
+            local_path,
+            user_id=user_id,
+            class_name=class_name,
+            s3_key=s3_key,
+            doc_id=doc_id,
+            file_ext="pdf",
+            ckpt=ckpt,
+            page_range=(start_page, end_page),
+        )
+    finally:
+        os.remove(local_path)
+    if incomplete:
+        retry_incomplete_pages(doc_id, incomplete)
+
+
+def finalize_fanout_ingest(
+    user_id: str,
+    class_name: str,
+    s3_key: str,
+    doc_id: str,
+    fingerprint: str,
+):
+    """RQ fan-in job: runs after every ingest_page_range job and completes the ingest."""
+    ckpt = IngestCheckpoint(get_redis(), doc_id, fingerprint, create=False)
+    if not ckpt.resumed:
+        # Another fan-in already completed and cleared the checkpoint
+        log.warning("[FANOUT] No checkpoint for doc %s; nothing to finalize", doc_id)
+        return
+
+    incomplete = set(range(1, ckpt.page_count + 1)) - ckpt.durable_pages()
+    if incomplete:
+        log.error("[FANOUT] %d of %d pages of doc %s were not stored", len(incomplete), ckpt.page_count, doc_id)
+
+    finalize_document_ingest(
+        user_id=user_id,
+        class_name=class_name,
+        doc_id=doc_id,
+        file_name=os.path.basename(s3_key),
+        ckpt=ckpt,
+        previous=ckpt.previous_chunks() if ckpt.incremental else {},
+        chunk_pages=ckpt.durable_chunks(),
+        incomplete=incomplete,
+    )
+
 # ---------------------------------------------------------------------
 # CLI for local testing
 # ---------------------------------------------------------------------
@@ -986,3 +1510,12 @@ try:
     )
 except Exception as e:
     log.warning("Index creation ignored: %s", e)
+try:
+    # Class-scoped raw-text lookup for cross-document duplicate reuse
+    collection.create_index(
+        [("class_id", 1), ("raw_hash", 1)],
+        partialFilterExpression={"raw_hash": {"$exists": True}},
+        name="class_rawhash",
+    )
+except Exception as e:
+    log.warning("Index creation ignored: %s", e)
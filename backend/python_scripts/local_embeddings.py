@@ -0,0 +1,130 @@
+# local_embeddings.py - CPU embedding backend (config.EMBEDDING_PROVIDER = "local")
+#
+# Runs a sentence-transformers model in-process, so embedding needs no network
+# round trip and no share of the OpenAI TPM budget, and the whole ingest
+# pipeline can run (and be benchmarked) offline. A request is cut into
+# LOCAL_EMBEDDING_BATCH_SIZE-input forward passes spread over a pool of
+# LOCAL_EMBEDDING_THREADS threads; torch / onnxruntime release the GIL during
+# inference, and intra-op threads are divided between the pool's workers so
+# concurrent batches do not oversubscribe the CPU.
+#
+# Vectors are L2-normalised (like OpenAI's). Inputs longer than the model's
+# max_seq_length are truncated by the model.
+#
+# Optional dependency: requirements-local-embeddings.txt (pulls torch); the
+# "onnx" / "openvino" backends also need sentence-transformers[onnx] / [openvino].
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import config
+from embedding_service import EmbeddingProvider
+from logger_setup import log
+
+
+class LocalEmbeddingService(EmbeddingProvider):
+    """
+    In-process sentence-transformers embedder.
+
+    Args:
+        model: Hugging Face model id or local path (default config.EMBEDDING_MODEL)
+        threads: Concurrent forward passes (default config.LOCAL_EMBEDDING_THREADS)
+        batch_size: Inputs per forward pass (default config.LOCAL_EMBEDDING_BATCH_SIZE)
+
+    Raises:
+        RuntimeError: If sentence-transformers is not installed
+        ValueError: If the model's width differs from config.EMBEDDING_DIMENSIONS
+    """
+
+    name = "local"
+    remote = False
+
+    def __init__(
+        self,
+        *,
+        model: str | None = None,
+        threads: int | None = None,
+        batch_size: int | None = None,
+    ):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError(
+                "EMBEDDING_PROVIDER=local requires sentence-transformers (pip install sentence-transformers)"
+            ) from e
+
+        self.model = model or config.EMBEDDING_MODEL
+        self.batch_size = batch_size or config.LOCAL_EMBEDDING_BATCH_SIZE
+        self._threads = max(1, threads or config.LOCAL_EMBEDDING_THREADS)
+
+        kwargs = {"device": "cpu"}
+        if config.LOCAL_EMBEDDING_BACKEND != "torch":
+            kwargs["backend"] = config.LOCAL_EMBEDDING_BACKEND
+        else:
+            self._limit_torch_threads()
+        self._model = SentenceTransformer(self.model, **kwargs)
+
+        self.dimensions = self._model.get_sentence_embedding_dimension()
+        if self.dimensions != config.EMBEDDING_DIMENSIONS:
+            raise ValueError(
+                f"{self.model} produces {self.dimensions}-d vectors but EMBEDDING_DIMENSIONS="
+                f"{config.EMBEDDING_DIMENSIONS}; set it to match (and index that width)"
+            )
+        self._pool = ThreadPoolExecutor(max_workers=self._threads, thread_name_prefix="local-embed")
+        log.info("[EMBED] Local service started (model=%s, dims=%d, backend=%s, threads=%d, batch=%d)",
+                 self.model, self.dimensions, config.LOCAL_EMBEDDING_BACKEND, self._threads, self.batch_size)
+
+    def _limit_torch_threads(self) -> None:
+        """Split the CPU's cores between the pool's concurrent forward passes."""
+        try:
+            import torch
+            torch.set_num_threads(max(1, (os.cpu_count() or 1) // self._threads))
+        except Exception as e:
+            log.warning("[EMBED] Could not set torch thread count: %s", e)
+
+    # ---------------- public API ----------------
+    def submit(self, texts: list[str]) -> Future:
+        """Schedule embedding of *texts*; returns a Future resolving to vectors in input order."""
+        texts = list(texts)
+        result: Future = Future()
+        if not texts:
+            result.set_result([])
+            return result
+
+        slices = [(i, texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        vectors: list = [None] * len(texts)
+        remaining = [len(slices)]
+        lock = threading.Lock()
+
+        def done(start: int, fut: Future) -> None:
+            exc = fut.exception()
+            with lock:
+                if result.done():   # an earlier slice already failed
+                    return
+                if exc is not None:
+                    result.set_exception(exc)
+                    return
+                batch = fut.result()
+                vectors[start:start + len(batch)] = batch
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    result.set_result(vectors)
+
+        for start, batch in slices:
+            self._pool.submit(self._encode, batch).add_done_callback(
+                lambda fut, start=start: done(start, fut)
+            )
+        return result
+
+    def _encode(self, batch: list[str]) -> list[list[float]]:
+        arr = self._model.encode(
+            batch,
+            batch_size=len(batch),
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return arr.astype("float32").tolist()
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
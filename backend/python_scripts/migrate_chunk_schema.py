@@ -0,0 +1,219 @@
+# migrate_chunk_schema.py - Rewrite legacy chunks in study_materials2 to the compact schema
+#
+# Legacy chunk:  embedding = array of doubles, text = header + chunk, original_text = chunk
+# Compact chunk: embedding = BSON float32 vector, text = chunk, ctx_header = bool,
+#                raw_hash = content hash of the chunk text
+# (see chunk_schema.py). Readers handle both layouts, so this can run against a
+# live collection, in any number of passes; already-compact chunks are skipped.
+# The Atlas vector index (config.VECTOR_INDEX) indexes both encodings of the
+# embedding path, so it does not need to be rebuilt.
+#
+# Only chunks are migrated (is_summary=False). Summaries are written through
+# LangChain's MongoDBAtlasVectorSearch and keep its array layout.
+#
+# --ann backfills the two-stage retrieval fields (embedding_ann, embedding_i8)
+# from each chunk's stored embedding for config.EMBEDDING_ANN_DIMENSIONS; no
+# embedding API calls are made. --print-index prints the Atlas definitions of
+# the full-vector index (for EMBEDDING_DIMENSIONS) and, if enabled, the ANN index.
+#
+# Usage:
+#   python migrate_chunk_schema.py --dry-run
+#   python migrate_chunk_schema.py [--doc_id ID] [--batch_size 500] [--limit N]
+#   EMBEDDING_ANN_DIMENSIONS=512 python migrate_chunk_schema.py --ann --print-index
+#   EMBEDDING_DIMENSIONS=384 VECTOR_INDEX=PlotSemanticSearchBgeSmall python migrate_chunk_schema.py --print-index --dry-run
+import argparse
+import json
+import time
+
+import bson
+from pymongo import MongoClient, UpdateOne
+
+import config
+from chunk_schema import (
+    ANN_PATH,
+    INT8_PATH,
+    ann_index_definition,
+    vector_index_definition,
+    ann_vector,
+    chunk_text,
+    content_hash,
+    header_for,
+    pack_int8,
+    pack_vector,
+    unpack_vector,
+)
+from logger_setup import log
+
+DB_NAME = "study_buddy_demo"
+COLLECTION_NAME = "study_materials2"
+
+LEGACY_FILTER = {
+    "is_summary": False,
+    "$or": [
+        {"original_text": {"$exists": True}},
+        {"embedding": {"$type": "array"}},
+        {"raw_hash": {"$exists": False}},
+    ],
+}
+
+
+def ann_filter(dims: int) -> dict:
+    """Chunks missing the two-stage fields (or with a different ANN width)."""
+    return {
+        "is_summary": False,
+        "embedding": {"$exists": True},
+        "$or": [
+            {ANN_PATH: {"$exists": False}},
+            {INT8_PATH: {"$exists": False}},
+            {"ann_dims": {"$ne": dims}},
+        ],
+    }
+
+
+def compact_update(doc: dict, ann_dims: int = 0) -> tuple[dict, dict, str]:
+    """
+    Build the $set / $unset for one legacy chunk (plus the two-stage fields when ann_dims > 0).
+
+    Returns:
+        (set_fields, unset_fields, text_outcome) where text_outcome is
+        "stripped" (header removed), "plain" (no header was stored),
+        "mismatch" (stored header differs from the rebuilt one; text left as is)
+        or "none" (no original_text field)
+    """
+    set_fields: dict = {}
+    unset_fields: dict = {}
+
+    emb = doc.get("embedding")
+    if isinstance(emb, list):
+        set_fields["embedding"] = pack_vector(emb)
+    if ann_dims > 0 and emb is not None and doc.get("ann_dims") != ann_dims:
+        full = unpack_vector(emb)
+        set_fields[ANN_PATH] = pack_vector(ann_vector(full, ann_dims))
+        set_fields[INT8_PATH] = pack_int8(full)
+        set_fields["ann_dims"] = ann_dims
+
+    if "raw_hash" not in doc:
+        # Cross-document duplicate key (text without the contextual header)
+        set_fields["raw_hash"] = content_hash(chunk_text(doc, with_header=False))
+
+    outcome = "none"
+    if "original_text" in doc:
+        text = doc.get("text") or ""
+        original = doc.get("original_text") or ""
+        if text == original:
+            outcome = "plain"
+            set_fields["ctx_header"] = False
+        elif text == header_for(doc) + original:
+            outcome = "stripped"
+            set_fields.update(text=original, ctx_header=True)
+        else:
+            # Header format changed since this chunk was written; rebuilding it
+            # would change what the LLM sees, so keep the stored text
+            outcome = "mismatch"
+        if outcome != "mismatch":
+            unset_fields["original_text"] = ""
+    return set_fields, unset_fields, outcome
+
+
+def migrate(collection, *, doc_id: str | None = None, batch_size: int = 500,
+            limit: int | None = None, dry_run: bool = False, ann_dims: int = 0) -> dict:
+    """
+    Migrate legacy chunks in batches of batch_size.
+
+    Args:
+        ann_dims: Also backfill embedding_ann / embedding_i8 at this width (0 = skip)
+
+    Returns:
+        Counters: scanned, updated, vectors_packed, ann_backfilled, text per outcome,
+        bytes_before, bytes_after
+    """
+    query = {"$or": [LEGACY_FILTER, ann_filter(ann_dims)]} if ann_dims > 0 else dict(LEGACY_FILTER)
+    if doc_id:
+        query["doc_id"] = doc_id
+    stats = {
+        "scanned": 0, "updated": 0, "vectors_packed": 0, "ann_backfilled": 0,
+        "stripped": 0, "plain": 0, "mismatch": 0, "none": 0,
+        "bytes_before": 0, "bytes_after": 0,
+    }
+    cursor = collection.find(query, batch_size=batch_size)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    ops: list[UpdateOne] = []
+    t0 = time.time()
+
+    def flush():
+        if ops and not dry_run:
+            collection.bulk_write(ops, ordered=False)
+        stats["updated"] += len(ops)
+        ops.clear()
+        log.info("[MIGRATE] %d scanned, %d updated (%.0fs)", stats["scanned"], stats["updated"], time.time() - t0)
+
+    for doc in cursor:
+        stats["scanned"] += 1
+        set_fields, unset_fields, outcome = compact_update(doc, ann_dims)
+        stats[outcome] += 1
+        if "embedding" in set_fields:
+            stats["vectors_packed"] += 1
+        if ANN_PATH in set_fields:
+            stats["ann_backfilled"] += 1
+        if not set_fields and not unset_fields:
+            continue
+
+        after = {k: v for k, v in doc.items() if k not in unset_fields}
+        after.update(set_fields)
+        stats["bytes_before"] += len(bson.encode(doc))
+        stats["bytes_after"] += len(bson.encode(after))
+
+        update = {}
+        if set_fields:
+            update["$set"] = set_fields
+        if unset_fields:
+            update["$unset"] = unset_fields
+        ops.append(UpdateOne({"_id": doc["_id"]}, update))
+        if len(ops) >= batch_size:
+            flush()
+    flush()
+    return stats
+
+
+# ---------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Migrate chunks to the compact schema")
+    ap.add_argument("--doc_id", help="Only migrate chunks of this document")
+    ap.add_argument("--batch_size", type=int, default=500)
+    ap.add_argument("--limit", type=int, help="Stop after this many legacy chunks")
+    ap.add_argument("--dry-run", action="store_true", help="Report savings without writing")
+    ap.add_argument("--ann", action="store_true",
+                    help="Backfill two-stage fields for EMBEDDING_ANN_DIMENSIONS")
+    ap.add_argument("--print-index", action="store_true",
+                    help="Print the Atlas definitions for the vector (and ANN) index")
+    args = ap.parse_args()
+
+    ann_dims = config.EMBEDDING_ANN_DIMENSIONS if args.ann else 0
+    if args.ann and ann_dims <= 0:
+        ap.error("--ann needs EMBEDDING_ANN_DIMENSIONS > 0")
+    if args.print_index:
+        print(f"# Atlas Vector Search index '{config.VECTOR_INDEX}' on {DB_NAME}.{COLLECTION_NAME}")
+        print(json.dumps(vector_index_definition(config.EMBEDDING_DIMENSIONS), indent=2))
+        dims = config.EMBEDDING_ANN_DIMENSIONS
+        if dims > 0:
+            print(f"# Atlas Vector Search index '{config.VECTOR_INDEX_ANN}' on {DB_NAME}.{COLLECTION_NAME}")
+            print(json.dumps(ann_index_definition(dims), indent=2))
+
+    client = MongoClient(config.MONGO_CONNECTION_STRING)
+    stats = migrate(
+        client[DB_NAME][COLLECTION_NAME],
+        doc_id=args.doc_id,
+        batch_size=args.batch_size,
+        limit=args.limit,
+        dry_run=args.dry_run,
+        ann_dims=ann_dims,
+    )
+    saved = stats["bytes_before"] - stats["bytes_after"]
+    pct = 100.0 * saved / stats["bytes_before"] if stats["bytes_before"] else 0.0
+    log.info("[MIGRATE] %s%s", "(dry run) " if args.dry_run else "", stats)
+    log.info("[MIGRATE] %.1f MB -> %.1f MB (%.0f%% smaller)",
+             stats["bytes_before"] / 1e6, stats["bytes_after"] / 1e6, pct)
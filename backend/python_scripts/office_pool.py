@@ -0,0 +1,328 @@
+# office_pool.py - Warm headless LibreOffice instances for DOCX -> PDF conversion
+#
+# Starting soffice costs several seconds per document, far more than the
+# conversion itself. The pool keeps OFFICE_POOL_SIZE unoserver processes running
+# (each owns one headless LibreOffice with its own user profile) and talks to
+# them over unoserver's XML-RPC socket, so a conversion is one local round trip.
+#
+# RQ forks a work horse per job, so nothing in-process survives between jobs.
+# Pool state therefore lives on the host, keyed by port, under OFFICE_POOL_DIR:
+#   {port}.lock     flock held while an instance converts; holds its conversion count
+#   {port}.pid      pid (and process group) of the instance's unoserver
+#   wait-{i}.lock   OFFICE_POOL_MAX_WAITING waiting slots (the bounded work queue)
+#   profile-{port}  LibreOffice user profile of the instance
+#
+# worker_boot.py warms every instance before the worker takes jobs; any caller
+# (work horse, CLI) starts or restarts an instance lazily while holding its lock.
+# An instance that times out, errors or reaches OFFICE_POOL_MAX_CONVERSIONS is
+# killed and restarted by the process that holds it.
+import fcntl
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import time
+import xmlrpc.client
+from contextlib import contextmanager
+from io import BytesIO
+
+import config
+from logger_setup import log
+
+_HOST = "127.0.0.1"
+_POLL_S = 0.2
+
+
+class OfficePoolUnavailable(Exception):
+    """The pool is disabled, unoserver is not installed, or an instance failed to start."""
+
+
+class OfficePoolBusy(Exception):
+    """Every instance and waiting slot is taken, or the queue wait timed out."""
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    """XML-RPC transport with a socket timeout (ServerProxy has none)."""
+
+    def __init__(self, timeout: float):
+        super().__init__()
+        self._timeout = timeout
+
+    def make_connection(self, host):
+        conn = super().make_connection(host)
+        conn.timeout = self._timeout
+        return conn
+
+
+def pool_enabled() -> bool:
+    return config.OFFICE_POOL_SIZE > 0 and shutil.which(config.OFFICE_POOL_COMMAND) is not None
+
+
+class OfficeInstance:
+    """One unoserver + LibreOffice pair, identified by its XML-RPC port."""
+
+    def __init__(self, index: int):
+        self.port = config.OFFICE_POOL_BASE_PORT + index
+        self.uno_port = config.OFFICE_POOL_BASE_PORT + 100 + index
+        self._dir = config.OFFICE_POOL_DIR
+        self.lock_path = os.path.join(self._dir, f"{self.port}.lock")
+        self.pid_path = os.path.join(self._dir, f"{self.port}.pid")
+        self.profile_dir = os.path.join(self._dir, f"profile-{self.port}")
+
+    # ---------------- process control ----------------
+    def listening(self) -> bool:
+        try:
+            with socket.create_connection((_HOST, self.port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def start(self) -> None:
+        """Spawn unoserver and wait until its XML-RPC port accepts connections."""
+        cmd = [
+            config.OFFICE_POOL_COMMAND,
+            "--interface", _HOST,
+            "--port", str(self.port),
+            "--uno-port", str(self.uno_port),
+            "--user-installation", f"file://{self.profile_dir}",
+        ]
+        # Own process group, so stop() also takes down the soffice child
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        with open(self.pid_path, "w") as f:
+            f.write(str(proc.pid))
+
+        deadline = time.monotonic() + config.OFFICE_POOL_STARTUP_TIMEOUT_S
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise OfficePoolUnavailable(f"unoserver on port {self.port} exited with code {proc.returncode}")
+            if self.listening():
+                log.info("[OFFICE-POOL] Instance on port %d ready (pid %d)", self.port, proc.pid)
+                return
+            time.sleep(_POLL_S)
+        self.stop()
+        raise OfficePoolUnavailable(
+            f"unoserver on port {self.port} not ready after {config.OFFICE_POOL_STARTUP_TIMEOUT_S}s"
+        )
+
+    def stop(self) -> None:
+        try:
+            with open(self.pid_path) as f:
+                pid = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            pid = 0
+        if pid:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            except OSError as e:
+                log.warning("[OFFICE-POOL] Could not stop instance on port %d: %s", self.port, e)
+        try:
+            os.remove(self.pid_path)
+        except OSError:
+            pass
+
+    def restart(self) -> None:
+        self.stop()
+        self.start()
+
+    # ---------------- conversion ----------------
+    def convert(self, path: str, timeout: float) -> bytes:
+        """Convert the file at *path* to PDF (unoserver reads it from the shared disk)."""
+        proxy = xmlrpc.client.ServerProxy(
+            f"http://{_HOST}:{self.port}",
+            transport=_TimeoutTransport(timeout),
+            allow_none=True,
+        )
+        # convert(inpath, indata, outpath, convert_to) -> PDF bytes when outpath is None
+        result = proxy.convert(path, None, None, "pdf")
+        return result.data if isinstance(result, xmlrpc.client.Binary) else bytes(result)
+
+
+def _try_lock(path: str):
+    """Open *path* and take a non-blocking exclusive flock; returns the file or None."""
+    f = open(path, "a+")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return f
+    except BlockingIOError:
+        f.close()
+        return None
+
+
+def _release(f) -> None:
+    try:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    finally:
+        f.close()
+
+
+def _read_count(f) -> int:
+    f.seek(0)
+    try:
+        return int(f.read().strip() or 0)
+    except ValueError:
+        return 0
+
+
+def _write_count(f, count: int) -> None:
+    f.seek(0)
+    f.truncate()
+    f.write(str(count))
+    f.flush()
+
+
+@contextmanager
+def _lease():
+    """
+    Hold one idle instance (and its lock file) for the duration of the block.
+
+    Raises:
+        OfficePoolBusy: All waiting slots are taken, or no instance freed up
+            within OFFICE_POOL_QUEUE_TIMEOUT_S
+    """
+    os.makedirs(config.OFFICE_POOL_DIR, exist_ok=True)
+    instances = [OfficeInstance(i) for i in range(config.OFFICE_POOL_SIZE)]
+
+    wait_slot = None
+    deadline = time.monotonic() + config.OFFICE_POOL_QUEUE_TIMEOUT_S
+    try:
+        while True:
+            for inst in instances:
+                held = _try_lock(inst.lock_path)
+                if held is not None:
+                    if wait_slot is not None:
+                        _release(wait_slot)
+                        wait_slot = None
+                    try:
+                        yield inst, held
+                    finally:
+                        _release(held)
+                    return
+
+            # Every instance is busy: queue in a waiting slot (bounded), then poll
+            if wait_slot is None:
+                for i in range(config.OFFICE_POOL_MAX_WAITING):
+                    wait_slot = _try_lock(os.path.join(config.OFFICE_POOL_DIR, f"wait-{i}.lock"))
+                    if wait_slot is not None:
+                        break
+                if wait_slot is None:
+                    raise OfficePoolBusy(f"{config.OFFICE_POOL_MAX_WAITING} conversions already waiting")
+            if time.monotonic() >= deadline:
+                raise OfficePoolBusy(f"no instance free after {config.OFFICE_POOL_QUEUE_TIMEOUT_S}s")
+            time.sleep(_POLL_S)
+    finally:
+        if wait_slot is not None:
+            _release(wait_slot)
+
+
+def convert_docx_to_pdf_pooled(path: str) -> BytesIO:
+    """
+    Convert a local DOCX file to PDF on a warm LibreOffice instance.
+
+    Args:
+        path: Local path of the DOCX file (readable by the pool, which runs on this host)
+
+    Returns:
+        BytesIO stream containing the generated PDF
+
+    Raises:
+        OfficePoolUnavailable: Pool disabled / not installed, or the instance could not start
+        OfficePoolBusy: No instance became free in time
+        Exception: If the conversion itself fails (the instance is restarted)
+    """
+    if not pool_enabled():
+        raise OfficePoolUnavailable(f"office pool disabled or '{config.OFFICE_POOL_COMMAND}' not found")
+
+    t_wait = time.perf_counter()
+    with _lease() as (inst, held):
+        waited_ms = int((time.perf_counter() - t_wait) * 1000)
+        count = _read_count(held)
+        restarted = False
+        if not inst.listening():
+            log.info("[OFFICE-POOL] Instance on port %d not running; starting it", inst.port)
+            inst.restart()
+            count, restarted = 0, True
+
+        t0 = time.perf_counter()
+        try:
+            pdf_data = inst.convert(os.path.abspath(path), config.OFFICE_POOL_CONVERT_TIMEOUT_S)
+        except xmlrpc.client.Fault as e:
+            # LibreOffice rejected this file; the instance itself is fine
+            log.error("[OFFICE-POOL] Conversion on port %d rejected: %s", inst.port, e.faultString)
+            raise
+        except (socket.timeout, TimeoutError, OSError, http.client.HTTPException, xmlrpc.client.Error) as e:
+            # Hung or crashed LibreOffice: restart it so the next lease gets a healthy one
+            log.error("[OFFICE-POOL] Conversion on port %d failed: %s; restarting instance", inst.port, e)
+            _write_count(held, 0)
+            try:
+                inst.restart()
+            except OfficePoolUnavailable as restart_err:
+                log.error("[OFFICE-POOL] Restart of port %d failed: %s", inst.port, restart_err)
+            raise
+        convert_ms = int((time.perf_counter() - t0) * 1000)
+
+        count += 1
+        if count >= config.OFFICE_POOL_MAX_CONVERSIONS:
+            # Recycle long-lived instances to bound LibreOffice memory growth
+            log.info("[OFFICE-POOL] Recycling instance on port %d after %d conversions", inst.port, count)
+            inst.restart()
+            count = 0
+        _write_count(held, count)
+
+    log.info("[METRICS] docx_convert %s", json.dumps({
+        "port": inst.port,
+        "wait_ms": waited_ms,
+        "convert_ms": convert_ms,
+        "pdf_bytes": len(pdf_data),
+        "cold_start": restarted,
+    }))
+    return BytesIO(pdf_data)
+
+
+def start_pool() -> int:
+    """
+    Start every instance that is not already running (worker boot).
+
+    Returns:
+        Number of instances listening afterwards
+    """
+    if not pool_enabled():
+        if config.OFFICE_POOL_SIZE > 0:
+            log.warning("[OFFICE-POOL] '%s' not found; DOCX conversion falls back to Cloudmersive",
+                        config.OFFICE_POOL_COMMAND)
+        return 0
+    os.makedirs(config.OFFICE_POOL_DIR, exist_ok=True)
+    ready = 0
+    for i in range(config.OFFICE_POOL_SIZE):
+        inst = OfficeInstance(i)
+        held = _try_lock(inst.lock_path)
+        if held is None:   # another process is converting on it, so it is running
+            ready += 1
+            continue
+        try:
+            if not inst.listening():
+                inst.restart()
+                _write_count(held, 0)
+            ready += 1
+        except OfficePoolUnavailable as e:
+            log.error("[OFFICE-POOL] %s", e)
+        finally:
+            _release(held)
+    log.info("[OFFICE-POOL] %d/%d instances ready", ready, config.OFFICE_POOL_SIZE)
+    return ready
+
+
+def stop_pool() -> None:
+    """Kill every instance (worker shutdown)."""
+    for i in range(config.OFFICE_POOL_SIZE):
+        OfficeInstance(i).stop()
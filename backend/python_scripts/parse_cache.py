@@ -0,0 +1,219 @@
+# parse_cache.py - Content-addressed cache of parsed documents for ingestion
+#
+# The same PDF (syllabus, slides, textbook) is often uploaded by many students of
+# a course. Entries are keyed by the SHA-256 of the PDF that is parsed, so every
+# later upload skips pymupdf extraction and splitting and goes straight to the
+# embedding stage, where the embedding cache and duplicate-chunk reuse make it
+# close to free. For a PDF upload that is the uploaded bytes (the ingest
+# checkpoint fingerprint). For a DOCX it is the converted PDF, deliberately not
+# the upload: the LibreOffice pool and Cloudmersive paginate differently, and
+# cached page numbers must match the PDF stored as pdfS3Key.
+#
+# An entry is one zlib-compressed JSON document:
+#   {"v", "extractor", "splitter", "title", "author", "page_count", "breaks",
+#    "pages":  {page_idx: markdown},
+#    "chunks": {page_idx: [[chunk_text, section_headers], ...]}}
+# Nothing document-specific (file name, user, class) is stored; contextual
+# headers and metadata are rebuilt for the uploading document. Markdown is kept
+# so a change of splitter only re-splits; a change of extractor is a miss.
+# Fanned-out range jobs store and look up their own page range.
+#
+# Backends: "disk" (per dyno, LRU by access time up to PARSE_CACHE_MAX_MB) and
+# "s3" (shared by all workers under PARSE_CACHE_S3_PREFIX; expire entries with
+# a bucket lifecycle rule on that prefix).
+import json
+import os
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+
+import config
+from logger_setup import log
+
+# Bump when extraction or splitting changes in a way that alters chunk text
+PARSE_CACHE_VERSION = 1
+
+
+def cache_key(fingerprint: str, page_range: tuple[int, int] | None = None) -> str:
+    """
+    Entry key for a parsed PDF, optionally for one page range. fingerprint is the
+    SHA-256 of the PDF's bytes (for a DOCX upload, of the converted PDF).
+    """
+    return fingerprint if page_range is None else f"{fingerprint}.p{page_range[0]}-{page_range[1]}"
+
+
+def _encode(entry: dict) -> bytes:
+    return zlib.compress(json.dumps(entry, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def _decode(blob: bytes) -> dict | None:
+    try:
+        entry = json.loads(zlib.decompress(blob).decode("utf-8"))
+    except (zlib.error, ValueError) as e:
+        log.warning("[PARSE-CACHE] Dropping unreadable entry: %s", e)
+        return None
+    return entry if entry.get("v") == PARSE_CACHE_VERSION else None
+
+
+class ParseCache(ABC):
+    """Interface: get/put of whole parsed-document entries."""
+
+    @abstractmethod
+    def get(self, key: str) -> dict | None:
+        """Return the entry for *key*, or None on a miss."""
+
+    @abstractmethod
+    def put(self, key: str, entry: dict) -> None:
+        """Store *entry* under *key* (the version field is added here)."""
+
+
+class DiskParseCache(ParseCache):
+    """One file per entry in a local directory; LRU by mtime (touched on hit)."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        os.makedirs(directory, exist_ok=True)
+        self._dir = directory
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._dir, f"{key}.json.z")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)   # mark as recently used
+        except OSError:
+            pass
+        return _decode(blob)
+
+    def put(self, key, entry):
+        blob = _encode({**entry, "v": PARSE_CACHE_VERSION})
+        if len(blob) > self._max_bytes:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, path)   # readers never see a partial entry
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        files = []
+        total = 0
+        with os.scandir(self._dir) as it:
+            for e in it:
+                if e.is_file() and e.name.endswith(".json.z"):
+                    st = e.stat()
+                    files.append((st.st_mtime, st.st_size, e.path))
+                    total += st.st_size
+        for _, size, path in sorted(files):
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class S3ParseCache(ParseCache):
+    """Entries as objects under <prefix><key>.json.z in the uploads bucket."""
+
+    def __init__(self, s3_client, bucket: str, prefix: str):
+        self._s3 = s3_client
+        self._bucket = bucket
+        self._prefix = prefix
+
+    def get(self, key):
+        try:
+            obj = self._s3.get_object(Bucket=self._bucket, Key=f"{self._prefix}{key}.json.z")
+        except self._s3.exceptions.NoSuchKey:
+            return None
+        return _decode(obj["Body"].read())
+
+    def put(self, key, entry):
+        self._s3.put_object(
+            Bucket=self._bucket,
+            Key=f"{self._prefix}{key}.json.z",
+            Body=_encode({**entry, "v": PARSE_CACHE_VERSION}),
+            ContentType="application/octet-stream",
+        )
+
+
+# ──────────────────────────────────────────────────────────────
+# FACTORY
+# ──────────────────────────────────────────────────────────────
+_cache: ParseCache | None = None
+_cache_init = False
+_cache_lock = threading.Lock()
+
+
+def get_parse_cache() -> ParseCache | None:
+    """
+    Return the configured cache (config.PARSE_CACHE_BACKEND), or None when
+    disabled or when the backend cannot be initialised.
+    """
+    global _cache, _cache_init
+    if _cache_init:
+        return _cache
+    with _cache_lock:
+        if _cache_init:
+            return _cache
+        backend = config.PARSE_CACHE_BACKEND
+        try:
+            if backend == "s3":
+                import boto3
+                s3 = boto3.client(
+                    "s3",
+                    aws_access_key_id=config.AWS_ACCESS_KEY,
+                    aws_secret_access_key=config.AWS_SECRET,
+                    region_name=config.AWS_REGION,
+                )
+                _cache = S3ParseCache(s3, config.AWS_S3_BUCKET_NAME, config.PARSE_CACHE_S3_PREFIX)
+            elif backend == "disk":
+                _cache = DiskParseCache(config.PARSE_CACHE_DIR, config.PARSE_CACHE_MAX_MB * 1024 * 1024)
+            else:
+                _cache = None
+            log.info("[PARSE-CACHE] backend=%s", backend if _cache else "off")
+        except Exception as e:
+            log.warning("[PARSE-CACHE] Failed to initialise %s backend, caching disabled: %s", backend, e)
+            _cache = None
+        _cache_init = True
+    return _cache
+
+
+def lookup(key: str) -> dict | None:
+    """Best-effort get: cache errors are logged and treated as a miss."""
+    cache = get_parse_cache()
+    if cache is None:
+        return None
+    t0 = time.perf_counter()
+    try:
+        entry = cache.get(key)
+    except Exception as e:
+        log.warning("[PARSE-CACHE] Lookup of %s failed: %s", key, e)
+        return None
+    if entry is not None:
+        log.info("[PARSE-CACHE] Hit %s (%d pages, %.0f ms)", key, len(entry.get("pages") or {}),
+                 (time.perf_counter() - t0) * 1000)
+    return entry
+
+
+def store(key: str, entry: dict) -> None:
+    """Best-effort put: cache errors never fail an ingest."""
+    cache = get_parse_cache()
+    if cache is None:
+        return
+    try:
+        cache.put(key, entry)
+        log.info("[PARSE-CACHE] Stored %s (%d pages)", key, len(entry.get("pages") or {}))
+    except Exception as e:
+        log.warning("[PARSE-CACHE] Store of %s failed: %s", key, e)
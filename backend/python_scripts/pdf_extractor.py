@@ -0,0 +1,167 @@
+# pdf_extractor.py - Process-pool page extraction for PDF ingestion
+#
+# pymupdf holds the GIL while rendering markdown and a single Document is not
+# safe to share across threads, so large PDFs are extracted by a pool of
+# processes. Each worker opens its own Document - from the file path when the
+# PDF is on disk, otherwise from a shared-memory copy of the bytes made once by
+# the parent - and renders contiguous page ranges. Results are yielded back in
+# page order.
+import math
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from typing import Iterator
+
+import pymupdf
+
+import config
+from ingest_metrics import flush as flush_metrics, span
+from logger_setup import log
+
+
+# ──────────────────────────────────────────────────────────────
+# WORKER SIDE (runs in child processes)
+# ──────────────────────────────────────────────────────────────
+_worker_doc = None
+
+
+def _init_worker_path(path: str) -> None:
+    """Open the PDF file once per worker process."""
+    global _worker_doc
+    _worker_doc = pymupdf.open(path)
+
+
+def _init_worker_shm(shm_name: str, size: int) -> None:
+    """Open the shared PDF bytes once per worker process."""
+    global _worker_doc
+    # Spawned workers share the parent's resource tracker; the parent alone unlinks
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    _worker_doc = pymupdf.open(stream=data, filetype="pdf")
+
+
+def _extract_range(start: int, end: int) -> list[str]:
+    """Return markdown for pages [start, end) of the worker's document."""
+    pages = []
+    for i in range(start, end):
+        with span("page_markdown"):
+            pages.append(_worker_doc.load_page(i).get_text("markdown"))
+    flush_metrics()   # pool processes exit without a final flush
+    return pages
+
+
+# ──────────────────────────────────────────────────────────────
+# PARENT SIDE
+# ──────────────────────────────────────────────────────────────
+def resolve_parser_workers(requested: int | None = None) -> int:
+    """
+    Resolve the number of parser processes.
+
+    Args:
+        requested: Explicit worker count; None falls back to config.INGEST_PARSER_WORKERS
+
+    Returns:
+        Worker count ≥ 1 (0 in config means one per CPU core)
+    """
+    workers = config.INGEST_PARSER_WORKERS if requested is None else requested
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return max(1, workers)
+
+
+def _page_ranges(pages: list[int], workers: int) -> list[tuple[int, int]]:
+    """
+    Split sorted page indices into contiguous [start, end) ranges.
+    Several ranges per worker keeps the pool balanced when some pages are heavy;
+    gaps (skipped pages) always start a new range.
+    """
+    per_task = max(1, math.ceil(len(pages) / (workers * 4)))
+    ranges: list[tuple[int, int]] = []
+    start = prev = None
+    for p in pages:
+        if start is not None and (p != prev + 1 or p - start >= per_task):
+            ranges.append((start, prev + 1))
+            start = None
+        if start is None:
+            start = p
+        prev = p
+    if start is not None:
+        ranges.append((start, prev + 1))
+    return ranges
+
+
+def open_pdf(source: bytes | str):
+    """Open a PDF from a file path or in-memory bytes."""
+    if isinstance(source, str):
+        return pymupdf.open(source)
+    return pymupdf.open(stream=source, filetype="pdf")
+
+
+def iter_page_markdown(
+    source: bytes | str,
+    page_count: int,
+    *,
+    workers: int,
+    skip_pages: set[int] | None = None,
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield (page_index, markdown) for every page, in page order.
+
+    Args:
+        source: PDF file path (preferred - workers read it directly) or PDF bytes
+        page_count: Number of pages in the document
+        workers: Parser processes to use
+        skip_pages: 0-based page indices not to render (e.g. already durable on resume)
+
+    Short documents or workers=1 are extracted in-process; otherwise pages are
+    rendered by a process pool.
+    """
+    pages = [i for i in range(page_count) if not skip_pages or i not in skip_pages]
+    if not pages:
+        return
+
+    if workers <= 1 or len(pages) < config.INGEST_PARSER_MIN_PAGES:
+        doc = open_pdf(source)
+        try:
+            for i in pages:
+                with span("page_markdown"):
+                    page_md = doc.load_page(i).get_text("markdown")
+                yield i, page_md
+        finally:
+            doc.close()
+        return
+
+    workers = min(workers, len(pages))
+    ranges = _page_ranges(pages, workers)
+    log.info("[PARSE] Extracting %d pages with %d processes (%d ranges)", len(pages), workers, len(ranges))
+
+    if isinstance(source, str):
+        yield from _pool_extract(ranges, workers, _init_worker_path, (source,))
+        return
+
+    shm = shared_memory.SharedMemory(create=True, size=len(source))
+    try:
+        shm.buf[:len(source)] = source
+        yield from _pool_extract(ranges, workers, _init_worker_shm, (shm.name, len(source)))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _pool_extract(ranges, workers, initializer, initargs) -> Iterator[tuple[int, str]]:
+    # spawn: children must not inherit the parent's Mongo/Redis sockets or threads
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    ) as pool:
+        pending = deque((start, pool.submit(_extract_range, start, end)) for start, end in ranges)
+        while pending:
+            start, fut = pending.popleft()
+            for offset, page_md in enumerate(fut.result()):
+                yield start + offset, page_md
@@ -0,0 +1,313 @@
+# rate_limiter.py - Atomic Redis token bucket for the shared OpenAI TPM budget
+#
+# One Lua script per reservation: refill based on elapsed server time, then take
+# the tokens if available, otherwise report how long until they will be. The
+# check and the take happen atomically inside Redis, so concurrent workers can
+# not over-commit, and every reservation is O(1) commands regardless of size.
+# Both the ingest workers (load_data, batch priority) and the web process
+# (semantic_search, interactive priority) share the same bucket key.
+import random
+import threading
+import time
+
+from logger_setup import log
+import config
+
+PRIORITY_INTERACTIVE = "interactive"   # chat / search requests a user is waiting on
+PRIORITY_BATCH = "batch"               # ingest, summaries and other background work
+
+# KEYS[1] = bucket hash {tokens, ts, ilast, iwait}, KEYS[2] = per-minute stats hash
+# ARGV[1] = capacity, ARGV[2] = refill tokens per second, ARGV[3] = tokens requested,
+# ARGV[4] = priority, ARGV[5] = tokens reserved for interactive,
+# ARGV[6] = ms without interactive demand before batch may borrow the reserve
+# Returns {granted (0|1), wait_ms, tokens_left}
+#
+# Interactive requests may drain the whole bucket. Batch requests must leave the
+# interactive reserve untouched unless interactive traffic has been idle, and are
+# refused outright while an interactive request is waiting (iwait), so waiting
+# chat users are served by the next refill ahead of any queued batch work.
+_TAKE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cap = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2]) / 1000.0
+local req = tonumber(ARGV[3])
+local priority = ARGV[4]
+local reserve = tonumber(ARGV[5])
+local idle_ms = tonumber(ARGV[6])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'ilast', 'iwait')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+local ilast = tonumber(state[3]) or 0
+local iwait = tonumber(state[4]) or 0
+if tokens == nil or ts == nil then
+  tokens = cap
+  ts = now
+end
+tokens = math.min(cap, tokens + math.max(0, now - ts) * rate)
+
+local granted = 0
+local wait_ms = 0
+if priority == 'interactive' then
+  ilast = now
+  if tokens >= req then
+    tokens = tokens - req
+    granted = 1
+  else
+    wait_ms = math.ceil((req - tokens) / rate)
+    -- Hold batch off until this waiter has had its chance at the refill
+    iwait = math.max(iwait, now + wait_ms + 250)
+  end
+else
+  local floor = reserve
+  if now - ilast > idle_ms then
+    floor = 0
+  end
+  if iwait > now then
+    wait_ms = iwait - now
+  elseif tokens - req >= floor then
+    tokens = tokens - req
+    granted = 1
+  else
+    wait_ms = math.ceil((req + floor - tokens) / rate)
+  end
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now, 'ilast', ilast, 'iwait', iwait)
+redis.call('PEXPIRE', KEYS[1], math.ceil(cap / rate) + 60000)
+
+if granted == 1 then
+  redis.call('HINCRBY', KEYS[2], priority .. ':tokens', req)
+  redis.call('HINCRBY', KEYS[2], priority .. ':granted', 1)
+else
+  redis.call('HINCRBY', KEYS[2], priority .. ':denied', 1)
+end
+redis.call('EXPIRE', KEYS[2], 180)
+return {granted, wait_ms, math.floor(tokens)}
+"""
+
+
+# KEYS[1] = bucket hash, KEYS[2] = per-minute stats hash
+# ARGV[1] = capacity, ARGV[2] = refill tokens per second, ARGV[3] = tokens to credit
+# (negative to debit), ARGV[4] = priority
+# Overspend can take the bucket below zero so later callers wait it off.
+_ADJUST_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cap = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2]) / 1000.0
+local delta = tonumber(ARGV[3])
+local priority = ARGV[4]
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+  tokens = cap
+  ts = now
+end
+tokens = math.min(cap, tokens + math.max(0, now - ts) * rate)
+tokens = math.max(-cap, math.min(cap, tokens + delta))
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(cap / rate) + 60000)
+redis.call('HINCRBY', KEYS[2], priority .. ':tokens', -delta)
+redis.call('HINCRBY', KEYS[2], priority .. ':refunded', delta)
+redis.call('EXPIRE', KEYS[2], 180)
+return math.floor(tokens)
+"""
+
+
+class TokenBucketLimiter:
+    """
+    Distributed token bucket with interactive / batch priority classes.
+
+    Args:
+        redis_client: Redis connection (see redis_setup.get_redis)
+        key: Bucket key shared by every process that spends this budget
+        capacity: Max tokens available at once (the per-minute limit)
+        refill_per_sec: Tokens added per second (capacity / 60 for a TPM limit)
+        interactive_share: Fraction of capacity batch work may not touch while
+            interactive traffic is active
+        interactive_idle_s: Seconds without interactive requests after which
+            batch work may borrow the interactive share
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        key: str,
+        *,
+        capacity: int,
+        refill_per_sec: float,
+        interactive_share: float = 0.0,
+        interactive_idle_s: float = 10.0,
+    ):
+        self._r = redis_client
+        self.key = key
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.reserve = int(capacity * min(max(interactive_share, 0.0), 0.9))
+        self.idle_ms = int(interactive_idle_s * 1000)
+        self._take = redis_client.register_script(_TAKE_LUA)
+        self._adjust = redis_client.register_script(_ADJUST_LUA)
+
+    def _stats_key(self, minute: int) -> str:
+        return f"{self.key}:stats:{minute}"
+
+    def _clamp(self, tokens: int, priority: str) -> int:
+        # A request larger than this class can ever hold would never succeed; cap it
+        ceiling = self.capacity if priority == PRIORITY_INTERACTIVE else self.capacity - self.reserve
+        return max(0, min(int(tokens), ceiling))
+
+    def try_acquire(self, tokens: int, priority: str = PRIORITY_BATCH) -> tuple[bool, float]:
+        """
+        Attempt one atomic reservation.
+
+        Returns:
+            (granted, wait_s) - wait_s is how long until the request could succeed
+        """
+        tokens = self._clamp(tokens, priority)
+        granted, wait_ms, _ = self._take(
+            keys=[self.key, self._stats_key(int(time.time() // 60))],
+            args=[self.capacity, self.refill_per_sec, tokens, priority, self.reserve, self.idle_ms],
+        )
+        return bool(granted), wait_ms / 1000.0
+
+    def acquire(
+        self,
+        tokens: int,
+        max_wait_s: float | None = None,
+        priority: str = PRIORITY_BATCH,
+    ) -> bool:
+        """
+        Block until *tokens* are reserved.
+        Sleeps for the refill time reported by Redis (plus jitter) rather than polling.
+
+        Returns:
+            True when reserved, False if max_wait_s elapsed first
+        """
+        deadline = None if max_wait_s is None else time.monotonic() + max_wait_s
+        while True:
+            ok, wait_s = self.try_acquire(tokens, priority)
+            if ok:
+                return True
+            # Jitter spreads out workers that were told the same refill time
+            sleep_s = wait_s + random.uniform(0.0, 0.05 + wait_s * 0.1)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or wait_s > remaining:
+                    return False
+                sleep_s = min(sleep_s, remaining)
+            time.sleep(sleep_s)
+
+    def reconcile(self, reserved: int, actual: int | None, priority: str = PRIORITY_BATCH) -> int:
+        """
+        Settle a reservation against the tokens the API actually billed.
+
+        Args:
+            reserved: Tokens passed to acquire() for this call
+            actual: Tokens reported by the response (usage / streamed count);
+                None leaves the reservation as charged
+            priority: Class the reservation was made under
+
+        Returns:
+            Tokens credited back (negative if the call overspent its estimate)
+        """
+        if actual is None:
+            return 0
+        delta = self._clamp(reserved, priority) - max(0, int(actual))
+        if delta == 0:
+            return 0
+        try:
+            self._adjust(
+                keys=[self.key, self._stats_key(int(time.time() // 60))],
+                args=[self.capacity, self.refill_per_sec, delta, priority],
+            )
+        except Exception as e:
+            # Never fail a request over bookkeeping; the bucket refills regardless
+            log.warning("[RATE-LIMIT] reconcile failed (%s): %s", delta, e)
+            return 0
+        return delta
+
+    def available(self, priority: str = PRIORITY_BATCH) -> int:
+        """
+        Tokens *priority* could take right now, without reserving them. Advisory
+        only (other workers may take them first); used to size concurrency.
+        """
+        pipe = self._r.pipeline()
+        pipe.hmget(self.key, "tokens", "ts", "ilast", "iwait")
+        pipe.time()
+        (tokens, ts, ilast, iwait), (sec, usec) = pipe.execute()
+        floor = 0
+        if tokens is None or ts is None:
+            tokens = float(self.capacity)
+        else:
+            now_ms = sec * 1000 + usec // 1000
+            tokens = min(self.capacity, float(tokens) + max(0, now_ms - float(ts)) * self.refill_per_sec / 1000.0)
+            if priority == PRIORITY_BATCH:
+                if float(iwait or 0) > now_ms:
+                    return 0   # an interactive request is waiting; batch is held off
+                if now_ms - float(ilast or 0) <= self.idle_ms:
+                    floor = self.reserve
+        return max(0, int(tokens - floor))
+
+    def utilization(self) -> dict:
+        """
+        Per-class usage over the current and previous minute.
+
+        Returns:
+            {class: {"tokens", "granted", "denied", "refunded", "share"}} where
+            tokens is net of refunds and share is the fraction of the bucket's
+            throughput that class consumed in the window
+        """
+        now = time.time()
+        minute = int(now // 60)
+        pipe = self._r.pipeline()
+        pipe.hgetall(self._stats_key(minute - 1))
+        pipe.hgetall(self._stats_key(minute))
+        prev, cur = pipe.execute()
+        window_min = 1.0 + (now % 60) / 60.0
+        budget = self.refill_per_sec * 60.0 * window_min
+
+        out = {}
+        for cls in (PRIORITY_INTERACTIVE, PRIORITY_BATCH):
+            row = {}
+            for field in ("tokens", "granted", "denied", "refunded"):
+                name = f"{cls}:{field}"
+                row[field] = sum(int(h.get(name) or h.get(name.encode()) or 0) for h in (prev, cur))
+            row["share"] = round(row["tokens"] / budget, 4) if budget else 0.0
+            out[cls] = row
+        return out
+
+
+# ──────────────────────────────────────────────────────────────
+# SHARED OPENAI TPM BUCKET
+# ──────────────────────────────────────────────────────────────
+TPM_BUCKET_KEY = "openai:tpm:bucket"
+
+_limiter: TokenBucketLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_tpm_limiter() -> TokenBucketLimiter:
+    """Process-wide limiter for the OpenAI tokens-per-minute budget."""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                from redis_setup import get_redis
+                _limiter = TokenBucketLimiter(
+                    get_redis(),
+                    TPM_BUCKET_KEY,
+                    capacity=config.OPENAI_TPM_LIMIT,
+                    refill_per_sec=config.OPENAI_TPM_LIMIT / 60.0,
+                    interactive_share=config.OPENAI_TPM_INTERACTIVE_SHARE,
+                    interactive_idle_s=config.OPENAI_TPM_INTERACTIVE_IDLE_S,
+                )
+                log.info(
+                    "[RATE-LIMIT] TPM bucket %s capacity=%d interactive_reserve=%d",
+                    TPM_BUCKET_KEY, config.OPENAI_TPM_LIMIT, _limiter.reserve,
+                )
+    return _limiter
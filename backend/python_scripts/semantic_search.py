@@ -5,13 +5,14 @@ import math
 import time
 import asyncio
 import traceback
+import numpy as np
 from pathlib import Path
 from typing import List, Tuple
 from urllib.parse import quote
 from json import dumps as _json_dumps
 from botocore.exceptions import ClientError
 from langchain.chains import create_history_aware_retriever
-from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.callbacks import AsyncCallbackHandler, BaseCallbackHandler
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import (
@@ -19,14 +20,20 @@ from langchain_core.prompts import (
     ChatPromptTemplate,
     MessagesPlaceholder,
 )
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from pymongo import MongoClient
 from bson import ObjectId
 
 import config
 from logger_setup import log
 from router import detect_route
-from redis_setup import get_redis
+from rate_limiter import PRIORITY_INTERACTIVE, get_tpm_limiter
+from token_counter import count_message_tokens, count_tokens, count_tokens_batch, truncate_to_tokens
+from chunk_schema import (
+    ANN_PATH, FULL_PATH, HEADER_FIELDS, INT8_PATH, LEGACY_EMBEDDING_MODEL,
+    WITHOUT_VECTORS, ann_vector, chunk_text, model_fields, unpack_vector,
+)
+from embedding_service import ServiceEmbeddings, get_embedding_service
 
 
 # ------------------------------------------------------------------
@@ -62,21 +69,14 @@ except ImportError:
 # ──────────────────────────────────────────────────────────────
 # Note: Environment variables are now loaded in semantic_service.py before any imports
 
-# TLS-aware Redis client; verifies by default
-r = get_redis()
-
-# Rate-limit configuration
-TPM_LIMIT = config.OPENAI_TPM_LIMIT
-TOK_PER_CHAR = 1 / 4  # heuristic for token estimation
-
 # MongoDB connection
 client = MongoClient(config.MONGO_CONNECTION_STRING)
 db_name = "study_buddy_demo"
 collection_name = "study_materials2"
 collection = client[db_name][collection_name]
 
-# OpenAI embedding model
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
+# Embedding model (config.EMBEDDING_PROVIDER); must match the model chunks were ingested with
+embedding_model = ServiceEmbeddings()   # LangChain adapter over embedding_service
 
 # ──────────────────────────────────────────────────────────────
 # FEATURE FLAG STARTUP LOGGING (P0/P1 - RAG Architecture v1.1)
@@ -148,7 +148,6 @@ backend_url = config.BACKEND_URL
 # Context-window guard-rails
 # ------------------------------------------------------------------
 MAX_PROMPT_TOKENS = config.MAX_PROMPT_TOKENS  # safe ceiling for context window
-est_tokens = lambda txt: int(len(txt) * TOK_PER_CHAR)  # heuristic token estimation
 
 # Keep defined for telemetry but do not gate by default
 SIMILARITY_THRESHOLD = config.SIMILARITY_THRESHOLD
@@ -208,39 +207,39 @@ def log_metrics(tag: str, data: dict):
         pass
 
 
-def _tpm_bucket_key() -> str:
-    return "openai:tpm:counter"
+def try_acquire_tokens(tokens_needed: int, max_wait_s: float = 10.0) -> bool:
+    """Reserve tokens from the shared TPM bucket, waiting at most max_wait_s."""
+    if tokens_needed <= 0:
+        return True
+    return get_tpm_limiter().acquire(tokens_needed, max_wait_s=max_wait_s, priority=PRIORITY_INTERACTIVE)
 
-def reserve_tokens(tokens_needed: int) -> tuple[bool, int]:
-    """Counter-based minute bucket using INCRBY + EXPIRE 70s.
-    Returns (ok, used_after).
-    """
-    key = _tpm_bucket_key()
-    pipe = r.pipeline()
-    pipe.incrby(key, tokens_needed)
-    pipe.expire(key, 70)
-    used_after, _ = pipe.execute()
-    if used_after <= TPM_LIMIT:
-        return True, used_after
-    try:
-        r.decrby(key, tokens_needed)
-    except Exception:
-        pass
-    return False, used_after
 
+def release_unused_tokens(reserved: int, actual: int | None) -> int:
+    """Credit the gap between a reservation and the tokens actually billed back to the bucket."""
+    return get_tpm_limiter().reconcile(reserved, actual, priority=PRIORITY_INTERACTIVE)
+
+
+def embedding_token_cost(texts: List[str]) -> int:
+    """Tokens to reserve for embedding *texts* (0 when the provider is local)."""
+    if not get_embedding_service().remote:
+        return 0
+    return sum(count_tokens_batch(texts, model=config.EMBEDDING_MODEL))
+
+
+def embed_texts_with_usage(texts: List[str]) -> Tuple[List[List[float]], int]:
+    """Embed texts with the query embedding model; returns (vectors, tokens billed)."""
+    return get_embedding_service().embed_with_usage(texts)
 
-def try_acquire_tokens(tokens_needed: int, max_wait_s: float = 10.0) -> bool:
-    waited = 0.0
-    ok, _ = reserve_tokens(tokens_needed)
-    if ok:
-        return True
-    while waited < max_wait_s:
-        time.sleep(0.5)
-        waited += 0.5
-        ok, _ = reserve_tokens(tokens_needed)
-        if ok:
-            return True
-    return False
+
+def usage_from_llm_result(response) -> int | None:
+    """Total tokens from an LLMResult's usage block, or None if the API did not report it."""
+    for gens in response.generations or []:
+        for gen in gens:
+            meta = getattr(getattr(gen, "message", None), "usage_metadata", None)
+            if meta:
+                return int(meta.get("total_tokens", 0))
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("total_tokens")
 
 
 
@@ -252,13 +251,50 @@ def create_embedding(text: str):
 
 
 def perform_semantic_search(query_vector, filters=None, *, limit: int = 12, numCandidates: int = 1000):
-    pipeline = [
+    """
+    Vector search over chunks, returning up to *limit* results ordered by score.
+
+    With config.EMBEDDING_ANN_DIMENSIONS set, the ANN stage runs on the reduced-dim
+    index and fetches VECTOR_RESCORE_OVERFETCH x limit candidates, which are then
+    rescored against their full int8 vectors (rescore_candidates).
+
+    Chunks with identical text in several documents (same raw_hash) are collapsed
+    to the best-scoring copy; a few extra results are fetched so they do not eat into k.
+    """
+    want = limit
+    limit = limit + max(2, limit // 2)
+    ann_dims = config.EMBEDDING_ANN_DIMENSIONS
+    if ann_dims <= 0:
+        results = list(collection.aggregate(
+            _vector_search_pipeline(config.VECTOR_INDEX, FULL_PATH, query_vector, filters, limit, numCandidates)
+        ))
+        return collapse_duplicates(results, want)
+
+    fetch = limit * max(1, config.VECTOR_RESCORE_OVERFETCH)
+    pipeline = _vector_search_pipeline(
+        config.VECTOR_INDEX_ANN,
+        ANN_PATH,
+        ann_vector(query_vector, ann_dims).tolist(),
+        filters,
+        fetch,
+        max(numCandidates, fetch),
+        extra_fields=(INT8_PATH,),
+    )
+    return collapse_duplicates(rescore_candidates(query_vector, list(collection.aggregate(pipeline)), limit), want)
+
+
+def _vector_search_pipeline(index, path, query_vector, filters, limit, num_candidates, extra_fields=()):
+    if config.EMBEDDING_MODEL != LEGACY_EMBEDDING_MODEL:
+        # Only compare against vectors of the same model (legacy chunks carry no embedding_model,
+        # so the default model searches unfiltered)
+        filters = {**(filters or {}), "embedding_model": config.EMBEDDING_MODEL}
+    return [
         {
             "$vectorSearch": {
-                "index": "PlotSemanticSearch",
-                "path": "embedding",
+                "index": index,
+                "path": path,
                 "queryVector": query_vector,
-                "numCandidates": numCandidates,
+                "numCandidates": num_candidates,
                 "limit": limit,
                 "filter": filters,
             }
@@ -267,18 +303,68 @@ def perform_semantic_search(query_vector, filters=None, *, limit: int = 12, numC
             "$project": {
                 "_id": 1,
                 "text": 1,
-                "file_name": 1,
                 "title": 1,
                 "author": 1,
-                "page_number": 1,
                 "chapter_idx": 1,
                 "doc_id": 1,
                 "is_summary": 1,
+                "raw_hash": 1,
+                **{f: 1 for f in HEADER_FIELDS},   # file_name, page_number, ... for chunk_text()
+                **{f: 1 for f in extra_fields},
                 "score": {"$meta": "vectorSearchScore"},
             }
         },
     ]
-    return collection.aggregate(pipeline)
+
+
+def collapse_duplicates(results: list[dict], limit: int) -> list[dict]:
+    """
+    Keep the first (best-scoring) result per raw_hash, up to *limit* results.
+    Each kept result lists the other documents holding the same text in dup_doc_ids.
+    """
+    kept: list[dict] = []
+    by_hash: dict[str, dict] = {}
+    for r in results:
+        raw_hash = r.get("raw_hash")
+        first = by_hash.get(raw_hash) if raw_hash else None
+        if first is not None:
+            if r.get("doc_id") != first.get("doc_id"):
+                first.setdefault("dup_doc_ids", []).append(r.get("doc_id"))
+            continue
+        if raw_hash:
+            by_hash[raw_hash] = r
+        kept.append(r)
+    if len(kept) < len(results):
+        log.info("[RETRIEVAL] collapsed %d duplicate chunks", len(results) - len(kept))
+    return kept[:limit]
+
+
+def rescore_candidates(query_vector, candidates: list[dict], limit: int) -> list[dict]:
+    """
+    Re-rank ANN candidates by cosine similarity between the full query vector and
+    each candidate's int8 full vector. The ANN score is kept as ann_score.
+    Candidates without a stored int8 vector keep their ANN score.
+    """
+    if not candidates:
+        return candidates
+    t0 = time.time()
+    q = np.asarray(query_vector, dtype=np.float32)
+    q = q / (float(np.linalg.norm(q)) or 1.0)
+    rows = [i for i, c in enumerate(candidates) if c.get(INT8_PATH) is not None]
+    if rows:
+        mat = np.stack([unpack_vector(candidates[i][INT8_PATH]) for i in rows])
+        norms = np.linalg.norm(mat, axis=1)
+        norms[norms == 0] = 1.0
+        sims = (mat @ q) / norms
+        for i, sim in zip(rows, sims):
+            candidates[i]["ann_score"] = candidates[i].get("score", 0.0)
+            candidates[i]["score"] = float(sim)
+    for c in candidates:
+        c.pop(INT8_PATH, None)
+    ranked = sorted(candidates, key=lambda c: c.get("score", 0.0), reverse=True)[:limit]
+    log.info("[RESCORE] %d ANN candidates -> %d (%d rescored) in %dms",
+             len(candidates), len(ranked), len(rows), int((time.time() - t0) * 1000))
+    return ranked
 
 
 def get_file_citation(search_results):
@@ -441,7 +527,7 @@ def generate_summary_on_demand(
 
             # Get file_name from first chunk if not provided
             if not file_name:
-                first_chunk = collection.find_one({"doc_id": doc_id, "is_summary": False})
+                first_chunk = collection.find_one({"doc_id": doc_id, "is_summary": False}, {"file_name": 1})
                 file_name = first_chunk.get("file_name", "Unknown Document") if first_chunk else "Unknown Document"
 
             log.info("[ON-DEMAND] Generated summary from sections for doc %s (%d chars)", doc_id, len(summary_text))
@@ -460,6 +546,7 @@ def generate_summary_on_demand(
                     "is_summary": True,
                     "page_number": None,
                     "source_type": "on_demand_sections",
+                    **model_fields(),
                 }
 
                 MongoDBAtlasVectorSearch.from_texts(
@@ -497,10 +584,10 @@ def generate_summary_on_demand(
         if not file_name and chunks:
             file_name = chunks[0].get("file_name", "Unknown Document")
 
-        # Combine chunk texts (prefer original_text without contextual header)
+        # Combine chunk texts (without contextual header)
         texts = []
         for chunk in chunks:
-            text = chunk.get("original_text") or chunk.get("text", "")
+            text = chunk_text(chunk, with_header=False)
             if text:
                 texts.append(text)
 
@@ -510,15 +597,14 @@ def generate_summary_on_demand(
 
         full_text = "\n\n".join(texts)
 
-        # Estimate tokens and truncate if needed
-        est_tokens_count = int(len(full_text) * TOK_PER_CHAR)
+        # Count tokens and truncate if needed
+        text_tokens = count_tokens(full_text)
         max_context = config.MAX_PROMPT_TOKENS * 3  # Allow more for summarization
 
-        if est_tokens_count > max_context:
+        if text_tokens > max_context:
             # Truncate to fit context window
-            max_chars = int(max_context / TOK_PER_CHAR)
-            full_text = full_text[:max_chars]
-            log.info("[ON-DEMAND] Truncated text from %d to %d chars", len(full_text), max_chars)
+            full_text = truncate_to_tokens(full_text, max_context)
+            log.info("[ON-DEMAND] Truncated text from %d to %d tokens", text_tokens, max_context)
 
         # Use provided LLM or create one
         if llm is None:
@@ -556,6 +642,7 @@ def generate_summary_on_demand(
                 "is_summary": True,
                 "page_number": None,
                 "source_type": "on_demand",
+                **model_fields(),
             }
 
             MongoDBAtlasVectorSearch.from_texts(
@@ -643,20 +730,21 @@ def fetch_chapter_text(
             "$project": {
                 "_id": 1,
                 "text": 1,
-                "page_number": 1,
                 "doc_id": 1,
                 "chapter_idx": 1,
+                **{f: 1 for f in HEADER_FIELDS},
             }
         },
     ]
     results = list(collection.aggregate(pipeline))
-    full_text = " ".join(r["text"] for r in results)
+    texts = [chunk_text(r) for r in results]
+    full_text = " ".join(texts)
 
     chunk_arr = [
         {
             "_id": str(r["_id"]),
             "chunkNumber": idx + 1,
-            "text": r["text"],
+            "text": texts[idx],
             "pageNumber": r.get("page_number"),
             "docId": r.get("doc_id"),
         }
@@ -837,7 +925,7 @@ def hierarchical_class_summary(
 
     for summary in summaries:
         text = summary.get("text", "")
-        tokens = est_tokens(text)
+        tokens = count_tokens(text)
 
         # Start new batch if adding this would exceed limit
         if current_tokens + tokens > max_tokens_per_batch and current_batch:
@@ -934,15 +1022,26 @@ def load_prompts():
         return json.load(f)
 
 
-def construct_chain(prompt_template, user_query, chat_history, llm: ChatOpenAI):
+def construct_chain(prompt_template, user_query, chat_history, llm: ChatOpenAI, callbacks=None):
     return (prompt_template | llm | StrOutputParser()).invoke(
-        {"chat_history": chat_history, "input": user_query}
+        {"chat_history": chat_history, "input": user_query},
+        config={"callbacks": callbacks} if callbacks else None,
     )
 
 
 # ──────────────────────────────────────────────────────────────
-#                   STREAMING CALLBACK HANDLER
+#                   USAGE / STREAMING CALLBACK HANDLERS
 # ──────────────────────────────────────────────────────────────
+class UsageCallback(BaseCallbackHandler):
+    """Captures billed tokens from a non-streaming LLM call for rate-limit reconciliation."""
+
+    def __init__(self):
+        self.total_tokens: int | None = None
+
+    def on_llm_end(self, response, **kwargs):
+        self.total_tokens = usage_from_llm_result(response)
+
+
 class TokenStreamingCallback(AsyncCallbackHandler):
     """
     LangChain async callback handler for token streaming.
@@ -951,6 +1050,7 @@ class TokenStreamingCallback(AsyncCallbackHandler):
 
     def __init__(self):
         self.queue = asyncio.Queue()
+        self.total_tokens: int | None = None   # from the final usage chunk (stream_usage=True)
 
     async def on_llm_new_token(self, token: str, **kwargs):
         """Called for each new token from OpenAI."""
@@ -958,6 +1058,7 @@ class TokenStreamingCallback(AsyncCallbackHandler):
 
     async def on_llm_end(self, response, **kwargs):
         """Called when LLM completes."""
+        self.total_tokens = usage_from_llm_result(response)
         await self.queue.put({"type": "done"})
 
     async def on_llm_error(self, error: Exception, **kwargs):
@@ -1041,12 +1142,12 @@ def process_semantic_search(
                 summary_doc = get_summary_with_fallback(user_id, class_name, doc_id)
                 if summary_doc:
                     context_txt = summary_doc["text"]
-                    if est_tokens(context_txt) > MAX_PROMPT_TOKENS:
+                    if count_tokens(context_txt) > MAX_PROMPT_TOKENS:
                         context_txt = condense_summary(context_txt, user_query, get_llm("summary"))
                     log.info(
                         "[PROC] Study-guide (doc) | summary_tokens=%d | will_condense=%s",
-                        est_tokens(context_txt),
-                        "YES" if est_tokens(context_txt) > MAX_PROMPT_TOKENS else "NO",
+                        count_tokens(context_txt),
+                        "YES" if count_tokens(context_txt) > MAX_PROMPT_TOKENS else "NO",
                     )
                     guide = generate_study_guide(context_txt, user_query, get_llm("generate_study_guide"))
 
@@ -1069,7 +1170,7 @@ def process_semantic_search(
                 docs = get_class_summaries_with_fallback(user_id, class_name)
                 if docs:
                     # Calculate total tokens across all document summaries
-                    combined_tokens = sum(est_tokens(d.get("text", "")) for d in docs)
+                    combined_tokens = sum(count_tokens_batch(d.get("text", "") for d in docs))
 
                     log.info(
                         "[PROC] Study-guide (class) | combined_tokens=%d | n_docs=%d",
@@ -1187,12 +1288,12 @@ def process_semantic_search(
                     obj_id = ObjectId(chunk_id_val) if isinstance(chunk_id_val, str) else chunk_id_val
                 except Exception:
                     obj_id = chunk_id_val
-                chunk_doc = collection.find_one({"_id": obj_id})
+                chunk_doc = collection.find_one({"_id": obj_id}, WITHOUT_VECTORS)
                 chunk_array.append(
                     {
                         "_id": str(obj_id),
                         "chunkNumber": ref.get("displayNumber"),
-                        "text": chunk_doc.get("text") if chunk_doc else None,
+                        "text": chunk_text(chunk_doc) if chunk_doc else None,
                         "pageNumber": ref.get("pageNumber"),
                         "docId": chunk_doc.get("doc_id") if chunk_doc else None,
                     }
@@ -1201,7 +1302,7 @@ def process_semantic_search(
 
     if mode not in ("follow_up", "doc_summary", "class_summary"):
         # 1) Embed the user query
-        tokens_needed = est_tokens(user_query_effective)
+        tokens_needed = embedding_token_cost([user_query_effective])
         embed_t0 = time.time()
         if not try_acquire_tokens(tokens_needed, max_wait_s=10.0):
             busy_msg = "System is busy processing other requests. Please retry in a few seconds."
@@ -1209,7 +1310,8 @@ def process_semantic_search(
             metrics.update({"status": "busy"})
             log_metrics("rag", metrics)
             return {"message": busy_msg, "status": "busy", "citation": [], "chats": chat_history, "chunks": [], "chunkReferences": []}
-        query_vec = embedding_model.embed_query(user_query_effective)
+        (query_vec,), used = embed_texts_with_usage([user_query_effective])
+        release_unused_tokens(tokens_needed, used)
         embed_ms = int((time.time() - embed_t0) * 1000)
 
         # 2) Build Mongo search filter to scope by user / class / doc
@@ -1248,10 +1350,11 @@ def process_semantic_search(
         mmr_ms = None
         try:
             mmr_start = time.time()
-            texts = [r.get("text", "") for r in similarity_results]
-            token_need = sum(est_tokens(t) for t in texts)
+            texts = [chunk_text(r) for r in similarity_results]
+            token_need = embedding_token_cost(texts)
             if texts and try_acquire_tokens(token_need, max_wait_s=2.0):
-                doc_embs = embedding_model.embed_documents(texts)
+                doc_embs, used = embed_texts_with_usage(texts)
+                release_unused_tokens(token_need, used)
                 # normalise
                 def _norm(v):
                     n = math.sqrt(sum(x*x for x in v)) or 1.0
@@ -1292,7 +1395,7 @@ def process_semantic_search(
                 {
                     "_id": str(r["_id"]),
                     "chunkNumber": idx + 1,
-                    "text": escape_curly_braces(r["text"]),
+                    "text": escape_curly_braces(chunk_text(r)),
                     "pageNumber": r.get("page_number"),
                     "docId": r.get("doc_id"),
                 }
@@ -1388,7 +1491,7 @@ def process_semantic_search(
                 mode = "specific"  # fall through to normal retrieval
             else:
                 # Calculate total tokens across all document summaries
-                combined_tokens = sum(est_tokens(d.get("text", "")) for d in docs)
+                combined_tokens = sum(count_tokens_batch(d.get("text", "") for d in docs))
 
                 log.info(
                     "[PROC] Class-summary | combined_tokens=%d | n_docs=%d",
@@ -1563,8 +1666,8 @@ def process_semantic_search(
 
 
     # ---------- RATE‑LIMIT RESERVATION ----------
-    prompt_tokens = est_tokens(formatted_prompt)
-    history_tokens = sum(est_tokens(m["content"]) for m in chat_history_cleaned)
+    prompt_tokens = count_tokens(formatted_prompt)
+    history_tokens = count_message_tokens(chat_history_cleaned)
     estimated_output = cfg.get("max_output_tokens", 700)
     total_needed = prompt_tokens + history_tokens + estimated_output
     if not try_acquire_tokens(total_needed, max_wait_s=10.0):
@@ -1581,12 +1684,15 @@ def process_semantic_search(
     try:
         log.info(f"[PROMPT] first 800 chars: {formatted_prompt[:800]!r}")
         gen_t0 = time.time()
+        usage_cb = UsageCallback()
         answer = construct_chain(
             prompt_template,
             user_query_effective if route == "quote_finding" else user_query,
             chat_history_cleaned,
             llm,
+            callbacks=[usage_cb],
         )
+        metrics["tokens_refunded"] = release_unused_tokens(total_needed, usage_cb.total_tokens)
 
         gen_ms = int((time.time() - gen_t0) * 1000)
         log.info(f"[ANSWER] len={len(answer)} | starts={answer[:80]!r} | latency_ms(generate={gen_ms})")
@@ -1852,7 +1958,7 @@ async def stream_semantic_search(
                         summary_doc = get_summary_with_fallback(user_id, class_name, doc_id)
                         if summary_doc:
                             context_txt = summary_doc["text"]
-                            if est_tokens(context_txt) > MAX_PROMPT_TOKENS:
+                            if count_tokens(context_txt) > MAX_PROMPT_TOKENS:
                                 context_txt = condense_summary(context_txt, user_query, get_llm("summary"))
                             guide = generate_study_guide(context_txt, user_query, get_llm("generate_study_guide"))
 
@@ -1871,7 +1977,7 @@ async def stream_semantic_search(
                         docs = get_class_summaries_with_fallback(user_id, class_name)
                         if docs:
                             # Calculate total tokens across all document summaries
-                            combined_tokens = sum(est_tokens(d.get("text", "")) for d in docs)
+                            combined_tokens = sum(count_tokens_batch(d.get("text", "") for d in docs))
 
                             log.info(
                                 "[STREAM] Study-guide (class) | combined_tokens=%d | n_docs=%d",
@@ -1954,7 +2060,7 @@ async def stream_semantic_search(
                         mode = "specific"
                     else:
                         # Calculate total tokens across all document summaries
-                        combined_tokens = sum(est_tokens(d.get("text", "")) for d in docs)
+                        combined_tokens = sum(count_tokens_batch(d.get("text", "") for d in docs))
 
                         log.info(
                             "[STREAM] Class-summary | combined_tokens=%d | n_docs=%d",
@@ -2021,11 +2127,11 @@ async def stream_semantic_search(
                             obj_id = ObjectId(chunk_id_val) if isinstance(chunk_id_val, str) else chunk_id_val
                         except Exception:
                             obj_id = chunk_id_val
-                        chunk_doc = collection.find_one({"_id": obj_id})
+                        chunk_doc = collection.find_one({"_id": obj_id}, WITHOUT_VECTORS)
                         chunk_array.append({
                             "_id": str(obj_id),
                             "chunkNumber": ref.get("displayNumber"),
-                            "text": chunk_doc.get("text") if chunk_doc else None,
+                            "text": chunk_text(chunk_doc) if chunk_doc else None,
                             "pageNumber": ref.get("pageNumber"),
                             "docId": chunk_doc.get("doc_id") if chunk_doc else None,
                         })
@@ -2034,14 +2140,15 @@ async def stream_semantic_search(
             # ── Vector Search (REUSE existing logic) ──
             if mode != "follow_up":
                 # 1) Token reservation for embedding
-                tokens_needed = est_tokens(user_query_effective)
+                tokens_needed = embedding_token_cost([user_query_effective])
                 if not try_acquire_tokens(tokens_needed, max_wait_s=10.0):
                     busy_msg = "System is busy processing other requests. Please retry in a few seconds."
                     yield f"data: {json.dumps({'type': 'error', 'message': busy_msg})}\n\n"
                     return
 
                 # 2) Embed query
-                query_vec = embedding_model.embed_query(user_query_effective)
+                (query_vec,), used = embed_texts_with_usage([user_query_effective])
+                release_unused_tokens(tokens_needed, used)
 
                 # 3) Build filters
                 filters = {"user_id": user_id, "is_summary": False}
@@ -2068,7 +2175,7 @@ async def stream_semantic_search(
                     chunk_array.append({
                         "_id": str(res["_id"]),
                         "chunkNumber": i + 1,
-                        "text": res.get("text", ""),
+                        "text": chunk_text(res),
                         "pageNumber": res.get("page_number"),
                         "docId": res.get("doc_id"),
                     })
@@ -2116,8 +2223,8 @@ async def stream_semantic_search(
             )
 
             # ── Token reservation for generation ──
-            prompt_tokens = est_tokens(filled_skeleton)
-            history_tokens = sum(est_tokens(m["content"]) for m in chat_history_cleaned)
+            prompt_tokens = count_tokens(filled_skeleton)
+            history_tokens = count_message_tokens(chat_history_cleaned)
             estimated_output = cfg.get("max_output_tokens", 700)
             total_needed = prompt_tokens + history_tokens + estimated_output
 
@@ -2136,6 +2243,7 @@ async def stream_semantic_search(
                 model=model_name,
                 temperature=cfg["temperature"],
                 streaming=True,
+                stream_usage=True,
                 callbacks=[callback]
             )
 
@@ -2209,7 +2317,13 @@ async def stream_semantic_search(
 
             # Wait for task completion
             await task
-            log.info(f"[STREAM] COMPLETE | answer_len={len(full_answer)}")
+
+            # Settle the reservation: billed usage if reported, else prompt estimate + streamed tokens
+            actual = callback.total_tokens
+            if actual is None:
+                actual = prompt_tokens + history_tokens + token_count
+            refunded = release_unused_tokens(total_needed, actual)
+            log.info(f"[STREAM] COMPLETE | answer_len={len(full_answer)} | tokens_used={actual} refunded={refunded}")
 
         except Exception as e:
             log.error(f"[STREAM] ERROR: {e}", exc_info=True)
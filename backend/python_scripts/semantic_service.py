@@ -12,7 +12,7 @@ elif Path('.env').exists():
     load_dotenv('.env')
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import uuid
@@ -20,7 +20,9 @@ import asyncio
 import json
 
 from semantic_search import process_semantic_search, stream_semantic_search
-from tasks import enqueue_ingest
+from tasks import enqueue_ingest, redis_conn
+from rate_limiter import get_tpm_limiter
+from ingest_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_prometheus
 from logger_setup import log
 
 app = FastAPI()
@@ -126,6 +128,29 @@ async def semantic_search_stream_endpoint(req: SearchRequest):
         source=req.source,
     )
 
+# ──────────────────────────────────────────────────────────────────────────
+# /api/v1/rate_limit
+#   ‣ Per-class (interactive / batch) usage of the shared OpenAI TPM bucket
+# ──────────────────────────────────────────────────────────────────────────
+@app.get("/api/v1/rate_limit")
+def rate_limit_utilization():
+    """Return interactive vs batch token usage over the last ~minute."""
+    limiter = get_tpm_limiter()
+    return {
+        "capacity": limiter.capacity,
+        "interactive_reserve": limiter.reserve,
+        "classes": limiter.utilization(),
+    }
+
+# ──────────────────────────────────────────────────────────────────────────
+# /metrics
+#   ‣ Fleet-wide ingest stage histograms (recorded by workers, see ingest_metrics.py)
+# ──────────────────────────────────────────────────────────────────────────
+@app.get("/metrics")
+def ingest_stage_metrics():
+    """Prometheus text exposition of the ingest stage histograms."""
+    return PlainTextResponse(render_prometheus(redis_conn), media_type=METRICS_CONTENT_TYPE)
+
 # ──────────────────────────────────────────────────────────────────────────
 # /api/v1/process_upload  (unchanged – still enqueues ingest job)
 # ──────────────────────────────────────────────────────────────────────────
@@ -4,13 +4,16 @@
 import json
 from bson import ObjectId
 from pymongo import MongoClient
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from langchain.prompts import PromptTemplate
 from langchain_mongodb import MongoDBAtlasVectorSearch
 
 import config
 from logger_setup import log
+from token_counter import count_tokens, count_tokens_batch
+from chunk_schema import chunk_text, model_fields
+from embedding_service import ServiceEmbeddings
 
 # ──────────────────────────────────────────────────────────────
 # CONSTANTS & CLIENTS
@@ -27,12 +30,10 @@ main_collection = client[MAIN_FILE_DB_NAME][MAIN_FILE_COLLECTION_NAME]
 
 # LLM and embedding models
 llm = ChatOpenAI(model=config.OPENAI_CHAT_MODEL, temperature=0)
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+embeddings = ServiceEmbeddings()   # config.EMBEDDING_PROVIDER
 
-# Token estimation
-TOK_PER_CHAR = 1 / 4
+# Token accounting (exact counts via token_counter)
 MAX_TOKENS_PER_REQUEST = 300_000
-est_tokens = lambda txt: int(len(txt) * TOK_PER_CHAR)
 
 
 # ──────────────────────────────────────────────────────────────
@@ -64,7 +65,7 @@ def safe_summarize(txt: str) -> str:
     Safely attempt to summarize text, returning empty string on failure.
     """
     try:
-        if est_tokens(txt) <= MAX_TOKENS_PER_REQUEST:
+        if count_tokens(txt) <= MAX_TOKENS_PER_REQUEST:
             return summarize_text(txt)
         return ""
     except Exception as e:
@@ -134,10 +135,10 @@ def fetch_document_chunks(user_id: str, doc_id: str) -> list[str]:
 
     results = list(collection.aggregate(pipeline))
 
-    # Prefer original_text (without contextual header) if available
+    # Chunk text without the contextual header
     texts = []
     for r in results:
-        text = r.get("original_text") or r.get("text", "")
+        text = chunk_text(r, with_header=False)
         if text:
             texts.append(text)
 
@@ -239,7 +240,7 @@ def generate_document_summary(
                      len(section_summaries), doc_id)
             summary_text = combine_section_summaries(section_summaries)
             method = "section_combine"
-            total_tokens = sum(est_tokens(s["text"]) for s in section_summaries)
+            total_tokens = sum(count_tokens_batch(s["text"] for s in section_summaries))
         else:
             # SLOW PATH: Fall back to chunk-based summarization
             log.info("[SUMMARY] No section summaries found for doc %s, using chunk-based summarization", doc_id)
@@ -257,9 +258,9 @@ def generate_document_summary(
 
             # Combine all chunks to estimate total size
             full_text = "\n\n".join(chunks)
-            total_tokens = est_tokens(full_text)
+            total_tokens = count_tokens(full_text)
 
-            log.info("[SUMMARY] Doc %s: %d chunks, ~%d tokens", doc_id, len(chunks), total_tokens)
+            log.info("[SUMMARY] Doc %s: %d chunks, %d tokens", doc_id, len(chunks), total_tokens)
 
             # Choose summarization strategy based on size
             if total_tokens <= MAX_TOKENS_PER_REQUEST:
@@ -290,6 +291,7 @@ def generate_document_summary(
             "is_summary": True,
             "page_number": None,
             "source_type": "summary",
+            **model_fields(),
         }
 
         MongoDBAtlasVectorSearch.from_texts(
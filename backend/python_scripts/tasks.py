@@ -1,5 +1,6 @@
 from redis_setup import get_redis
-from rq import Queue
+from rq import Queue, Retry
+from rq.job import Dependency
 from logger_setup import log
 
 # ------------------------------------------------------------------
@@ -38,6 +39,9 @@ def enqueue_ingest(
     """
     Enqueue a PDF-ingest job.
 
+    Failed attempts are retried; load_data checkpoints progress per doc_id, so a
+    retry resumes from the last durable page instead of starting over.
+
     Returns the RQ Job instance so callers can log / inspect if desired.
     """
     # Preflight: ensure Redis is reachable so we fail fast with clear logs
@@ -60,6 +64,61 @@ def enqueue_ingest(
         job_timeout=7200,   # seconds; keep in sync with default_timeout
         result_ttl=86400,   # keep result 1 day
         failure_ttl=604800, # keep failures 7 days for debugging
+        retry=Retry(max=2, interval=[60, 300]),   # resumes from the ingest checkpoint
+    )
+    return job
+
+
+def enqueue_ingest_fanout(
+    *,
+    user_id: str,
+    class_name: str,
+    s3_key: str,
+    doc_id: str,
+    fingerprint: str,
+    ranges: list[tuple[int, int]],
+):
+    """
+    Enqueue one page-range ingest job per (first, last) range, plus a fan-in job
+    that finalizes the document once every range job has finished (or failed).
+
+    Called from inside the first ingest job, which has already downloaded the
+    file and counted its pages.
+
+    Returns the fan-in RQ Job instance.
+    """
+    from load_data import finalize_fanout_ingest, ingest_page_range
+
+    range_jobs = [
+        ingest_q.enqueue(
+            ingest_page_range,
+            user_id=user_id,
+            class_name=class_name,
+            s3_key=s3_key,
+            doc_id=doc_id,
+            fingerprint=fingerprint,
+            start_page=first,
+            end_page=last,
+            job_timeout=7200,
+            result_ttl=86400,
+            failure_ttl=604800,
+            retry=Retry(max=2, interval=[60, 300]),
+        )
+        for first, last in ranges
+    ]
+    # allow_failure: a range that exhausted its retries must not strand the doc
+    # in isProcessing; the fan-in finalizes what was stored
+    job = ingest_q.enqueue(
+        finalize_fanout_ingest,
+        user_id=user_id,
+        class_name=class_name,
+        s3_key=s3_key,
+        doc_id=doc_id,
+        fingerprint=fingerprint,
+        depends_on=Dependency(jobs=range_jobs, allow_failure=True),
+        job_timeout=7200,
+        result_ttl=86400,
+        failure_ttl=604800,
     )
     return job
 
@@ -73,6 +132,7 @@ def enqueue_summary(
     class_name: str,
     doc_id: str,
     file_name: str,
+    depends_on=None,
 ):
     """
     Enqueue a background summarization job.
@@ -81,6 +141,9 @@ def enqueue_summary(
     to be available for querying immediately after chunking/embedding.
     Summaries are generated in the background and cached for future use.
 
+    depends_on: optional section-summary job to wait for; the summary still
+    runs if that job fails (it falls back to summarizing chunks).
+
     Returns the RQ Job instance.
     """
     try:
@@ -101,5 +164,43 @@ def enqueue_summary(
         job_timeout=1800,    # 30 minutes max
         result_ttl=86400,    # keep result 1 day
         failure_ttl=604800,  # keep failures 7 days
+        depends_on=Dependency(jobs=[depends_on], allow_failure=True) if depends_on is not None else None,
+    )
+    return job
+
+
+# ------------------------------------------------------------------
+# 5. Helper to enqueue section summaries
+# ------------------------------------------------------------------
+def enqueue_section_summaries(
+    *,
+    user_id: str,
+    class_name: str,
+    doc_id: str,
+    file_name: str,
+    only_pages: list[int] | None = None,
+):
+    """
+    Enqueue section-summary generation for a document whose chunks are stored.
+
+    Called from the ingest job once the document is queryable, so users are not
+    kept waiting on these LLM calls. Progress is tracked in the document's
+    sectionSummaryStatus.
+
+    Returns the RQ Job instance.
+    """
+    from load_data import summarize_document_sections
+
+    job = summary_q.enqueue(
+        summarize_document_sections,
+        user_id=user_id,
+        class_name=class_name,
+        doc_id=doc_id,
+        file_name=file_name,
+        only_pages=only_pages,
+        job_timeout=1800,
+        result_ttl=86400,
+        failure_ttl=604800,
+        retry=Retry(max=2, interval=[30, 120]),
     )
     return job
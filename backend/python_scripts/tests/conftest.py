@@ -0,0 +1,15 @@
+import os
+import sys
+
+# config.py validates these at import; tests never reach the real services
+for key, value in {
+    "MONGO_CONNECTION_STRING": "mongodb://localhost:27017",
+    "OPENAI_API_KEY": "sk-test",
+    "AWS_ACCESS_KEY": "test",
+    "AWS_SECRET": "test",
+    "AWS_REGION": "us-east-1",
+    "AWS_S3_BUCKET_NAME": "test-bucket",
+}.items():
+    os.environ.setdefault(key, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
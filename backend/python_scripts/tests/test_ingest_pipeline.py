@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+import ingest_pipeline
+from ingest_pipeline import IngestPipeline
+
+
+class _Collection:
+    def __init__(self):
+        self.docs = []
+
+    def insert_many(self, docs, ordered=False):
+        self.docs.extend(docs)
+
+
+def _embed(texts, max_tokens=None):
+    return [[1.0, 0.0] for _ in texts]
+
+
+def _run_producer(pipeline, chunks: int) -> dict:
+    """Feed *chunks* chunks and close, on a thread; returns {'metrics' | 'error': ...}."""
+    outcome = {}
+
+    def produce():
+        try:
+            for i in range(chunks):
+                pipeline.put(f"chunk {i}", {"page_number": i // 10 + 1})
+                if i % 10 == 9:
+                    pipeline.end_page(i // 10 + 1)
+        except Exception as e:
+            outcome["put_error"] = e
+        try:
+            outcome["metrics"] = pipeline.close()
+        except Exception as e:
+            outcome["error"] = e
+
+    t = threading.Thread(target=produce, daemon=True)
+    t.start()
+    t.join(timeout=10)
+    assert not t.is_alive(), "producer blocked on a dead pipeline stage"
+    return outcome
+
+
+def test_pipeline_writes_every_chunk(monkeypatch):
+    monkeypatch.setattr(ingest_pipeline, "count_tokens", lambda text, model=None: len(text.split()))
+    collection = _Collection()
+    pipeline = IngestPipeline(embed_fn=_embed, collection=collection, batch_tokens=50, queue_depth=1)
+
+    outcome = _run_producer(pipeline, 100)
+
+    assert outcome["metrics"]["chunks_inserted"] == 100
+    assert outcome["metrics"]["pages_durable"] == 10
+    assert len(collection.docs) == 100
+
+
+def test_pack_failure_reaches_producer_promptly(monkeypatch):
+    calls = {"n": 0}
+
+    def flaky_count(text, model=None):
+        calls["n"] += 1
+        if calls["n"] == 5:
+            raise ValueError("encoder unavailable")
+        return len(text.split())
+
+    monkeypatch.setattr(ingest_pipeline, "count_tokens", flaky_count)
+    # queue_depth=1 keeps the pack queue small, so a dead pack stage would block put()
+    pipeline = IngestPipeline(embed_fn=_embed, collection=_Collection(), batch_tokens=50, queue_depth=1)
+
+    outcome = _run_producer(pipeline, 2000)
+
+    assert isinstance(outcome.get("error"), RuntimeError)
+    assert isinstance(outcome["error"].__cause__, ValueError)
+    with pytest.raises(RuntimeError):
+        pipeline.put("late chunk", {"page_number": 1})
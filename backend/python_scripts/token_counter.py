@@ -0,0 +1,139 @@
+# token_counter.py - Exact OpenAI token counts via tiktoken
+#
+# Replaces the len(text) / 4 heuristic used for rate-limit reservations and
+# context-window guards. That heuristic under-counts LaTeX, code and non-English
+# course material badly. Encoders are loaded once per model, and counts for
+# repeated strings (system prompts, section summaries, chat history) are served
+# from a bounded LRU.
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+import tiktoken
+
+import config
+from logger_setup import log
+
+_FALLBACK_ENCODING = "o200k_base"   # gpt-4o family; used for models tiktoken does not know
+_CACHE_SIZE = 4096
+_CACHE_MAX_CHARS = 64_000           # whole documents are counted but not cached
+
+# Per-message framing tokens in the chat format (role + separators), and reply priming
+_TOKENS_PER_MESSAGE = 4
+_TOKENS_PER_REPLY = 3
+
+
+# ──────────────────────────────────────────────────────────────
+# ENCODER REGISTRY
+# ──────────────────────────────────────────────────────────────
+_encoders: dict[str, tiktoken.Encoding] = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(model: str | None = None) -> tiktoken.Encoding:
+    """
+    Return the tiktoken encoding for *model*, loading it once per process.
+
+    Args:
+        model: OpenAI model name (default config.OPENAI_CHAT_MODEL)
+    """
+    model = model or config.OPENAI_CHAT_MODEL
+    enc = _encoders.get(model)
+    if enc is None:
+        with _encoders_lock:
+            enc = _encoders.get(model)
+            if enc is None:
+                try:
+                    enc = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    log.warning("[TOKENS] No tiktoken mapping for %s; using %s", model, _FALLBACK_ENCODING)
+                    enc = tiktoken.get_encoding(_FALLBACK_ENCODING)
+                _encoders[model] = enc
+    return enc
+
+
+# ──────────────────────────────────────────────────────────────
+# COUNT CACHE (keyed by encoding name + exact text)
+# ──────────────────────────────────────────────────────────────
+_cache: "OrderedDict[tuple[str, str], int]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_get(key: tuple[str, str]) -> int | None:
+    with _cache_lock:
+        n = _cache.get(key)
+        if n is not None:
+            _cache.move_to_end(key)
+        return n
+
+
+def _cache_put(key: tuple[str, str], n: int) -> None:
+    if len(key[1]) > _CACHE_MAX_CHARS:
+        return
+    with _cache_lock:
+        _cache[key] = n
+        _cache.move_to_end(key)
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+# ──────────────────────────────────────────────────────────────
+# PUBLIC API
+# ──────────────────────────────────────────────────────────────
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Exact token count of *text* for *model* (special tokens counted as plain text)."""
+    if not text:
+        return 0
+    enc = get_encoder(model)
+    key = (enc.name, text)
+    n = _cache_get(key)
+    if n is None:
+        n = len(enc.encode_ordinary(text))
+        _cache_put(key, n)
+    return n
+
+
+def count_tokens_batch(texts: Iterable[str], model: str | None = None) -> list[int]:
+    """
+    Token counts for many texts; cache misses are encoded in one threaded batch.
+
+    Returns:
+        Counts in input order
+    """
+    texts = list(texts)
+    enc = get_encoder(model)
+    counts = [0] * len(texts)
+    missing: list[int] = []
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        n = _cache_get((enc.name, text))
+        if n is None:
+            missing.append(i)
+        else:
+            counts[i] = n
+
+    if missing:
+        encoded = enc.encode_ordinary_batch([texts[i] for i in missing])
+        for i, toks in zip(missing, encoded):
+            counts[i] = len(toks)
+            _cache_put((enc.name, texts[i]), len(toks))
+    return counts
+
+
+def count_message_tokens(messages: Iterable[dict], model: str | None = None) -> int:
+    """Tokens for a list of {"role", "content"} chat messages, including per-message framing."""
+    messages = list(messages)
+    if not messages:
+        return 0
+    contents = count_tokens_batch((m.get("content") or "" for m in messages), model)
+    return sum(contents) + _TOKENS_PER_MESSAGE * len(messages) + _TOKENS_PER_REPLY
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str | None = None) -> str:
+    """Return the longest prefix of *text* that fits in *max_tokens*."""
+    enc = get_encoder(model)
+    toks = enc.encode_ordinary(text)
+    if len(toks) <= max_tokens:
+        return text
+    return enc.decode(toks[:max_tokens])
@@ -1,9 +1,22 @@
 import os
 from rq import Worker, Queue, Connection
+import config
+from ingest_metrics import flush as flush_metrics, serve_metrics, start_pushing
 from logger_setup import log
+from office_pool import start_pool, stop_pool
 from redis_setup import get_redis
 
 
+class MetricsWorker(Worker):
+    """Worker whose work horses flush their stage histograms before exiting."""
+
+    def perform_job(self, job, queue):
+        try:
+            return super().perform_job(job, queue)
+        finally:
+            flush_metrics()
+
+
 def main():
     conn = get_redis()
 
@@ -19,10 +32,21 @@ def main():
 
     log.info("[RQ] Worker starting with queues: %s (priority order)", queue_names)
 
-    with Connection(conn):
-        worker = Worker(queues)
-        log.info("[RQ] Worker ready with TLS-verifying Redis connection")
-        worker.work(with_scheduler=True)
+    # Warm LibreOffice before taking jobs; work horses lease instances by port
+    start_pool()
+
+    if config.INGEST_METRICS_ENABLED and config.INGEST_METRICS_PORT:
+        serve_metrics(config.INGEST_METRICS_PORT)
+    if config.INGEST_METRICS_ENABLED and config.INGEST_METRICS_PUSHGATEWAY:
+        start_pushing(config.INGEST_METRICS_PUSHGATEWAY, config.INGEST_METRICS_PUSH_INTERVAL_S)
+
+    try:
+        with Connection(conn):
+            worker = MetricsWorker(queues)
+            log.info("[RQ] Worker ready with TLS-verifying Redis connection")
+            worker.work(with_scheduler=True)
+    finally:
+        stop_pool()
 
 
 if __name__ == "__main__":
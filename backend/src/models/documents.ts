@@ -14,6 +14,8 @@ export interface IDocument extends Document {
   isProcessing?: boolean;
   // NEW: optional pdfS3Key for DOCX files converted to PDF for viewing
   pdfS3Key?: string;
+  // Background section summaries; set by the Python worker once the doc is queryable
+  sectionSummaryStatus?: "pending" | "running" | "done" | "failed" | "skipped";
 }
 
 const documentSchema = new Schema<IDocument>({
@@ -56,6 +58,12 @@ const documentSchema = new Schema<IDocument>({
     type: String,
     required: false,
   },
+  // Background section summaries (isProcessing flips before these finish)
+  sectionSummaryStatus: {
+    type: String,
+    enum: ["pending", "running", "done", "failed", "skipped"],
+    required: false,
+  },
 });
 
 export default mongoose.model<IDocument>("Document", documentSchema);